@@ -0,0 +1,202 @@
+"""
+Load test della parte di trasporto con molte stampanti.
+
+Avvia in un processo separato N finte Ghost5 (server WebSocket su
+127.0.0.<i>:<porta>, che rispondono ai comandi di polling e inviano una riga
+temperature al secondo) e nel processo principale N PrinterConnection +
+MessageRouter guidati da un solo PollScheduler, come fa PrinterHub.
+Per ogni N stampa task asyncio, CPU e RSS del processo client: con un
+costo per stampante costante la CPU per stampante resta piatta e i task
+crescono di uno per stampante.
+
+Richiede aiohttp e Linux (indirizzi 127.0.0.x sul loopback).
+
+Uso:
+    python benchmarks/bench_farm.py [--printers 1,5,10,20,40] [--duration 10] [--port 18081]
+"""
+
+import argparse
+import asyncio
+import importlib.util
+import multiprocessing
+import os
+import resource
+import sys
+import time
+
+from aiohttp import ClientSession, WSMsgType, web
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PACKAGE = os.path.join(ROOT, "custom_components", "haghost5")
+
+POLL_COMMANDS = "M27\nM992\nM994\nM991\nM997\n"
+REPLIES = {
+    "M27": "M27 42",
+    "M992": "M992 00:46:49",
+    "M994": "M994 1:/benchy.gcode;1234567",
+    "M991": "ok",
+    "M997": "M997 PRINTING",
+}
+TEMPERATURE = "T:199.4 /200 B:60.1 /60 T0:199.4 /200 T1:0 /0 @:87 B@:12"
+
+
+def load_module(name):
+    """Importa un modulo del pacchetto senza passare da __init__ (che richiede Home Assistant)."""
+    spec = importlib.util.spec_from_file_location(f"haghost5_{name}", os.path.join(PACKAGE, f"{name}.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def host(i):
+    return f"127.0.0.{i + 1}"
+
+
+# --- finte stampanti (processo separato) ---
+
+async def _fake_printer(request):
+    ws = web.WebSocketResponse()
+    await ws.prepare(request)
+
+    async def temperatures():
+        while True:
+            await asyncio.sleep(1)
+            await ws.send_str(TEMPERATURE)
+
+    streamer = asyncio.create_task(temperatures())
+    try:
+        async for msg in ws:
+            if msg.type != WSMsgType.TEXT:
+                break
+            for command in msg.data.split("\n"):
+                reply = REPLIES.get(command.strip())
+                if reply:
+                    await ws.send_str(reply)
+    finally:
+        streamer.cancel()
+    return ws
+
+
+def _serve(count, port, ready):
+    async def main():
+        app = web.Application()
+        app.router.add_get("/", _fake_printer)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        for i in range(count):
+            await web.TCPSite(runner, host(i), port).start()
+        ready.set()
+        await asyncio.Event().wait()
+
+    asyncio.run(main())
+
+
+# --- client (processo principale) ---
+
+class FarmPrinter:
+    """Quello che PrinterHub mette insieme per una stampante, senza Home Assistant."""
+
+    def __init__(self, connection_module, router_module, ip_address, session):
+        self.ip_address = ip_address
+        self.router = router_module.MessageRouter()
+        self.records = 0
+        for record_type in (
+            router_module.StatusRecord,
+            router_module.ProgressRecord,
+            router_module.FileRecord,
+            router_module.ElapsedRecord,
+            router_module.TemperatureRecord,
+        ):
+            self.router.subscribe(record_type, self._count)
+        self.connection = connection_module.PrinterConnection(ip_address, session, self.router.route)
+
+    def _count(self, record, frame):
+        self.records += 1
+
+    async def async_tick(self):
+        if self.connection.connected:
+            self.connection.send(POLL_COMMANDS)
+
+
+def rss_mb():
+    with open("/proc/self/statm") as f:
+        pages = int(f.read().split()[1])
+    return pages * resource.getpagesize() / (1024 * 1024)
+
+
+async def run_client(count, duration, interval, modules):
+    connection_module, router_module, scheduler_module = modules
+    baseline_tasks = len(asyncio.all_tasks())
+    async with ClientSession() as session:
+        scheduler = scheduler_module.PollScheduler(interval)
+        printers = [FarmPrinter(connection_module, router_module, host(i), session) for i in range(count)]
+        for printer in printers:
+            printer.connection.start()
+            scheduler.add(printer)
+
+        # Attende le connessioni, poi misura a regime
+        deadline = time.monotonic() + 10
+        while not all(p.connection.connected for p in printers) and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+        connected = sum(p.connection.connected for p in printers)
+
+        records_before = sum(p.records for p in printers)
+        cpu_before = time.process_time()
+        start = time.monotonic()
+        await asyncio.sleep(duration)
+        elapsed = time.monotonic() - start
+        cpu = time.process_time() - cpu_before
+        records = sum(p.records for p in printers) - records_before
+        tasks = len(asyncio.all_tasks()) - baseline_tasks
+        rss = rss_mb()
+
+        for printer in printers:
+            scheduler.remove(printer)
+            await printer.connection.stop()
+
+    return {
+        "printers": count,
+        "connected": connected,
+        "tasks": tasks,
+        "cpu_percent": 100 * cpu / elapsed,
+        "cpu_ms_per_printer_s": 1000 * cpu / elapsed / count,
+        "records_per_s": records / elapsed,
+        "rss_mb": rss,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--printers", default="1,5,10,20,40")
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--interval", type=float, default=1.0, help="poll interval in seconds")
+    parser.add_argument("--port", type=int, default=18081)
+    args = parser.parse_args()
+
+    if not sys.platform.startswith("linux"):
+        parser.error("requires Linux (127.0.0.x loopback addresses)")
+
+    counts = [int(c) for c in args.printers.split(",")]
+    connection_module = load_module("connection")
+    connection_module.WS_PORT = args.port
+    modules = (connection_module, load_module("router"), load_module("scheduler"))
+
+    ready = multiprocessing.Event()
+    server = multiprocessing.Process(target=_serve, args=(max(counts), args.port, ready), daemon=True)
+    server.start()
+    ready.wait(30)
+
+    try:
+        print(f"{'printers':>8} {'conn':>5} {'tasks':>6} {'cpu %':>7} {'cpu ms/printer/s':>17} {'records/s':>10} {'rss MB':>8}")
+        for count in counts:
+            r = asyncio.run(run_client(count, args.duration, args.interval, modules))
+            print(
+                f"{r['printers']:>8} {r['connected']:>5} {r['tasks']:>6} {r['cpu_percent']:>7.2f} "
+                f"{r['cpu_ms_per_printer_s']:>17.3f} {r['records_per_s']:>10.1f} {r['rss_mb']:>8.1f}"
+            )
+    finally:
+        server.terminate()
+
+
+if __name__ == "__main__":
+    main()
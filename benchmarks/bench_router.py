@@ -0,0 +1,125 @@
+"""
+Micro-benchmark del parsing dei frame WebSocket.
+
+Confronta il vecchio percorso (ogni frame passato a tutti e sei i sensori,
+ognuno con il suo re.search, più la regex della lista file e il controllo
+"IDLE") con MessageRouter, che parsa il frame una sola volta.
+
+Uso:
+    python benchmarks/bench_router.py [--frames N] [--sensors K]
+"""
+
+import argparse
+import asyncio
+import importlib.util
+import os
+import random
+import re
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ROUTER_PATH = os.path.join(ROOT, "custom_components", "haghost5", "router.py")
+
+
+def load_router():
+    """Importa router.py senza passare da __init__ (che richiede Home Assistant)."""
+    spec = importlib.util.spec_from_file_location("haghost5_router", ROUTER_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+SAMPLE_FRAMES = [
+    "T:199.4 /200 B:60.1 /60 T0:199.4 /200 T1:0 /0 @:87 B@:12",
+    "M997 PRINTING",
+    "M997 IDLE",
+    "M27 42",
+    "M994 1:/FBG5_stampo2.2.gcode;-788190462",
+    "M992 00:46:49",
+    "ok",
+    "FBG5_benchy.gcode",
+]
+
+
+def make_frames(count, seed=0):
+    rng = random.Random(seed)
+    # Le righe temperatura sono di gran lunga le più frequenti
+    weights = [10, 1, 1, 2, 1, 1, 2, 1]
+    return rng.choices(SAMPLE_FRAMES, weights=weights, k=count)
+
+
+LEGACY_PATTERNS = [
+    r"M997\s+([^\s]+)",
+    r"M27\s+([^\s]+)",
+    r"M994\s+([^;]+);([^\s]+)",
+    r"M992\s+(\d{2}:\d{2}:\d{2})",
+    r"B:([\d\.]+)",
+    r"T:([\d\.]+)",
+]
+
+
+def run_legacy(frames, sensors):
+    """Percorso originale: ogni sensore cerca il suo pattern su ogni frame."""
+    patterns = [LEGACY_PATTERNS[i % len(LEGACY_PATTERNS)] for i in range(sensors)]
+    hits = 0
+    start = time.perf_counter()
+    for frame in frames:
+        _ = "IDLE" in frame
+        if re.search(r"Begin file list|\.gcode\s*$|End file list", frame):
+            hits += 1
+        for pattern in patterns:
+            if re.search(pattern, frame):
+                hits += 1
+    return time.perf_counter() - start, hits
+
+
+def run_router(router_module, frames, sensors):
+    """Percorso nuovo: un parse per frame, dispatch sul tipo di record."""
+    router = router_module.MessageRouter()
+    record_types = [
+        router_module.StatusRecord,
+        router_module.ProgressRecord,
+        router_module.FileRecord,
+        router_module.ElapsedRecord,
+        router_module.TemperatureRecord,
+        router_module.TemperatureRecord,
+    ]
+    hits = [0]
+
+    def handler(record, frame):
+        hits[0] += 1
+
+    for i in range(sensors):
+        router.subscribe(record_types[i % len(record_types)], handler)
+    router.subscribe(router_module.FileListRecord, handler)
+
+    async def drive():
+        start = time.perf_counter()
+        for frame in frames:
+            await router.route(frame)
+        return time.perf_counter() - start
+
+    elapsed = asyncio.run(drive())
+    return elapsed, hits[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--frames", type=int, default=200_000)
+    parser.add_argument("--sensors", type=int, default=6)
+    args = parser.parse_args()
+
+    router_module = load_router()
+    frames = make_frames(args.frames)
+
+    legacy_time, _ = run_legacy(frames, args.sensors)
+    router_time, _ = run_router(router_module, frames, args.sensors)
+
+    print(f"frames: {args.frames}  sensors: {args.sensors}")
+    print(f"before (regex per sensor): {args.frames / legacy_time:12,.0f} frames/s")
+    print(f"after  (MessageRouter):    {args.frames / router_time:12,.0f} frames/s")
+    print(f"speedup: {legacy_time / router_time:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,357 @@
+"""
+Benchmark della pipeline di telemetria con replay di frame.
+
+Passa frame registrati o sintetici attraverso il codice reale: il punto in
+cui la connessione consegna i frame (PrinterHub._handle_frame), il
+MessageRouter, i sensori creati da sensor.async_setup_entry e lo
+StatePublisher, fino ad async_write_ha_state, sostituito da un registratore
+che legge stato e attributi come farebbe Home Assistant. hass è uno stub
+(nessun event bus, recorder o registry), quindi gira senza interfaccia.
+
+Per ogni combinazione di stampanti e frequenza (frame/s per stampante)
+misura frame/s ottenuti, latenza p50/p99 del trattamento di un frame e dal
+frame alla scrittura di stato, scritture fatte/soppresse/rinviate e blocchi
+di memoria netti per frame. Una passata con tracemalloc misura la memoria
+temporanea allocata per frame. Alla fine scrive un report JSON; con
+--baseline lo confronta con un report precedente ed esce con codice 1 se
+frame/s o p99 peggiorano oltre --tolerance.
+
+Richiede Home Assistant installato (pip install homeassistant): i sensori
+sono le classi reali.
+
+Frame registrati (--frames-file): un frame per riga, oppure con estensione
+.jsonl una stringa JSON per riga (per i frame su più righe).
+
+Uso:
+    python benchmarks/bench_telemetry.py [--printers 1,10,50] [--rates 1,10,0]
+        [--duration 5] [--frames-file frames.txt] [--report report.json]
+        [--baseline old.json] [--tolerance 0.2]
+
+Frequenza 0 = più veloce possibile.
+"""
+
+import argparse
+import asyncio
+import gc
+import importlib
+import importlib.util
+import json
+import os
+import platform
+import random
+import resource
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+from types import SimpleNamespace
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PACKAGE = os.path.join(ROOT, "custom_components", "haghost5")
+PACKAGE_NAME = "haghost5"
+
+ALLOCATION_FRAMES = 2000
+
+
+def load_package():
+    """
+    Registra il pacchetto senza eseguire __init__ (view HTTP, device registry,
+    forward delle piattaforme) e ritorna i moduli usati dal benchmark.
+    """
+    if PACKAGE_NAME not in sys.modules:
+        spec = importlib.util.spec_from_file_location(
+            PACKAGE_NAME, os.path.join(PACKAGE, "__init__.py"), submodule_search_locations=[PACKAGE]
+        )
+        sys.modules[PACKAGE_NAME] = importlib.util.module_from_spec(spec)
+    hub = importlib.import_module(f"{PACKAGE_NAME}.hub")
+    sensor = importlib.import_module(f"{PACKAGE_NAME}.sensor")
+    const = importlib.import_module(f"{PACKAGE_NAME}.const")
+    # Il benchmark consegna i frame direttamente: nessuna sessione HTTP
+    hub.async_get_clientsession = lambda hass: None
+    return hub, sensor, const
+
+
+# --- stub di Home Assistant ---
+
+class StubHass:
+    """Quello che hub e sensori usano di hass, senza Home Assistant in esecuzione."""
+
+    def __init__(self, config_dir):
+        self.data = {}
+        self.config = SimpleNamespace(path=lambda *parts: os.path.join(config_dir, *parts))
+        self.bus = SimpleNamespace(async_fire=lambda *args, **kwargs: None)
+        self._tasks = set()
+
+    def async_create_task(self, coro, name=None):
+        task = asyncio.get_running_loop().create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    async_create_background_task = async_create_task
+
+    def async_add_executor_job(self, func, *args):
+        return asyncio.get_running_loop().run_in_executor(None, func, *args)
+
+
+class Probe:
+    """Istante di arrivo del frame in corso e campioni di latenza."""
+
+    def __init__(self):
+        self.arrival = None
+        self.process = []     # secondi: arrivo -> fine del routing
+        self.write = []       # secondi: arrivo -> async_write_ha_state
+        self.deferred = 0     # scritture fatte dopo (accorpate dal publisher)
+
+    def recorder(self, entity):
+        def async_write_ha_state():
+            # Come HA: legge stato e attributi dell'entità
+            entity.state
+            entity.extra_state_attributes
+            if self.arrival is None:
+                self.deferred += 1
+            else:
+                self.write.append(time.perf_counter() - self.arrival)
+        return async_write_ha_state
+
+
+async def build_printer(modules, hass, index, probe):
+    """Un PrinterHub reale con i sensori di sensor.async_setup_entry, scritture verso il probe."""
+    hub_module, sensor_module, const = modules
+    ip_address = f"10.0.{index // 250}.{index % 250 + 1}"
+    entry = SimpleNamespace(entry_id=f"bench{index}", data={"ip_address": ip_address}, options={})
+    hub = hub_module.PrinterHub(hass, entry)
+    hub.online = True  # niente richiesta M20 al primo frame
+    hass.data.setdefault(const.DOMAIN, {})[entry.entry_id] = hub
+
+    entities = []
+    await sensor_module.async_setup_entry(hass, entry, lambda new, *args: entities.extend(new))
+    for entity in entities:
+        entity.hass = hass
+        entity.entity_id = f"sensor.{entity.unique_id}"
+        entity.async_write_ha_state = probe.recorder(entity)
+    return hub
+
+
+# --- frame ---
+
+def synthetic_frames(count, seed):
+    """Sequenza realistica: righe temperature e risposte alle interrogazioni di polling."""
+    rng = random.Random(seed)
+    frames = []
+    progress = 0
+    elapsed = 0
+    for i in range(count):
+        nozzle = 200 + rng.uniform(-1.5, 1.5)
+        bed = 60 + rng.uniform(-0.6, 0.6)
+        frames.append(
+            f"T:{nozzle:.1f} /200 B:{bed:.1f} /60 T0:{nozzle:.1f} /200 T1:0 /0 "
+            f"@:{rng.randint(60, 110)} B@:{rng.randint(5, 30)}"
+        )
+        if i % 5 == 0:
+            frames.append("M997 PRINTING")
+            frames.append(f"M27 {progress}")
+            progress = (progress + 1) % 100
+        if i % 10 == 0:
+            elapsed += 10
+            frames.append(f"M992 {elapsed // 3600:02d}:{elapsed % 3600 // 60:02d}:{elapsed % 60:02d}")
+        if i % 60 == 0:
+            frames.append("M994 1:/benchy.gcode;1234567")
+    return frames
+
+
+def load_frames(path):
+    with open(path) as f:
+        if path.endswith(".jsonl"):
+            return [json.loads(line) for line in f if line.strip()]
+        return [line.rstrip("\n") for line in f if line.strip()]
+
+
+# --- misura ---
+
+def percentile_us(samples, q):
+    if not samples:
+        return None
+    return round(float(np.percentile(np.asarray(samples), q)) * 1e6, 1)
+
+
+def peak_rss_mb():
+    # ru_maxrss è in KB su Linux, in byte su macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+async def run_case(modules, frames, printers_count, rate, duration, config_dir):
+    hass = StubHass(config_dir)
+    probe = Probe()
+    printers = [await build_printer(modules, hass, i, probe) for i in range(printers_count)]
+
+    gc.collect()
+    blocks_before = sys.getallocatedblocks()
+    publishers = [hub.publisher for hub in printers]
+    written_before = sum(p.written for p in publishers)
+
+    total_rate = rate * printers_count
+    sent = 0
+    start = time.perf_counter()
+    deadline = start + duration
+    cursor = 0
+    while True:
+        now = time.perf_counter()
+        if now >= deadline:
+            break
+        due = int((now - start) * total_rate) - sent if total_rate else printers_count
+        if due <= 0:
+            await asyncio.sleep(0.0005)
+            continue
+        for _ in range(due):
+            hub = printers[sent % printers_count]
+            frame = frames[cursor]
+            cursor = (cursor + 1) % len(frames)
+            probe.arrival = time.perf_counter()
+            await hub._handle_frame(frame)
+            probe.process.append(time.perf_counter() - probe.arrival)
+            probe.arrival = None
+            sent += 1
+        if total_rate == 0:
+            # Lascia girare i timer del publisher anche a piena velocità
+            await asyncio.sleep(0)
+    elapsed = time.perf_counter() - start
+
+    blocks_after = sys.getallocatedblocks()
+    result = {
+        "printers": printers_count,
+        "rate_per_printer": rate,
+        "target_fps": total_rate or None,
+        "frames": sent,
+        "fps": round(sent / elapsed, 1),
+        "process_p50_us": percentile_us(probe.process, 50),
+        "process_p99_us": percentile_us(probe.process, 99),
+        "write_p50_us": percentile_us(probe.write, 50),
+        "write_p99_us": percentile_us(probe.write, 99),
+        "writes": sum(p.written for p in publishers) - written_before,
+        "deferred_writes": probe.deferred,
+        "suppressed_writes": sum(p.suppressed for p in publishers),
+        "coalesced_writes": sum(p.coalesced for p in publishers),
+        "net_blocks_per_frame": round((blocks_after - blocks_before) / max(sent, 1), 3),
+    }
+    for hub in printers:
+        hub.publisher.stop()
+        hub.catalog.cancel()
+    return result
+
+
+async def measure_allocations(modules, frames, config_dir):
+    """Memoria temporanea allocata per frame (picco tracemalloc), su una stampante."""
+    hass = StubHass(config_dir)
+    hub = await build_printer(modules, hass, 0, Probe())
+
+    samples = []
+    tracemalloc.start()
+    try:
+        for i in range(ALLOCATION_FRAMES):
+            frame = frames[i % len(frames)]
+            tracemalloc.reset_peak()
+            current = tracemalloc.get_traced_memory()[0]
+            await hub._handle_frame(frame)
+            samples.append(tracemalloc.get_traced_memory()[1] - current)
+    finally:
+        tracemalloc.stop()
+        hub.publisher.stop()
+        hub.catalog.cancel()
+    samples = np.asarray(samples)
+    return {
+        "frames": ALLOCATION_FRAMES,
+        "bytes_per_frame_mean": round(float(samples.mean()), 1),
+        "bytes_per_frame_p99": round(float(np.percentile(samples, 99)), 1),
+    }
+
+
+def compare(report, baseline, tolerance):
+    """Regressioni rispetto a un report precedente: fps più bassi o p99 più alti oltre la tolleranza."""
+    previous = {(r["printers"], r["rate_per_printer"]): r for r in baseline.get("runs", [])}
+    regressions = []
+    for run in report["runs"]:
+        old = previous.get((run["printers"], run["rate_per_printer"]))
+        if old is None:
+            continue
+        key = f"{run['printers']} printers @ {run['rate_per_printer'] or 'max'}/s"
+        if run["target_fps"] is None and run["fps"] < old["fps"] * (1 - tolerance):
+            regressions.append(f"{key}: fps {old['fps']} -> {run['fps']}")
+        for metric in ("process_p99_us", "write_p99_us"):
+            if run[metric] and old.get(metric) and run[metric] > old[metric] * (1 + tolerance):
+                regressions.append(f"{key}: {metric} {old[metric]} -> {run[metric]}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--printers", default="1,10,50")
+    parser.add_argument("--rates", default="1,10,0", help="frames/s per printer, 0 = as fast as possible")
+    parser.add_argument("--duration", type=float, default=5.0, help="seconds per case")
+    parser.add_argument("--frames-file", help="recorded frames to replay")
+    parser.add_argument("--synthetic", type=int, default=5000, help="synthetic temperature frames to generate")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--report", default="bench_telemetry.json")
+    parser.add_argument("--baseline", help="previous report to compare with")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    args = parser.parse_args()
+
+    modules = load_package()
+    frames = load_frames(args.frames_file) if args.frames_file else synthetic_frames(args.synthetic, args.seed)
+    config_dir = os.path.join(ROOT, ".bench_config")
+
+    async def run_all():
+        runs = []
+        print(
+            f"{'printers':>8} {'rate':>6} {'fps':>10} {'proc p50':>9} {'proc p99':>9} "
+            f"{'write p50':>10} {'write p99':>10} {'writes':>7} {'deferred':>8} {'blocks/f':>9}"
+        )
+        for count in (int(c) for c in args.printers.split(",")):
+            for rate in (float(r) for r in args.rates.split(",")):
+                r = await run_case(modules, frames, count, rate, args.duration, config_dir)
+                runs.append(r)
+                print(
+                    f"{r['printers']:>8} {rate or 'max':>6} {r['fps']:>10.1f} "
+                    f"{r['process_p50_us'] or 0:>9.1f} {r['process_p99_us'] or 0:>9.1f} "
+                    f"{r['write_p50_us'] or 0:>10.1f} {r['write_p99_us'] or 0:>10.1f} "
+                    f"{r['writes']:>7} {r['deferred_writes']:>8} {r['net_blocks_per_frame']:>9.3f}"
+                )
+        allocations = await measure_allocations(modules, frames, config_dir)
+        return runs, allocations
+
+    runs, allocations = asyncio.run(run_all())
+    print(
+        f"allocations: {allocations['bytes_per_frame_mean']:.0f} B/frame mean, "
+        f"{allocations['bytes_per_frame_p99']:.0f} B/frame p99"
+    )
+
+    report = {
+        "benchmark": "telemetry",
+        "timestamp": datetime.now().isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "frames_source": args.frames_file or f"synthetic:{args.synthetic}:{args.seed}",
+        "duration": args.duration,
+        "runs": runs,
+        "allocations": allocations,
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+    }
+    with open(args.report, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"peak RSS {report['peak_rss_mb']} MB, report written to {args.report}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(report, json.load(f), args.tolerance)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        if regressions:
+            sys.exit(1)
+        print("No regressions against", args.baseline)
+
+
+if __name__ == "__main__":
+    main()
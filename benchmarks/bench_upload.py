@@ -0,0 +1,371 @@
+"""
+Benchmark degli upload di G-code grandi e concorrenti.
+
+Guida le view reali GCodeUploadView (/api/haghost5/upload_gcode) e
+GCodeUploadAndPrintView (/api/haghost5/upload_and_print) col test client di
+aiohttp. Per upload_and_print la stampante è tools/ghost5_emulator.py, avviato
+in un processo separato: riceve /upload e risponde {"err": 0}, così il suo
+lavoro non pesa sul loop misurato. hass è uno stub con un vero executor e una
+cartella di configurazione temporanea.
+
+Per ogni vista, dimensione del file e numero di upload simultanei misura:
+throughput aggregato e per upload (MB/s), ritardo massimo e p99 del loop
+durante gli upload (un task che dorme --lag-interval e misura quanto si
+sveglia in ritardo), RSS di picco campionato e crescita rispetto a prima
+del caso, eventi di avanzamento e risposte 503 per slot esauriti. Il client
+gira sullo stesso loop, come col test client di aiohttp, ma invia blocchi
+già in memoria, quindi il suo costo è minimo.
+
+L'elaborazione dopo l'upload (indice, toolpath, stima) è esclusa, perché
+misura il parsing e non l'I/O; con --preprocess viene eseguita e il caso
+attende che finisca.
+
+Alla fine scrive un report JSON; con --baseline lo confronta con un report
+precedente ed esce con codice 1 se throughput o ritardo del loop peggiorano
+oltre --tolerance.
+
+Richiede aiohttp e Home Assistant installato (pip install homeassistant): le
+view sono le classi reali.
+
+Uso:
+    python benchmarks/bench_upload.py [--sizes 50,100,200] [--concurrency 1,2,4]
+        [--views upload_gcode,upload_and_print] [--with-size] [--preprocess]
+        [--report report.json] [--baseline old.json] [--tolerance 0.2]
+"""
+
+import argparse
+import asyncio
+import importlib
+import importlib.util
+import json
+import os
+import platform
+import resource
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from types import SimpleNamespace
+
+import numpy as np
+from aiohttp import ClientSession, MultipartWriter, web
+from aiohttp.test_utils import TestClient, TestServer
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PACKAGE = os.path.join(ROOT, "custom_components", "haghost5")
+PACKAGE_NAME = "haghost5"
+EMULATOR = os.path.join(ROOT, "tools", "ghost5_emulator.py")
+
+MB = 1024 * 1024
+CLIENT_CHUNK_SIZE = 256 * 1024
+VIEWS = ("upload_gcode", "upload_and_print")
+# Sotto qualche millisecondo il ritardo del loop è rumore dello scheduler
+LAG_NOISE_MS = 5.0
+
+
+def load_package():
+    """Registra il pacchetto senza eseguire __init__ e ritorna i moduli usati dal benchmark."""
+    if PACKAGE_NAME not in sys.modules:
+        spec = importlib.util.spec_from_file_location(
+            PACKAGE_NAME, os.path.join(PACKAGE, "__init__.py"), submodule_search_locations=[PACKAGE]
+        )
+        sys.modules[PACKAGE_NAME] = importlib.util.module_from_spec(spec)
+    hub = importlib.import_module(f"{PACKAGE_NAME}.hub")
+    api = importlib.import_module(f"{PACKAGE_NAME}.api")
+    const = importlib.import_module(f"{PACKAGE_NAME}.const")
+    # Nessuna connessione WebSocket: l'hub serve solo a risolvere ?printer=
+    hub.async_get_clientsession = lambda hass: None
+    return hub, api, const
+
+
+# --- stub di Home Assistant ---
+
+class StubHass:
+    """Quello che le view di upload usano di hass."""
+
+    def __init__(self, config_dir, preprocess):
+        self.data = {}
+        self.config = SimpleNamespace(path=lambda *parts: os.path.join(config_dir, *parts))
+        self.events = 0
+        self.bus = SimpleNamespace(async_fire=self._fire)
+        self._preprocess = preprocess
+        self.background = set()
+
+    def _fire(self, event_type, data=None):
+        self.events += 1
+
+    def async_create_background_task(self, coro, name=None):
+        if not self._preprocess:
+            coro.close()
+            return None
+        task = asyncio.get_running_loop().create_task(coro)
+        self.background.add(task)
+        task.add_done_callback(self.background.discard)
+        return task
+
+    def async_add_executor_job(self, func, *args):
+        return asyncio.get_running_loop().run_in_executor(None, func, *args)
+
+
+# --- stampante ---
+
+def start_emulator(port):
+    """Avvia una Ghost5 emulata su 127.0.0.1:port e attende che accetti connessioni."""
+    process = subprocess.Popen(
+        [sys.executable, EMULATOR, "--count", "1", "--host", "127.0.0.1",
+         "--http-port", str(port), "--ws-port", str(port + 1)],
+        stdout=subprocess.DEVNULL,
+    )
+    deadline = time.monotonic() + 15
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.5).close()
+            return process
+        except OSError:
+            if process.poll() is not None:
+                break
+            time.sleep(0.1)
+    process.terminate()
+    raise RuntimeError(f"Ghost5 emulator did not start on port {port}")
+
+
+# --- client ---
+
+def gcode_block(size=MB):
+    """Un blocco di mosse G1 realistiche, ripetuto per comporre file di qualunque dimensione."""
+    lines = ["G90", "M82", "G92 E0"]
+    e = 0.0
+    i = 0
+    while sum(len(line) + 1 for line in lines) < size:
+        e += 0.03
+        lines.append(f"G1 X{100 + (i % 400) * 0.1:.3f} Y{100 + (i // 400 % 400) * 0.1:.3f} E{e:.5f}")
+        i += 1
+    return ("\n".join(lines) + "\n").encode()[:size]
+
+
+async def file_chunks(block, size):
+    """Corpo del campo file: blocchi già in memoria, niente I/O lato client."""
+    sent = 0
+    while sent < size:
+        chunk = block[: min(CLIENT_CHUNK_SIZE, size - sent)]
+        sent += len(chunk)
+        yield chunk
+
+
+async def upload(client, view, filename, size, block, query):
+    writer = MultipartWriter("form-data")
+    part = writer.append(file_chunks(block, size))
+    part.set_content_disposition("form-data", name="file", filename=filename)
+    start = time.perf_counter()
+    async with client.post(f"/api/haghost5/{view}", data=writer, params=query) as resp:
+        await resp.read()
+        status = resp.status
+    return status, time.perf_counter() - start
+
+
+# --- misura ---
+
+def rss_mb():
+    with open("/proc/self/statm") as f:
+        pages = int(f.read().split()[1])
+    return pages * resource.getpagesize() / MB
+
+
+def peak_rss_mb():
+    # ru_maxrss è in KB su Linux, in byte su macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / MB if sys.platform == "darwin" else peak / 1024
+
+
+class LoopMonitor:
+    """Ritardo del loop e RSS, campionati ogni `interval` secondi."""
+
+    def __init__(self, interval):
+        self._interval = interval
+        self.lags = []
+        self.rss_peak = 0.0
+        self._task = None
+
+    def start(self):
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+
+    async def _run(self):
+        while True:
+            start = time.perf_counter()
+            await asyncio.sleep(self._interval)
+            self.lags.append(time.perf_counter() - start - self._interval)
+            self.rss_peak = max(self.rss_peak, rss_mb())
+
+
+async def run_case(modules, view, size_mb, concurrency, args, printer_address, block):
+    hub_module, api, const = modules
+    config_dir = tempfile.mkdtemp(prefix="bench_upload_")
+    hass = StubHass(config_dir, args.preprocess)
+    entry = SimpleNamespace(entry_id="bench", data={"ip_address": printer_address}, options={})
+    hub = hub_module.PrinterHub(hass, entry)
+    hass.data[const.DOMAIN] = {entry.entry_id: hub}
+
+    slots = asyncio.Semaphore(args.slots or concurrency)
+    app = web.Application()
+    app["hass"] = hass
+    app.router.add_post(api.GCodeUploadView.url, api.GCodeUploadView(slots).post)
+    app.router.add_post(api.GCodeUploadAndPrintView.url, api.GCodeUploadAndPrintView(slots).post)
+
+    size = int(size_mb * MB)
+    query = {"printer": printer_address} if view == "upload_and_print" else {}
+    if args.with_size and view == "upload_and_print":
+        query["size"] = str(size)
+
+    monitor = LoopMonitor(args.lag_interval)
+    async with ClientSession() as printer_session, TestClient(TestServer(app)) as client:
+        api.async_get_clientsession = lambda hass: printer_session
+        rss_before = rss_mb()
+        monitor.start()
+        start = time.perf_counter()
+        results = await asyncio.gather(*(
+            upload(client, view, f"bench_{i}.gcode", size, block, query) for i in range(concurrency)
+        ))
+        elapsed = time.perf_counter() - start
+        if hass.background:
+            await asyncio.gather(*hass.background)
+        total_elapsed = time.perf_counter() - start
+        await monitor.stop()
+
+    hub.publisher.stop()
+    hub.catalog.cancel()
+
+    gcodes_dir = hass.config.path("www", "community", "haghost5", "gcodes")
+    saved = sum(
+        1 for i in range(concurrency)
+        if os.path.exists(os.path.join(gcodes_dir, f"bench_{i}.gcode"))
+        and os.path.getsize(os.path.join(gcodes_dir, f"bench_{i}.gcode")) == size
+    )
+    shutil.rmtree(config_dir, ignore_errors=True)
+
+    statuses = [status for status, _ in results]
+    ok = [seconds for status, seconds in results if status == 200]
+    lags = np.asarray(monitor.lags or [0.0])
+    return {
+        "view": view,
+        "size_mb": size_mb,
+        "concurrency": concurrency,
+        "ok": len(ok),
+        "rejected": statuses.count(503),
+        "failed": len(statuses) - len(ok) - statuses.count(503),
+        "saved": saved,
+        "elapsed_s": round(elapsed, 3),
+        "preprocess_s": round(total_elapsed - elapsed, 3) if args.preprocess else None,
+        "throughput_mb_s": round(len(ok) * size_mb / elapsed, 1),
+        "per_upload_mb_s": round(float(np.mean([size_mb / s for s in ok])), 1) if ok else None,
+        "loop_lag_max_ms": round(float(lags.max()) * 1000, 2),
+        "loop_lag_p99_ms": round(float(np.percentile(lags, 99)) * 1000, 2),
+        "rss_peak_mb": round(monitor.rss_peak, 1),
+        "rss_growth_mb": round(monitor.rss_peak - rss_before, 1),
+        "progress_events": hass.events,
+    }
+
+
+def compare(report, baseline, tolerance):
+    """Regressioni rispetto a un report precedente: throughput più basso o ritardo del loop più alto."""
+    previous = {(r["view"], r["size_mb"], r["concurrency"]): r for r in baseline.get("runs", [])}
+    regressions = []
+    for run in report["runs"]:
+        old = previous.get((run["view"], run["size_mb"], run["concurrency"]))
+        if old is None:
+            continue
+        key = f"{run['view']} {run['size_mb']} MB x{run['concurrency']}"
+        if run["throughput_mb_s"] < old["throughput_mb_s"] * (1 - tolerance):
+            regressions.append(f"{key}: throughput {old['throughput_mb_s']} -> {run['throughput_mb_s']} MB/s")
+        if run["loop_lag_max_ms"] > old["loop_lag_max_ms"] * (1 + tolerance) + LAG_NOISE_MS:
+            regressions.append(f"{key}: loop lag {old['loop_lag_max_ms']} -> {run['loop_lag_max_ms']} ms")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sizes", default="50,100,200", help="file sizes in MB")
+    parser.add_argument("--concurrency", default="1,2,4", help="simultaneous uploads")
+    parser.add_argument("--views", default=",".join(VIEWS))
+    parser.add_argument("--slots", type=int, default=0, help="upload slots of the views, 0 = one per upload")
+    parser.add_argument("--with-size", action="store_true", help="pass ?size= to upload_and_print (Content-Length)")
+    parser.add_argument("--preprocess", action="store_true", help="also run index, toolpath and estimate")
+    parser.add_argument("--lag-interval", type=float, default=0.01, help="seconds between loop lag samples")
+    parser.add_argument("--port", type=int, default=18090, help="HTTP port of the emulated printer")
+    parser.add_argument("--report", default="bench_upload.json")
+    parser.add_argument("--baseline", help="previous report to compare with")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    args = parser.parse_args()
+
+    views = [v for v in args.views.split(",") if v]
+    for view in views:
+        if view not in VIEWS:
+            parser.error(f"unknown view {view}, choose from {', '.join(VIEWS)}")
+    sizes = [float(s) for s in args.sizes.split(",")]
+    counts = [int(c) for c in args.concurrency.split(",")]
+
+    modules = load_package()
+    block = gcode_block()
+    printer_address = f"127.0.0.1:{args.port}"
+    emulator = start_emulator(args.port) if "upload_and_print" in views else None
+
+    async def run_all():
+        runs = []
+        print(
+            f"{'view':>16} {'MB':>6} {'conc':>5} {'ok':>4} {'MB/s':>8} {'MB/s/up':>8} "
+            f"{'lag max ms':>10} {'lag p99 ms':>10} {'rss MB':>8} {'+rss MB':>8}"
+        )
+        for view in views:
+            for size_mb in sizes:
+                for concurrency in counts:
+                    r = await run_case(modules, view, size_mb, concurrency, args, printer_address, block)
+                    runs.append(r)
+                    print(
+                        f"{view:>16} {size_mb:>6g} {concurrency:>5} {r['ok']:>4} {r['throughput_mb_s']:>8.1f} "
+                        f"{r['per_upload_mb_s'] or 0:>8.1f} {r['loop_lag_max_ms']:>10.2f} "
+                        f"{r['loop_lag_p99_ms']:>10.2f} {r['rss_peak_mb']:>8.1f} {r['rss_growth_mb']:>8.1f}"
+                    )
+        return runs
+
+    try:
+        runs = asyncio.run(run_all())
+    finally:
+        if emulator is not None:
+            emulator.terminate()
+            emulator.wait()
+
+    report = {
+        "benchmark": "upload",
+        "timestamp": datetime.now().isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "with_size": args.with_size,
+        "preprocess": args.preprocess,
+        "runs": runs,
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+    }
+    with open(args.report, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"peak RSS {report['peak_rss_mb']} MB, report written to {args.report}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(report, json.load(f), args.tolerance)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        if regressions:
+            sys.exit(1)
+        print("No regressions against", args.baseline)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,4 @@
 import logging
-import os
-import shutil
 import random
 import string
 
@@ -12,11 +10,22 @@ from aiohttp import web
 
 from .const import DOMAIN
 from .const import UPLOAD_URL
+from .const import CONF_MAX_CONCURRENT_UPLOADS, DEFAULT_MAX_CONCURRENT_UPLOADS
 
 
 from .api import GCodeUploadAndPrintView
 from .api import GCodeUploadView
 from .api import HAG5GetGcodeFile
+from .api import HAG5GcodeIndexView
+from .api import HAG5ToolpathView
+from .api import HAG5JobsView
+from .api import HAG5FilesView
+from .api import HAG5HistoryView
+from .api import set_upload_limit
+from .assets import sync_web_assets
+from .hub import PrinterHub
+from .jobqueue import JobQueue
+from .services import async_register_services
 
 _LOGGER = logging.getLogger(__name__)
 
@@ -30,7 +39,8 @@ UPLOAD_DIR_NAME = "www/community/haghost5/gcodes"
 
 
 async def async_setup(hass: HomeAssistant, config: dict):
-    """Set up the integration via YAML (not used)."""
+    """Set up the integration via YAML (not used) and register its services."""
+    async_register_services(hass)
     return True
 
 
@@ -47,16 +57,6 @@ async def async_setup_entry(hass: HomeAssistant, config_entry: ConfigEntry):
     if 'entities' not in hass.data[DOMAIN]:
         hass.data[DOMAIN]['entities'] = []
 
-    # Salva l'IP in un'entità dedicata
-    hass.states.async_set(
-        "sensor.haghost5_printer_ip",
-        ip_address,
-        {
-            "friendly_name": "HAGhost5 Printer IP Address",
-            "icon": "mdi:ip-network"
-        }
-    )
-    
     # 1) Registra il dispositivo esplicitamente
     device_registry = dr.async_get(hass)
     device_registry.async_get_or_create(
@@ -68,39 +68,74 @@ async def async_setup_entry(hass: HomeAssistant, config_entry: ConfigEntry):
         sw_version="1.0"
     )
 
-    # 2) Avvia la piattaforma dei sensori
+    # 2) Crea il hub della stampante: una connessione, polling e stato online
+    hub = PrinterHub(hass, config_entry)
+    hass.data[DOMAIN][config_entry.entry_id] = hub
+    await hub.async_start()
+
+    # Le opzioni (profilo attributi, publisher) si applicano ricaricando la entry
+    config_entry.async_on_unload(config_entry.add_update_listener(async_update_options))
+
+    # 3) Avvia la piattaforma dei sensori
     hass.async_create_task(
         hass.config_entries.async_forward_entry_setup(config_entry, "sensor")
     )
 
+    # 4) Limite sugli upload contemporanei (scrittura su disco e verso la
+    # stampante), unico per l'integrazione: un cambio delle opzioni ricarica
+    # la entry e si applica subito
+    _apply_upload_limit(hass)
+
+    # Le view sono condivise da tutte le stampanti: si registrano una sola
+    # volta e scelgono la stampante con ?printer=<entry id o IP>
+    if not hass.data[DOMAIN].get("views_registered"):
+        hass.http.register_view(GCodeUploadAndPrintView())
+        hass.http.register_view(HAG5GetGcodeFile())
+        hass.http.register_view(HAG5GcodeIndexView())
+        hass.http.register_view(HAG5ToolpathView())
+        hass.http.register_view(GCodeUploadView())
+        hass.http.register_view(HAG5JobsView())
+        hass.http.register_view(HAG5FilesView())
+        hass.http.register_view(HAG5HistoryView())
+        hass.data[DOMAIN]["views_registered"] = True
+
+        # 5) Pagine e card in www/community/haghost5: una volta per avvio, in
+        # background e copiando solo i file cambiati
+        hass.async_create_background_task(_async_sync_assets(hass), "haghost5 web assets")
+        _register_card(hass)
+
+        # Coda di stampa persistente, usa gli stessi slot di upload
+        job_queue = JobQueue(hass)
+        await job_queue.async_load()
+        hass.data[DOMAIN]["job_queue"] = job_queue
+
+    hass.data[DOMAIN]["job_queue"].attach_hub(hub)
 
-    # 4) Copia la pagina HTML in config/www/community/haghost5/hag5_upload.html
-    await hass.async_add_executor_job(copy_upload_page, hass)
-    await hass.async_add_executor_job(copy_visual_page, hass)
-    await hass.async_add_executor_job(copy_renderer_card_page, hass)
-    await hass.async_add_executor_job(copy_operations_page, hass)
-    await hass.async_add_executor_job(copy_operations_card, hass)
-    
-    # Nuovo percorso per la directory GCODE
-    gcode_path = hass.config.path("www", "community", "haghost5", "gcodes")
-    
-    # Crea la directory se non esiste
-    os.makedirs(gcode_path, exist_ok=True)
-    _LOGGER.info("Created folder for GCODE files at: %s", gcode_path)
+    return True
 
 
-    # (nuovo) 6) Registriamo anche la view "upload_and_print"
-    # Per ora, non passiamo sensor_ref (None). Se in futuro avrai
-    # un oggetto per inviare i comandi WS, lo passerai qui.
-    
+def _apply_upload_limit(hass: HomeAssistant, exclude=None):
+    """
+    Applica max_concurrent_uploads, condiviso da tutte le stampanti. Se le
+    entry hanno valori diversi vale il più basso, indipendentemente
+    dall'ordine di caricamento.
+    """
+    limits = [
+        entry.options.get(CONF_MAX_CONCURRENT_UPLOADS, DEFAULT_MAX_CONCURRENT_UPLOADS)
+        for entry in hass.config_entries.async_entries(DOMAIN)
+        if entry.entry_id != exclude
+    ]
+    set_upload_limit(hass, min(limits, default=DEFAULT_MAX_CONCURRENT_UPLOADS))
+
+
+async def _async_sync_assets(hass: HomeAssistant):
+    await hass.async_add_executor_job(
+        sync_web_assets, hass.config.path("www", "community", "haghost5")
+    )
 
-    view_print = GCodeUploadAndPrintView(ip_address=ip_address)
-    hass.http.register_view(view_print)
-    hass.http.register_view(HAG5GetGcodeFile())
-    hass.http.register_view(GCodeUploadView())
 
-    #7 Registra la card
-    # Registra la card
+def _register_card(hass: HomeAssistant):
+    """Registra la card (percorso statico e risorsa Lovelace), una volta per avvio."""
     _LOGGER.debug("Inizio registrazione della card hag5-gcode-card...")
     
     try:
@@ -139,117 +174,22 @@ async def async_setup_entry(hass: HomeAssistant, config_entry: ConfigEntry):
     
     _LOGGER.debug("Fine registrazione della card hag5_gcode_card.")
 
-    return True
+
+async def async_update_options(hass: HomeAssistant, config_entry: ConfigEntry):
+    """Reload the entry when its options change."""
+    await hass.config_entries.async_reload(config_entry.entry_id)
 
 
 async def async_unload_entry(hass: HomeAssistant, entry: ConfigEntry):
     """Unload the integration."""
     await hass.config_entries.async_forward_entry_unload(entry, "sensor")
 
-    return True
-
-
-def copy_upload_page(hass: HomeAssistant):
-    """
-    Copia il file 'hag5_upload.html' dalla cartella custom_components/haghost5/web/
-    in config/www/community/haghost5/hag5_upload.html, 
-    in modo che sia accessibile via /local/community/haghost5/hag5_upload.html.
-    """
-    src_file = hass.config.path("custom_components/haghost5/web/hag5_upload.html")
-
-    # Creiamo la cartella /www/community/haghost5/ se non esiste
-    dst_dir = hass.config.path("www", "community", "haghost5")
-    os.makedirs(dst_dir, exist_ok=True)
-
-    dst_file = os.path.join(dst_dir, "hag5_upload.html")
-
-
-    try:
-        shutil.copyfile(src_file, dst_file)
-        _LOGGER.info("Copied hag5_upload.html to %s", dst_file)
-    except Exception as e:
-        _LOGGER.error("Error copying hag5_upload.html: %s", e)
-
-def copy_visual_page(hass: HomeAssistant):
-    """
-    Copia il file 'hag5_visualizer.html' dalla cartella custom_components/haghost5/web/
-    in config/www/community/haghost5/hag5_visualizer.html, 
-    in modo che sia accessibile via /local/community/haghost5/hag5_visualizer.html
-    """
-    src_file = hass.config.path("custom_components/haghost5/web/hag5_visualizer.html")
-
-    # Creiamo la cartella /www/community/haghost5/ se non esiste
-    dst_dir = hass.config.path("www", "community", "haghost5")
-    os.makedirs(dst_dir, exist_ok=True)
-
-    dst_file = os.path.join(dst_dir, "hag5_visualizer.html")
+    hub = hass.data.get(DOMAIN, {}).pop(entry.entry_id, None)
+    if hub is not None:
+        hass.data[DOMAIN]["job_queue"].detach_hub(hub)
+        await hub.async_stop()
 
+    # Senza questa entry il limite torna a quello delle altre stampanti
+    _apply_upload_limit(hass, exclude=entry.entry_id)
 
-
-    try:
-        shutil.copyfile(src_file, dst_file)
-        _LOGGER.info("Copied hag5_visualizer.html to %s", dst_file)
-    except Exception as e:
-        _LOGGER.error("Error copying hag5_visualizer.html: %s", e)
-
-def copy_renderer_card_page(hass: HomeAssistant):
-    """
-    Copia il file 'hag5-renderer-card.js' dalla cartella custom_components/haghost5/web/
-    in config/www/community/haghost5/hag5-renderer-card/hag5-renderer-card.js,
-    in modo che sia accessibile via /local/community/haghost5/hag5-renderer-card/hag5-renderer-card.js
-    """
-    src_file = hass.config.path("custom_components/haghost5/web/hag5-renderer-card.js")
-
-    # Creiamo la cartella /www/community/haghost5/hag5-renderer-card/ se non esiste
-    dst_dir = hass.config.path("www", "community", "haghost5", "hag5-renderer-card")
-    os.makedirs(dst_dir, exist_ok=True)
-
-    dst_file = os.path.join(dst_dir, "hag5-renderer-card.js")
-
-    try:
-        shutil.copyfile(src_file, dst_file)
-        _LOGGER.info("Copied hag5-renderer-card.js to %s", dst_file)
-    except Exception as e:
-        _LOGGER.error("Error copying hag5-renderer-card.js: %s", e)
-
-
-def copy_operations_page(hass: HomeAssistant):
-    """
-    Copia il file 'hag5-operations.html' dalla cartella custom_components/haghost5/web/
-    in config/www/community/haghost5/hag5-operations.html, 
-    in modo che sia accessibile via /local/community/haghost5/hag5-operations.html
-    """
-    src_file = hass.config.path("custom_components/haghost5/web/hag5-operations.html")
-
-    # Creiamo la cartella /www/community/haghost5/ se non esiste
-    dst_dir = hass.config.path("www", "community", "haghost5")
-    os.makedirs(dst_dir, exist_ok=True)
-
-    dst_file = os.path.join(dst_dir, "hag5-operations.html")
-
-    try:
-        shutil.copyfile(src_file, dst_file)
-        _LOGGER.info("Copied hag5-operations.html to %s", dst_file)
-    except Exception as e:
-        _LOGGER.error("Error copying hag5-operations.html: %s", e)
-
-def copy_operations_card(hass: HomeAssistant):
-    """
-    Copia il file 'hag5-operations-card.js' dalla cartella custom_components/haghost5/web/
-    in config/www/community/haghost5/hag5-operations-card/hag5-operations-card.js,
-    in modo che sia accessibile via /local/community/haghost5/hag5-operations-card/hag5-operations-card.js
-    """
-    src_file = hass.config.path("custom_components/haghost5/web/hag5-operations-card.js")
-
-    # Creiamo la cartella /www/community/haghost5/hag5-operations-card/ se non esiste
-    dst_dir = hass.config.path("www", "community", "haghost5", "hag5-operations-card")
-    os.makedirs(dst_dir, exist_ok=True)
-
-    dst_file = os.path.join(dst_dir, "hag5-operations-card.js")
-
-    try:
-        shutil.copyfile(src_file, dst_file)
-        _LOGGER.info("Copied hag5-operations-card.js to %s", dst_file)
-    except Exception as e:
-        _LOGGER.error("Error copying hag5-operations-card.js: %s", e)
-
+    return True
@@ -1,119 +1,474 @@
 # api.py
 
 import time
-from homeassistant.components.http import HomeAssistantView
-from aiohttp import web, ClientSession
+from functools import lru_cache
+from homeassistant.components.http import KEY_AUTHENTICATED, HomeAssistantView
+from homeassistant.helpers.aiohttp_client import async_get_clientsession
+from aiohttp import web, hdrs, ClientTimeout
 import asyncio
+import gzip
 import os
 import logging
+import shutil
+import tempfile
+
+try:
+    import brotli
+except ImportError:  # brotli è opzionale: senza, si generano solo le copie .gz
+    brotli = None
 
 from .const import DOMAIN
 from .const import UPLOAD_URL
-from .sensor import PrinterStatusSensor
+from .const import EVENT_UPLOAD_PROGRESS
+from .const import DEFAULT_MAX_CONCURRENT_UPLOADS
+from .hub import get_hub
+from .gcode_index import ensure_index, file_sha256, read_layers
+from .toolpath import ensure_toolpath, parse_moves
+from .estimator import ensure_estimate
+from .telemetry import CHANNELS as TELEMETRY_CHANNELS
 
 _LOGGER = logging.getLogger(__name__)
 
+UPLOAD_CHUNK_SIZE = 64 * 1024
+UPLOAD_QUEUE_CHUNKS = 8          # blocchi in volo per ciascun consumatore
+UPLOAD_READ_TIMEOUT = 120        # secondi senza risposta dalla stampante
+UPLOAD_PROGRESS_INTERVAL = 0.5   # secondi tra due eventi di avanzamento
+
+# Sotto questa dimensione non vale la pena generare copie compresse
+SIDECAR_MIN_SIZE = 64 * 1024
+
+# Chiavi in hass.data[DOMAIN] del limite condiviso sugli upload contemporanei
+UPLOAD_SLOTS_KEY = "upload_slots"
+UPLOAD_LIMIT_KEY = "upload_limit"
+
+# Terminatori delle code di upload: _END conferma il file, _ABORT lo scarta
+_END = None
+_ABORT = object()
+
 class GCodeUploadAndPrintView(HomeAssistantView):
+    """
+    Endpoint:
+      POST /api/haghost5/upload_and_print?printer=<entry id o IP>[&size=<byte>]
+
+    Una sola view per tutte le stampanti: ?printer= sceglie la destinazione
+    e si può omettere solo se è configurata una sola stampante.
+    """
+
     url = "/api/haghost5/upload_and_print"
     name = "api:haghost5:upload_and_print"
     requires_auth = False
 
-    def __init__(self, ip_address):
-        self._ip_address = ip_address
-
-    def _get_sensor_ref(self, hass):
-        sensor_ref = hass.data[DOMAIN].get("printer_status_sensor")
-        if not sensor_ref or not isinstance(sensor_ref, PrinterStatusSensor):
-            _LOGGER.warning("PrinterStatusSensor non trovato o non valido.")
-            return None
-        return sensor_ref
+    def __init__(self, upload_slots=None):
+        # Senza semaforo esplicito si usa quello di hass.data, che segue le opzioni
+        self._upload_slots = upload_slots
 
     async def post(self, request):
+        """
+        Riceve il file in streaming e lo inoltra contemporaneamente al disco
+        locale e alla stampante, a blocchi di UPLOAD_CHUNK_SIZE.
+
+        La memoria usata è limitata dalle due code (UPLOAD_QUEUE_CHUNKS blocchi
+        ciascuna) indipendentemente dalla dimensione del file. Se il client
+        passa ?size=<byte> l'upload verso la stampante usa Content-Length,
+        altrimenti chunked transfer encoding.
+        """
+        hub = get_hub(request.app["hass"], request.query.get("printer"))
+        if hub is None:
+            return web.Response(text="Unknown printer, pass ?printer=<entry id or IP>", status=400)
+        upload_slots = self._upload_slots or get_upload_slots(request.app["hass"])
+        if upload_slots.locked():
+            return _too_many_uploads()
+        async with upload_slots:
+            return await self._handle_upload(request, hub)
+
+    async def _handle_upload(self, request, hub):
         hass = request.app["hass"]
+        ip_address = hub.ip_address
 
-        data = await request.post()
-        file_field = data.get("file")
-        if not file_field:
+        reader = await request.multipart()
+        file_field = await _next_file_field(reader)
+        if file_field is None:
             return web.Response(text="No file provided", status=400)
 
-        filename = file_field.filename
-        file_bytes = file_field.file.read()
+        filename = os.path.basename(file_field.filename)
+        try:
+            total = int(request.query["size"]) if "size" in request.query else None
+        except ValueError:
+            return web.Response(text="Invalid parameter ?size=", status=400)
 
         _LOGGER.info("Received file for upload_and_print: %s", filename)
 
-        # Salvo localmente
         # Salvo localmente nella directory corretta
         gcodes_dir = hass.config.path("www", "community", "haghost5", "gcodes")
-        os.makedirs(gcodes_dir, exist_ok=True)  # Crea la directory se non esiste
-        
+        await hass.async_add_executor_job(os.makedirs, gcodes_dir, 0o755, True)
         save_path = os.path.join(gcodes_dir, filename)
-        try:
-            def _write_file(path, data):
-                with open(path, "wb") as f:
-                    f.write(data)
-        
-            await hass.async_add_executor_job(_write_file, save_path, file_bytes)
+
+        upload_url = _printer_upload_url(ip_address, filename)
+        _LOGGER.debug("Uploading to printer at: %s", upload_url)
+
+        disk_queue = asyncio.Queue(maxsize=UPLOAD_QUEUE_CHUNKS)
+        printer_queue = asyncio.Queue(maxsize=UPLOAD_QUEUE_CHUNKS)
+        progress = _UploadProgress(hass, filename, total, ip_address)
+
+        disk_task = asyncio.create_task(_write_chunks(hass, save_path, disk_queue))
+        printer_task = asyncio.create_task(
+            _post_chunks(async_get_clientsession(hass), upload_url, printer_queue, total, progress)
+        )
+
+        read_error = await _pump_chunks(file_field, (disk_queue, printer_queue))
+        disk_error, resp = await asyncio.gather(disk_task, printer_task)
+
+        if read_error is not None:
+            _LOGGER.error("Error reading upload stream: %s", read_error)
+            progress.fire("error")
+            return web.Response(text=f"Error reading upload: {read_error}", status=400)
+
+        if disk_error is not None:
+            _LOGGER.error("Error saving file: %s", disk_error)
+        else:
             _LOGGER.info("File saved successfully to %s", save_path)
+            _schedule_preprocess(hass, save_path, hub.estimator_params)
+
+        if isinstance(resp, web.Response):
+            progress.fire("error")
+            return resp
+
+        _LOGGER.info("File uploaded successfully: %s", filename)
+        progress.fire("done")
+        # Conferma dalla stampante invece di attendere il polling
+        state = await hub.async_refresh_status()
+        status = f" (printer status: {state})" if state else ""
+        return web.Response(text=f"File {filename} uploaded to printer {ip_address} and print started!{status}")
+
+
+def _printer_upload_url(ip_address, filename):
+    current_timestamp = int(time.time())  # Ottiene il timestamp corrente (secondi dall'epoca)
+    return f"http://{ip_address}/upload?X-Filename={filename}&timestamp={current_timestamp}"
+
+
+async def upload_file_to_printer(hass, ip_address, path):
+    """
+    Invia alla stampante un file già salvato in locale; la stampa parte a
+    fine upload. Il file è letto a blocchi nell'executor, con la stessa coda
+    limitata dell'upload diretto. Ritorna None o il messaggio d'errore.
+    """
+    filename = os.path.basename(path)
+    try:
+        total = await hass.async_add_executor_job(os.path.getsize, path)
+    except OSError as e:
+        return f"Cannot read {filename}: {e}"
+
+    upload_url = _printer_upload_url(ip_address, filename)
+    _LOGGER.debug("Uploading to printer at: %s", upload_url)
+    queue = asyncio.Queue(maxsize=UPLOAD_QUEUE_CHUNKS)
+    progress = _UploadProgress(hass, filename, total, ip_address)
+    printer_task = asyncio.create_task(
+        _post_chunks(async_get_clientsession(hass), upload_url, queue, total, progress)
+    )
+    read_error = await _pump_file(hass, path, queue)
+    resp = await printer_task
+
+    if read_error is not None:
+        progress.fire("error")
+        return f"Error reading {filename}: {read_error}"
+    if isinstance(resp, web.Response):
+        progress.fire("error")
+        return resp.text
+    progress.fire("done")
+    return None
+
+
+async def _pump_file(hass, path, queue):
+    """Come _pump_chunks, ma la sorgente è un file locale letto nell'executor."""
+    read_error = None
+    f = None
+    try:
+        f = await hass.async_add_executor_job(open, path, "rb")
+        while True:
+            chunk = await hass.async_add_executor_job(f.read, UPLOAD_CHUNK_SIZE)
+            if not chunk:
+                break
+            await queue.put(chunk)
+    except Exception as e:
+        read_error = e
+    finally:
+        if f is not None:
+            await hass.async_add_executor_job(f.close)
+        await queue.put(_END if read_error is None else _ABORT)
+    return read_error
+
+
+def set_upload_limit(hass, limit):
+    """
+    Imposta il numero di upload contemporanei, condiviso da view e coda di
+    stampa. Se cambia il semaforo viene sostituito: gli upload in corso
+    finiscono sul vecchio, i successivi usano il nuovo limite.
+    """
+    data = hass.data.setdefault(DOMAIN, {})
+    if data.get(UPLOAD_SLOTS_KEY) is None or data.get(UPLOAD_LIMIT_KEY) != limit:
+        data[UPLOAD_SLOTS_KEY] = asyncio.Semaphore(limit)
+        data[UPLOAD_LIMIT_KEY] = limit
+    return data[UPLOAD_SLOTS_KEY]
+
+
+def get_upload_slots(hass):
+    """Semaforo corrente degli upload, letto ad ogni richiesta."""
+    slots = hass.data.get(DOMAIN, {}).get(UPLOAD_SLOTS_KEY)
+    if slots is None:
+        slots = set_upload_limit(hass, DEFAULT_MAX_CONCURRENT_UPLOADS)
+    return slots
+
+
+async def _next_file_field(reader):
+    """Scorre le parti multipart fino al campo 'file'."""
+    while True:
+        part = await reader.next()
+        if part is None:
+            return None
+        if part.name == "file" and part.filename:
+            return part
+        await part.release()
+
+
+def _preprocess_gcode(path, estimator_params=None):
+    """
+    Stima dei tempi, toolpath binario e indice dei layer (bloccante, da
+    eseguire nell'executor). I tre condividono un solo parsing; la stima,
+    che serve ai sensori ETA, viene prima e non attende l'indice.
+    """
+    load_moves = lru_cache(maxsize=1)(parse_moves)
+    sha256 = file_sha256(path)
+    ensure_estimate(path, sha256, load_moves=load_moves, **(estimator_params or {}))
+    ensure_toolpath(path, sha256, load_moves)
+    ensure_index(path, load_moves)
+
+
+def _prepare_toolpath(path):
+    """Toolpath del file (bloccante); indice e toolpath mancanti condividono il parsing."""
+    load_moves = lru_cache(maxsize=1)(parse_moves)
+    index = ensure_index(path, load_moves)
+    return ensure_toolpath(path, index["sha256"], load_moves)
+
+
+def _schedule_preprocess(hass, path, estimator_params=None):
+    """Prepara in background indice, toolpath e stima dei tempi del file appena caricato."""
+
+    async def _build():
+        try:
+            await hass.async_add_executor_job(_preprocess_gcode, path, estimator_params)
         except Exception as e:
-            _LOGGER.error("Error saving file: %s", e)
-            return web.Response(text=f"Error saving file: {e}", status=500)
-        
-        
-        # Upload asincrono alla stampante
-        current_timestamp = int(time.time())  # Ottiene il timestamp corrente (secondi dall'epoca)
-        upload_url = f"http://{self._ip_address}/upload?X-Filename={filename}&timestamp={current_timestamp}"
-        _LOGGER.debug("Uploading to printer at: %s", upload_url)
+            _LOGGER.warning("Unable to preprocess '%s': %s", path, e)
+
+    hass.async_create_background_task(_build(), f"haghost5 preprocess {os.path.basename(path)}")
+
+
+def _too_many_uploads():
+    return web.Response(
+        text="Too many uploads in progress, retry later.",
+        status=503,
+        headers={"Retry-After": "10"},
+    )
+
+
+async def _pump_chunks(file_field, queues):
+    """
+    Legge il campo multipart a blocchi e li mette in tutte le code.
+
+    Chiude sempre le code con _END (upload completo) o _ABORT (errore in
+    lettura) e ritorna l'eventuale errore.
+    """
+    read_error = None
+    try:
+        while True:
+            chunk = await file_field.read_chunk(UPLOAD_CHUNK_SIZE)
+            if not chunk:
+                break
+            # put() attende se un consumatore è indietro: backpressure sul client
+            for queue in queues:
+                await queue.put(chunk)
+    except Exception as e:
+        read_error = e
+    finally:
+        # I consumatori drenano sempre fino al terminatore, quindi put() non resta bloccato
+        terminator = _END if read_error is None else _ABORT
+        for queue in queues:
+            await queue.put(terminator)
+    return read_error
+
+
+async def _drain(queue):
+    """Consuma la coda fino al terminatore, così il produttore non resta bloccato."""
+    while True:
+        chunk = await queue.get()
+        if chunk is _END or chunk is _ABORT:
+            return
+
+
+def _open_temp(path):
+    """Crea un file temporaneo nascosto nella stessa cartella di destinazione."""
+    directory, name = os.path.split(path)
+    fd, temp_path = tempfile.mkstemp(prefix=f".{name}.", suffix=".part", dir=directory)
+    return os.fdopen(fd, "wb"), temp_path
+
+
+def _commit_temp(f, temp_path, path):
+    f.close()
+    os.replace(temp_path, path)
+    # Le copie compresse del file precedente non sono più valide
+    _remove_sidecars(path)
+
+
+def _discard_temp(f, temp_path):
+    f.close()
+    try:
+        os.remove(temp_path)
+    except OSError:
+        pass
+
+
+async def _write_chunks(hass, path, queue):
+    """
+    Scrive su disco i blocchi della coda fuori dal loop, in un file
+    temporaneo che viene rinominato atomicamente su path solo a upload
+    completo. Ritorna l'eventuale errore.
+    """
+    try:
+        f, temp_path = await hass.async_add_executor_job(_open_temp, path)
+    except Exception as e:
+        await _drain(queue)
+        return e
+    error = None
+    while True:
+        chunk = await queue.get()
+        if chunk is _END or chunk is _ABORT:
+            break
+        if error is None:
+            try:
+                await hass.async_add_executor_job(f.write, chunk)
+            except Exception as e:
+                error = e
+
+    if chunk is _END and error is None:
         try:
-            async with ClientSession() as session:
-                async with session.post(upload_url, data=file_bytes, timeout=120) as resp:
-                    if resp.status == 200:
-                        try:
-                            resp_json = await resp.json()
-                            _LOGGER.debug("Printer response JSON: %s", resp_json)
-                        except Exception as e:
-                            _LOGGER.error("Failed to parse printer response as JSON: %s", e)
-                            return web.Response(
-                                text=f"Failed to parse printer response: {e}",
-                                status=500
-                            )
-                        if resp_json.get("err") == 0:
-                            _LOGGER.info("File uploaded successfully: %s", filename)
-
-                        else:
-                            _LOGGER.error("Printer returned error: %s", resp_json)
-                            return web.Response(
-                                text=f"Printer returned error: {resp_json}",
-                                status=500
-                            )
-                    else:
-                        _LOGGER.error("Printer upload failed with status: %d", resp.status)
-                        return web.Response(
-                            text=f"Printer upload failed with status: {resp.status}",
-                            status=500
-                        )
-        except asyncio.TimeoutError:
-            _LOGGER.error("Timeout while uploading file to printer.")
-            return web.Response(text="Timeout while uploading file to printer.", status=504)
+            await hass.async_add_executor_job(_commit_temp, f, temp_path, path)
+            return None
         except Exception as e:
-            _LOGGER.error("Exception uploading file to printer: %s", e)
-            return web.Response(text=f"Exception uploading file: {e}", status=500)
+            error = e
+    await hass.async_add_executor_job(_discard_temp, f, temp_path)
+    return error if error is not None else ValueError("upload aborted")
 
 
+async def _post_chunks(session, upload_url, queue, total, progress):
+    """
+    Invia alla stampante i blocchi della coda.
 
-        return web.Response(text=f"File {filename} uploaded to printer {self._ip_address} and print started!")
+    Ritorna None se la stampante risponde {"err": 0}, altrimenti una
+    web.Response d'errore da restituire al client.
+    """
+    finished = False
+
+    async def body():
+        nonlocal finished
+        while True:
+            chunk = await queue.get()
+            if chunk is _END:
+                finished = True
+                return
+            if chunk is _ABORT:
+                # Interrompe la richiesta: la stampante non deve tenere un file troncato
+                finished = True
+                raise ValueError("upload aborted by client")
+            progress.advance(len(chunk))
+            yield chunk
+
+    headers = {"Content-Length": str(total)} if total is not None else None
+    timeout = ClientTimeout(total=None, sock_connect=10, sock_read=UPLOAD_READ_TIMEOUT)
+    try:
+        async with session.post(upload_url, data=body(), headers=headers, timeout=timeout) as resp:
+            if resp.status != 200:
+                _LOGGER.error("Printer upload failed with status: %d", resp.status)
+                return web.Response(
+                    text=f"Printer upload failed with status: {resp.status}",
+                    status=500
+                )
+            try:
+                resp_json = await resp.json(content_type=None)
+                _LOGGER.debug("Printer response JSON: %s", resp_json)
+            except Exception as e:
+                _LOGGER.error("Failed to parse printer response as JSON: %s", e)
+                return web.Response(
+                    text=f"Failed to parse printer response: {e}",
+                    status=500
+                )
+            if resp_json.get("err") != 0:
+                _LOGGER.error("Printer returned error: %s", resp_json)
+                return web.Response(
+                    text=f"Printer returned error: {resp_json}",
+                    status=500
+                )
+            return None
+    except asyncio.TimeoutError:
+        _LOGGER.error("Timeout while uploading file to printer.")
+        return web.Response(text="Timeout while uploading file to printer.", status=504)
+    except Exception as e:
+        _LOGGER.error("Exception uploading file to printer: %s", e)
+        return web.Response(text=f"Exception uploading file: {e}", status=500)
+    finally:
+        if not finished:
+            await _drain(queue)
+
+
+class _UploadProgress:
+    """Conta i byte inviati alla stampante e notifica l'avanzamento sul bus di HA."""
+
+    def __init__(self, hass, filename, total, ip_address):
+        self._hass = hass
+        self._filename = filename
+        self._ip_address = ip_address
+        self._total = total
+        self._sent = 0
+        self._last_fire = 0.0
+
+    def advance(self, size):
+        self._sent += size
+        now = time.monotonic()
+        if now - self._last_fire >= UPLOAD_PROGRESS_INTERVAL:
+            self._last_fire = now
+            self.fire("uploading")
+
+    def fire(self, stage):
+        self._hass.bus.async_fire(
+            EVENT_UPLOAD_PROGRESS,
+            {
+                "ip_address": self._ip_address,
+                "filename": self._filename,
+                "sent": self._sent,
+                "total": self._total,
+                "stage": stage,
+            },
+        )
 
 class HAG5GetGcodeFile(HomeAssistantView):
     """
     Endpoint:
       GET /api/haghost5/get_gcode_file?filename=<nome>.gcode
 
-    Legge il file .gcode da config/gcodes/<filename> e lo restituisce in plain text
+    Restituisce il file .gcode da www/community/haghost5/gcodes/<filename>.
+
+    Il file è servito con FileResponse (sendfile), quindi con supporto a
+    Range, ETag/If-None-Match e Last-Modified/If-Modified-Since. Alla prima
+    richiesta viene generata in background una copia .gz (e .br se il modulo
+    brotli è disponibile) accanto al file, servita ai client che la accettano.
     """
 
     url = "/api/haghost5/get_gcode_file"
     name = "api:haghost5:get_gcode_file"
     requires_auth = False  # o True se vuoi che sia accessibile solo a utenti loggati
 
+    def __init__(self, precompress=True):
+        self._precompress = precompress
+        self._compressing = set()
+
     async def get(self, request):
         hass = request.app["hass"]
 
@@ -122,26 +477,214 @@ class HAG5GetGcodeFile(HomeAssistantView):
         if not filename:
             return web.Response(text="Missing parameter ?filename=", status=400)
 
-        # 2) Costruisce il path nel filesystem
-        gcodes_dir = hass.config.path("gcodes")
-        file_path = os.path.join(gcodes_dir, filename)
+        # 2) Costruisce il path nel filesystem (senza uscire dalla cartella gcodes)
+        gcodes_dir = hass.config.path("www", "community", "haghost5", "gcodes")
+        file_path = os.path.join(gcodes_dir, os.path.basename(filename))
 
-        # 3) Controlla che il file esista
-        if not os.path.isfile(file_path):
+        # 3) Controlla che il file esista ed elimina eventuali copie compresse obsolete
+        size = await hass.async_add_executor_job(_prepare_gcode_file, file_path)
+        if size is None:
             return web.Response(text=f"File '{filename}' not found.", status=404)
 
         _LOGGER.debug("Serving GCODE file: %s", file_path)
 
-        # 4) Legge il file in modalità testo e lo ritorna
+        if self._precompress and size >= SIDECAR_MIN_SIZE and file_path not in self._compressing:
+            self._compressing.add(file_path)
+            hass.async_create_background_task(
+                self._build_sidecars(hass, file_path), f"haghost5 compress {filename}"
+            )
+
+        # 4) sendfile + Range/ETag gestiti da aiohttp; il client rivalida sempre con l'ETag
+        return web.FileResponse(
+            file_path,
+            headers={
+                hdrs.CONTENT_TYPE: "text/plain; charset=utf-8",
+                hdrs.CACHE_CONTROL: "no-cache",
+            },
+        )
+
+    async def _build_sidecars(self, hass, file_path):
+        try:
+            await hass.async_add_executor_job(_build_sidecars, file_path)
+        except Exception as e:
+            _LOGGER.warning("Unable to precompress '%s': %s", file_path, e)
+        finally:
+            self._compressing.discard(file_path)
+
+
+class HAG5GcodeIndexView(HomeAssistantView):
+    """
+    Endpoint:
+      GET /api/haghost5/gcode_index?filename=<nome>.gcode
+      GET /api/haghost5/gcode_index?filename=<nome>.gcode&layers=<da>-<a>
+
+    Senza 'layers' ritorna l'indice JSON del file (offset in byte e Z di ogni
+    layer, movimenti, estrusione, bounding box), con un ETag: a una richiesta
+    con If-None-Match uguale risponde 304. Con 'layers' ritorna il
+    G-code dei soli layer richiesti (estremi inclusi, a partire da 0).
+    L'indice viene costruito alla prima richiesta se manca.
+    """
+
+    url = "/api/haghost5/gcode_index"
+    name = "api:haghost5:gcode_index"
+    requires_auth = False
+
+    async def get(self, request):
+        hass = request.app["hass"]
+
+        filename = request.query.get("filename")
+        if not filename:
+            return web.Response(text="Missing parameter ?filename=", status=400)
+
+        gcodes_dir = hass.config.path("www", "community", "haghost5", "gcodes")
+        file_path = os.path.join(gcodes_dir, os.path.basename(filename))
+        if not await hass.async_add_executor_job(os.path.isfile, file_path):
+            return web.Response(text=f"File '{filename}' not found.", status=404)
+
         try:
-            with open(file_path, "r", encoding="utf-8", errors="replace") as f:
-                file_content = f.read()
+            index = await hass.async_add_executor_job(ensure_index, file_path)
         except Exception as e:
-            _LOGGER.error("Error reading GCODE file '%s': %s", file_path, e)
-            return web.Response(text=f"Error reading file: {e}", status=500)
+            _LOGGER.error("Error indexing GCODE file '%s': %s", file_path, e)
+            return web.Response(text=f"Error indexing file: {e}", status=500)
+
+        layers = request.query.get("layers")
+        if layers is None:
+            # Contenuto e formato dell'indice: cambia col file o con INDEX_VERSION
+            etag = f'"{index["sha256"]}-{index["version"]}"'
+            headers = {hdrs.ETAG: etag, hdrs.CACHE_CONTROL: "no-cache"}
+            if etag in request.headers.get(hdrs.IF_NONE_MATCH, ""):
+                return web.Response(status=304, headers=headers)
+            return web.json_response(index, headers=headers)
+
+        first, sep, last = layers.partition("-")
+        try:
+            first = int(first)
+            last = int(last) if sep else first
+        except ValueError:
+            return web.Response(text="Invalid parameter ?layers=<from>-<to>", status=400)
+
+        data = await hass.async_add_executor_job(read_layers, file_path, index, first, last)
+        return web.Response(body=data, content_type="text/plain", charset="utf-8")
 
-        # 5) Risponde con il contenuto, come text/plain
-        return web.Response(text=file_content, content_type="text/plain")
+
+class HAG5ToolpathView(HomeAssistantView):
+    """
+    Endpoint:
+      GET /api/haghost5/toolpath?filename=<nome>.gcode
+
+    Restituisce il toolpath binario del file (vedi toolpath.py) come
+    application/octet-stream, pronto per un BufferGeometry di Three.js.
+    Viene generato alla prima richiesta se non è già stato preparato all'upload.
+    """
+
+    url = "/api/haghost5/toolpath"
+    name = "api:haghost5:toolpath"
+    requires_auth = False
+
+    async def get(self, request):
+        hass = request.app["hass"]
+
+        filename = request.query.get("filename")
+        if not filename:
+            return web.Response(text="Missing parameter ?filename=", status=400)
+
+        gcodes_dir = hass.config.path("www", "community", "haghost5", "gcodes")
+        file_path = os.path.join(gcodes_dir, os.path.basename(filename))
+        if not await hass.async_add_executor_job(os.path.isfile, file_path):
+            return web.Response(text=f"File '{filename}' not found.", status=404)
+
+        try:
+            toolpath_file = await hass.async_add_executor_job(_prepare_toolpath, file_path)
+        except Exception as e:
+            _LOGGER.error("Error building toolpath for '%s': %s", file_path, e)
+            return web.Response(text=f"Error building toolpath: {e}", status=500)
+
+        return web.FileResponse(
+            toolpath_file,
+            headers={
+                hdrs.CONTENT_TYPE: "application/octet-stream",
+                hdrs.CACHE_CONTROL: "no-cache",
+            },
+        )
+
+
+def _sidecar_encoders():
+    """(estensione, factory del compressore) disponibili."""
+    encoders = [(".gz", lambda f: gzip.GzipFile(fileobj=f, mode="wb", compresslevel=6))]
+    if brotli is not None:
+        encoders.append((".br", _BrotliWriter))
+    return encoders
+
+
+class _BrotliWriter:
+    """Adattatore file-like per brotli.Compressor, usabile con shutil.copyfileobj."""
+
+    def __init__(self, f):
+        self._f = f
+        self._compressor = brotli.Compressor(quality=5)
+
+    def write(self, data):
+        self._f.write(self._compressor.process(data))
+
+    def close(self):
+        self._f.write(self._compressor.finish())
+
+
+def _sidecar_paths(path):
+    return [path + ".gz", path + ".br"]
+
+
+def _remove_sidecars(path):
+    for sidecar in _sidecar_paths(path):
+        try:
+            os.remove(sidecar)
+        except OSError:
+            pass
+
+
+def _prepare_gcode_file(path):
+    """Ritorna la dimensione del file (None se non esiste) e rimuove le copie compresse più vecchie."""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    if not os.path.isfile(path):
+        return None
+    for sidecar in _sidecar_paths(path):
+        try:
+            if os.stat(sidecar).st_mtime_ns < st.st_mtime_ns:
+                os.remove(sidecar)
+        except OSError:
+            pass
+    return st.st_size
+
+
+def _build_sidecars(path):
+    """Genera le copie compresse mancanti, scrivendo su file temporaneo + rename."""
+    directory, name = os.path.split(path)
+    source_mtime = os.stat(path).st_mtime_ns
+    for ext, encoder in _sidecar_encoders():
+        sidecar = path + ext
+        if os.path.exists(sidecar):
+            continue
+        fd, temp_path = tempfile.mkstemp(prefix=f".{name}.", suffix=ext, dir=directory)
+        try:
+            with os.fdopen(fd, "wb") as raw, open(path, "rb") as src:
+                writer = encoder(raw)
+                shutil.copyfileobj(src, writer, UPLOAD_CHUNK_SIZE)
+                writer.close()
+            if os.stat(path).st_mtime_ns != source_mtime:
+                # Il file è stato sostituito durante la compressione
+                os.remove(temp_path)
+                return
+            os.replace(temp_path, sidecar)
+            _LOGGER.debug("Created precompressed copy %s", sidecar)
+        except Exception:
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+            raise
 
 
 class GCodeUploadView(HomeAssistantView):
@@ -152,38 +695,188 @@ class GCodeUploadView(HomeAssistantView):
         <input type="file" name="file" />
         <button type="submit">Invia</button>
       </form>
+
+    Il file viene scritto a blocchi fuori dal loop di HA in un file temporaneo,
+    rinominato solo a upload completo: il visualizer non vede mai file troncati.
+
+    Con ?queue=<entry id o IP> oppure ?queue=any il file viene anche messo
+    nella coda di stampa, per quella stampante o per la prima libera: solo
+    per richieste autenticate, come gli endpoint della coda.
     """
 
     url = "/api/haghost5/upload_gcode"  # Aggiungi il percorso URL
     name = "api:haghost5:upload_gcode"
     requires_auth = False  # Richiede login su HA
 
+    def __init__(self, upload_slots=None):
+        # Senza semaforo esplicito si usa quello di hass.data, che segue le opzioni
+        self._upload_slots = upload_slots
+
     async def post(self, request):
         """Handle POST request for file upload."""
+        if "queue" in request.query and not request.get(KEY_AUTHENTICATED, False):
+            return web.Response(text="Authentication required to queue a print job", status=401)
+        upload_slots = self._upload_slots or get_upload_slots(request.app["hass"])
+        if upload_slots.locked():
+            return _too_many_uploads()
+        async with upload_slots:
+            return await self._handle_upload(request)
+
+    async def _handle_upload(self, request):
         hass = request.app["hass"]
 
-        data = await request.post()
-        file_field = data.get("file")
-        if not file_field:
+        reader = await request.multipart()
+        file_field = await _next_file_field(reader)
+        if file_field is None:
             return web.Response(text="No file provided", status=400)
 
-        filename = file_field.filename
+        filename = os.path.basename(file_field.filename)
         _LOGGER.info("Received GCODE file: %s", filename)
 
-        file_content = file_field.file.read()
-
         # Nuovo percorso per la cartella GCODE
         save_dir = hass.config.path("www", "community", "haghost5", "gcodes")
-        os.makedirs(save_dir, exist_ok=True)  # Crea la directory se non esiste
+        await hass.async_add_executor_job(os.makedirs, save_dir, 0o755, True)
 
         # Salviamo il file nella nuova directory
         save_path = os.path.join(save_dir, filename)
 
+        queue = asyncio.Queue(maxsize=UPLOAD_QUEUE_CHUNKS)
+        writer = asyncio.create_task(_write_chunks(hass, save_path, queue))
+        read_error = await _pump_chunks(file_field, (queue,))
+        write_error = await writer
+
+        if read_error is not None:
+            _LOGGER.error("Error reading upload stream: %s", read_error)
+            return web.Response(text=f"Error reading upload: {read_error}", status=400)
+        if write_error is not None:
+            _LOGGER.error("Error writing file: %s", write_error)
+            return web.Response(text=f"Error writing file: {write_error}", status=500)
+
+        # Stima col modello della stampante di destinazione, se nota
+        target = request.query.get("queue")
+        hub = get_hub(hass, None if target in (None, "", "any") else target)
+        _schedule_preprocess(hass, save_path, hub.estimator_params if hub else None)
+
+        if "queue" in request.query:
+            try:
+                job = hass.data[DOMAIN]["job_queue"].add(filename, request.query["queue"])
+            except ValueError as e:
+                return web.Response(text=f"File {filename} uploaded, not queued: {e}", status=400)
+            return web.json_response(job)
+        return web.Response(text=f"File {filename} uploaded successfully.")
+
+
+class HAG5JobsView(HomeAssistantView):
+    """
+    Endpoint della coda di stampa:
+      GET    /api/haghost5/jobs                                  -> lista dei job
+      POST   /api/haghost5/jobs?filename=<nome>.gcode[&printer=] -> accoda un file già caricato
+      DELETE /api/haghost5/jobs?id=<job id>                      -> annulla un job in coda
+
+    Senza printer (o con printer=any) il job va alla prima stampante libera.
+    Richiede un utente autenticato: la coda avvia stampe.
+    """
+
+    url = "/api/haghost5/jobs"
+    name = "api:haghost5:jobs"
+    requires_auth = True
+
+    async def get(self, request):
+        queue = request.app["hass"].data[DOMAIN]["job_queue"]
+        return web.json_response({"jobs": queue.jobs})
+
+    async def post(self, request):
+        hass = request.app["hass"]
+        filename = request.query.get("filename")
+        if not filename:
+            return web.Response(text="Missing parameter ?filename=", status=400)
+        filename = os.path.basename(filename)
+        path = hass.config.path("www", "community", "haghost5", "gcodes", filename)
+        if not await hass.async_add_executor_job(os.path.isfile, path):
+            return web.Response(text=f"File not found: {filename}", status=404)
         try:
-            with open(save_path, "wb") as f:
-                f.write(file_content)
-        except Exception as e:
-            _LOGGER.error("Error writing file: %s", e)
-            return web.Response(text=f"Error writing file: {e}", status=500)
+            job = hass.data[DOMAIN]["job_queue"].add(filename, request.query.get("printer", "any"))
+        except ValueError as e:
+            return web.Response(text=str(e), status=400)
+        return web.json_response(job)
 
-        return web.Response(text=f"File {filename} uploaded successfully.")
+    async def delete(self, request):
+        queue = request.app["hass"].data[DOMAIN]["job_queue"]
+        if not queue.cancel(request.query.get("id", "")):
+            return web.Response(text="Job not found or not queued", status=404)
+        return web.Response(text="Job cancelled.")
+
+
+class HAG5FilesView(HomeAssistantView):
+    """
+    Endpoint:
+      GET  /api/haghost5/files?printer=<entry id o IP>  -> catalogo dei file della stampante
+      POST /api/haghost5/files?printer=<entry id o IP>  -> chiede alla stampante una nuova lista (M20)
+
+    La risposta ha un ETag che cambia solo quando cambia la lista: con
+    If-None-Match il client riceve 304 finché non c'è nulla di nuovo.
+    """
+
+    url = "/api/haghost5/files"
+    name = "api:haghost5:files"
+    requires_auth = False
+
+    async def get(self, request):
+        hub = get_hub(request.app["hass"], request.query.get("printer"))
+        if hub is None:
+            return web.Response(text="Unknown printer, pass ?printer=<entry id or IP>", status=400)
+        catalog = hub.catalog
+        headers = {"ETag": catalog.etag, "Cache-Control": "no-cache"}
+        if catalog.etag in request.headers.get(hdrs.IF_NONE_MATCH, ""):
+            return web.Response(status=304, headers=headers)
+        return web.json_response(
+            {"printer_id": hub.printer_id, **catalog.as_dict()}, headers=headers
+        )
+
+    async def post(self, request):
+        hub = get_hub(request.app["hass"], request.query.get("printer"))
+        if hub is None:
+            return web.Response(text="Unknown printer, pass ?printer=<entry id or IP>", status=400)
+        hub.request_file_list()
+        return web.Response(text="File list requested.", status=202)
+
+
+class HAG5HistoryView(HomeAssistantView):
+    """
+    Endpoint:
+      GET /api/haghost5/history?printer=<entry id o IP>&minutes=<N>[&format=binary]
+
+    Storico di temperature, target e avanzamento dalla memoria del hub, alla
+    risoluzione più fine che copre la finestra (1 s fino a 1 ora, 10 s fino
+    a 6 ore, 1 min fino a 24 ore). JSON colonnare: "t" sono i secondi da
+    "start" (epoch), una lista per canale con null dove manca il dato.
+    Con format=binary il corpo è float32 little-endian (t poi i canali,
+    nell'ordine di X-Channels) e start/risoluzione/numero di campioni
+    arrivano negli header.
+    """
+
+    url = "/api/haghost5/history"
+    name = "api:haghost5:history"
+    requires_auth = False
+
+    async def get(self, request):
+        hub = get_hub(request.app["hass"], request.query.get("printer"))
+        if hub is None:
+            return web.Response(text="Unknown printer, pass ?printer=<entry id or IP>", status=400)
+        try:
+            minutes = float(request.query.get("minutes", 60))
+        except ValueError:
+            return web.Response(text="Invalid parameter ?minutes=", status=400)
+        seconds = max(1.0, minutes * 60)
+
+        headers = {"Cache-Control": "no-cache"}
+        if request.query.get("format") == "binary":
+            resolution, start, count, body = hub.telemetry.as_binary(seconds)
+            headers.update({
+                "X-Start": repr(start),
+                "X-Resolution": str(resolution),
+                "X-Count": str(count),
+                "X-Channels": ",".join(TELEMETRY_CHANNELS),
+            })
+            return web.Response(body=body, content_type="application/octet-stream", headers=headers)
+        return web.json_response(hub.telemetry.as_columns(seconds), headers=headers)
@@ -0,0 +1,75 @@
+"""Web pages and cards synced from the package into www/community/haghost5."""
+
+import logging
+import os
+import tempfile
+
+from .gcode_index import file_sha256
+
+_LOGGER = logging.getLogger(__name__)
+
+WEB_DIR = os.path.join(os.path.dirname(__file__), "web")
+
+# File di web/ e percorso relativo in www/community/haghost5, servito da HA
+# come /local/community/haghost5/<percorso> (gli URL già usati nelle dashboard)
+WEB_ASSETS = (
+    ("hag5_upload.html", "hag5_upload.html"),
+    ("hag5_visualizer.html", "hag5_visualizer.html"),
+    ("hag5-operations.html", "hag5-operations.html"),
+    ("hag5-renderer-card.js", "hag5-renderer-card/hag5-renderer-card.js"),
+    ("hag5-operations-card.js", "hag5-operations-card/hag5-operations-card.js"),
+)
+
+
+def _same_content(src, dst):
+    try:
+        if os.path.getsize(src) != os.path.getsize(dst):
+            return False
+    except OSError:
+        return False
+    return file_sha256(src) == file_sha256(dst)
+
+
+def _copy_atomic(src, dst):
+    """Copia su file temporaneo e rinomina: il browser non legge mai un file a metà."""
+    directory, name = os.path.split(dst)
+    os.makedirs(directory, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(prefix=f".{name}.", suffix=".tmp", dir=directory)
+    try:
+        with os.fdopen(fd, "wb") as out, open(src, "rb") as f:
+            out.write(f.read())
+        os.replace(temp_path, dst)
+    except Exception:
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+        raise
+
+
+def sync_web_assets(target_dir, source_dir=WEB_DIR):
+    """
+    Allinea gli asset in www/ a quelli del pacchetto (bloccante).
+
+    Un file si copia solo se manca o se il contenuto (sha256) è diverso,
+    quindi dopo il primo avvio non si scrive nulla finché l'integrazione non
+    viene aggiornata. Crea anche la cartella dei G-code. Ritorna i percorsi
+    copiati.
+    """
+    copied = []
+    for name, relative in WEB_ASSETS:
+        src = os.path.join(source_dir, name)
+        dst = os.path.join(target_dir, relative)
+        if _same_content(src, dst):
+            continue
+        try:
+            _copy_atomic(src, dst)
+            copied.append(relative)
+        except OSError as e:
+            _LOGGER.error("Error copying %s: %s", name, e)
+    os.makedirs(os.path.join(target_dir, "gcodes"), exist_ok=True)
+    if copied:
+        _LOGGER.info("Updated web assets in %s: %s", target_dir, ", ".join(copied))
+    else:
+        _LOGGER.debug("Web assets in %s are up to date.", target_dir)
+    return copied
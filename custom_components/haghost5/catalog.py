@@ -0,0 +1,129 @@
+"""In-memory catalog of the files stored on the printer, built from M20 listings."""
+
+import asyncio
+import hashlib
+import json
+import logging
+from datetime import datetime
+
+from .router import FILE_LIST_BEGIN, FILE_LIST_END
+
+_LOGGER = logging.getLogger(__name__)
+
+# Senza righe della lista per questo tempo la lista in corso si considera chiusa
+LIST_TIMEOUT = 10
+
+
+class FileCatalog:
+    """
+    Catalogo dei file della stampante.
+
+    Le righe della risposta a M20 arrivano come FileListRecord mescolate agli
+    altri frame, quindi la lista si costruisce senza bloccare gli altri
+    comandi; valgono solo le voci tra "Begin file list" e la fine della
+    lista. A lista chiusa ("End file list") il catalogo viene confrontato
+    col precedente: se cambia si aggiornano versione, ETag e diff
+    (added/removed) e si chiama on_change(catalog, diff). Una lista interrotta
+    dal timeout aggiunge le voci ricevute ma non rimuove nulla.
+    """
+
+    def __init__(self, on_change=None):
+        self._on_change = on_change
+        self._entries = {}     # nome -> {"name", "size", "seen"}
+        self._listing = None   # voci della lista in corso
+        self._timer = None
+        self.version = 0
+        self.etag = self._compute_etag()
+        self.last_diff = {"added": [], "removed": []}
+        self.updated = None
+
+    @property
+    def files(self):
+        return sorted(self._entries.values(), key=lambda entry: entry["name"].lower())
+
+    @property
+    def names(self):
+        return [entry["name"] for entry in self.files]
+
+    def as_dict(self):
+        return {
+            "version": self.version,
+            "updated": self.updated,
+            "files": self.files,
+            "diff": self.last_diff,
+        }
+
+    def process_record(self, record, message):
+        """Handler del router per FileListRecord."""
+        if record.kind == FILE_LIST_BEGIN:
+            self._listing = {}
+            self._restart_timer()
+        elif record.kind == FILE_LIST_END:
+            if self._listing is not None:
+                self._commit(complete=True)
+        else:
+            if self._listing is None:
+                # Fuori da una lista: nomi ripetuti da M23, messaggi dei job o una
+                # lista iniziata prima della connessione, non voci del catalogo
+                return
+            self._listing[record.name] = record.size
+            self._restart_timer()
+
+    def cancel(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+    def _restart_timer(self):
+        self.cancel()
+        self._timer = asyncio.get_running_loop().call_later(LIST_TIMEOUT, self._on_timeout)
+
+    def _on_timeout(self):
+        self._timer = None
+        if self._listing:
+            _LOGGER.warning("File list timed out after %d entries, keeping a partial update.", len(self._listing))
+            self._commit(complete=False)
+        else:
+            self._listing = None
+
+    def _commit(self, complete):
+        self.cancel()
+        listing, self._listing = self._listing, None
+        now = datetime.now().isoformat()
+
+        added = [name for name in listing if name not in self._entries]
+        removed = [name for name in self._entries if name not in listing] if complete else []
+        resized = [
+            name for name, size in listing.items()
+            if name in self._entries and size is not None and self._entries[name]["size"] != size
+        ]
+
+        for name in removed:
+            del self._entries[name]
+        for name, size in listing.items():
+            entry = self._entries.get(name)
+            if entry is None:
+                self._entries[name] = {"name": name, "size": size, "seen": now}
+            elif size is not None:
+                entry["size"] = size
+
+        self.updated = now
+        if not (added or removed or resized):
+            _LOGGER.debug("File list unchanged (%d files).", len(self._entries))
+            return
+
+        self.version += 1
+        self.etag = self._compute_etag()
+        self.last_diff = {"added": sorted(added), "removed": sorted(removed)}
+        _LOGGER.info(
+            "File list updated: %d files, %d added, %d removed.",
+            len(self._entries), len(added), len(removed),
+        )
+        if self._on_change is not None:
+            self._on_change(self, self.last_diff)
+
+    def _compute_etag(self):
+        payload = json.dumps(
+            [[entry["name"], entry["size"]] for entry in self.files], separators=(",", ":")
+        )
+        return '"' + hashlib.sha1(payload.encode("utf-8")).hexdigest()[:16] + '"'
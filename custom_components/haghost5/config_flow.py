@@ -1,7 +1,22 @@
 import voluptuous as vol
 from homeassistant import config_entries
 from homeassistant.core import callback
-from .const import DOMAIN
+from .const import (
+    DOMAIN,
+    CONF_ATTRIBUTE_PROFILE,
+    CONF_MIN_PUBLISH_INTERVAL,
+    CONF_TEMPERATURE_DEADBAND,
+    CONF_MAX_CONCURRENT_UPLOADS,
+    CONF_ACCELERATION,
+    CONF_JUNCTION_DEVIATION,
+    ATTRIBUTE_PROFILES,
+    DEFAULT_ATTRIBUTE_PROFILE,
+    DEFAULT_MIN_PUBLISH_INTERVAL,
+    DEFAULT_TEMPERATURE_DEADBAND,
+    DEFAULT_MAX_CONCURRENT_UPLOADS,
+    DEFAULT_ACCELERATION,
+    DEFAULT_JUNCTION_DEVIATION,
+)
 
 class HAGhost5ConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
     """Handle the config flow for HAGhost5."""
@@ -26,6 +41,12 @@ class HAGhost5ConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
         )
         return self.async_show_form(step_id="user", data_schema=data_schema, errors=errors)
 
+    @staticmethod
+    @callback
+    def async_get_options_flow(config_entry):
+        """Return the options flow."""
+        return HAGhost5OptionsFlow(config_entry)
+
     @staticmethod
     def _is_valid_ip(ip: str) -> bool:
         """Check if the IP address is valid."""
@@ -35,3 +56,49 @@ class HAGhost5ConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
             return True
         except ValueError:
             return False
+
+
+class HAGhost5OptionsFlow(config_entries.OptionsFlow):
+    """
+    Opzioni della stampante: attributi esposti, frequenza delle scritture di
+    stato, upload contemporanei e modello cinematico per la stima dei tempi.
+    """
+
+    def __init__(self, config_entry):
+        self.config_entry = config_entry
+
+    async def async_step_init(self, user_input=None):
+        """Manage the options."""
+        if user_input is not None:
+            return self.async_create_entry(title="", data=user_input)
+
+        options = self.config_entry.options
+        data_schema = vol.Schema(
+            {
+                vol.Required(
+                    CONF_ATTRIBUTE_PROFILE,
+                    default=options.get(CONF_ATTRIBUTE_PROFILE, DEFAULT_ATTRIBUTE_PROFILE),
+                ): vol.In(ATTRIBUTE_PROFILES),
+                vol.Required(
+                    CONF_MIN_PUBLISH_INTERVAL,
+                    default=options.get(CONF_MIN_PUBLISH_INTERVAL, DEFAULT_MIN_PUBLISH_INTERVAL),
+                ): vol.All(vol.Coerce(float), vol.Range(min=0, max=60)),
+                vol.Required(
+                    CONF_TEMPERATURE_DEADBAND,
+                    default=options.get(CONF_TEMPERATURE_DEADBAND, DEFAULT_TEMPERATURE_DEADBAND),
+                ): vol.All(vol.Coerce(float), vol.Range(min=0, max=10)),
+                vol.Required(
+                    CONF_MAX_CONCURRENT_UPLOADS,
+                    default=options.get(CONF_MAX_CONCURRENT_UPLOADS, DEFAULT_MAX_CONCURRENT_UPLOADS),
+                ): vol.All(vol.Coerce(int), vol.Range(min=1, max=16)),
+                vol.Required(
+                    CONF_ACCELERATION,
+                    default=options.get(CONF_ACCELERATION, DEFAULT_ACCELERATION),
+                ): vol.All(vol.Coerce(float), vol.Range(min=10, max=20000)),
+                vol.Required(
+                    CONF_JUNCTION_DEVIATION,
+                    default=options.get(CONF_JUNCTION_DEVIATION, DEFAULT_JUNCTION_DEVIATION),
+                ): vol.All(vol.Coerce(float), vol.Range(min=0.001, max=1)),
+            }
+        )
+        return self.async_show_form(step_id="init", data_schema=data_schema)
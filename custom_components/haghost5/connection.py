@@ -0,0 +1,415 @@
+"""Persistent WebSocket transport towards the Ghost5 board."""
+
+import asyncio
+import logging
+import random
+import time
+from collections import deque
+
+from aiohttp import ClientSession, WSMsgType
+
+_LOGGER = logging.getLogger(__name__)
+
+WS_PORT = 8081
+# Attesa tra due tentativi: raddoppia a ogni tentativo fallito, con jitter
+RECONNECT_MIN = 0.5
+RECONNECT_MAX = 5
+PROBE_TIMEOUT = 2     # secondi per la connessione TCP di prova
+CONNECT_TIMEOUT = 10  # secondi per l'handshake WebSocket
+CLOSE_TIMEOUT = 1     # attesa della chiusura di un socket morto
+WRITE_QUEUE_SIZE = 64
+REQUEST_TIMEOUT = 10  # secondi di attesa della risposta a request()
+
+# Inizio della riga di risposta per i comandi che non ripetono il proprio nome
+REPLY_PREFIXES = {
+    "M20": "Begin file list",
+    "M991": "T:",
+}
+
+
+def reply_matcher(command, expect=None):
+    """
+    Predicato sulla riga di risposta attesa per command.
+
+    expect può essere un prefisso (es. "M997", "ok") o una funzione
+    riga -> bool; senza expect si usa REPLY_PREFIXES o il nome del comando.
+    L'eventuale "ok " davanti alla risposta viene ignorato, quindi "ok"
+    corrisponde solo a un ok senza altro contenuto.
+    """
+    if callable(expect):
+        return expect
+    if expect is None:
+        head = command.split(None, 1)[0] if command.strip() else ""
+        expect = REPLY_PREFIXES.get(head, head)
+
+    def match(line):
+        if line.startswith("ok "):
+            line = line[3:]
+        return line.startswith(expect)
+
+    return match
+
+
+def reconnect_delay(failures):
+    """Attesa prima del prossimo tentativo dopo failures fallimenti di fila."""
+    delay = min(RECONNECT_MAX, RECONNECT_MIN * 2 ** failures)
+    # Jitter: più stampanti che tornano insieme non si riconnettono in sincrono
+    return delay * random.uniform(0.5, 1)
+
+
+class _Request:
+    """Richiesta in attesa di risposta; sent diventa True quando il comando parte."""
+
+    __slots__ = ("command", "match", "future", "sent")
+
+    def __init__(self, command, match, future):
+        self.command = command
+        self.match = match
+        self.future = future
+        self.sent = False
+
+
+class PrinterConnection:
+    """
+    Unica connessione WebSocket per stampante.
+
+    Possiede un solo socket verso ws://<ip>:8081/ e un solo task: lo stesso
+    loop che si connette legge i frame e li passa a on_frame. I comandi
+    vengono accodati e inviati da un flush temporaneo che termina appena la
+    coda è vuota, così una stampante in attesa non tiene task aperti oltre
+    al loop di connessione.
+
+    Prima di ogni tentativo una connessione TCP di prova con timeout breve
+    verifica che la stampante sia raggiungibile; i tentativi falliti si
+    ripetono con attesa esponenziale e jitter (reconnect_delay), che torna
+    al minimo dopo una sessione in cui la stampante ha risposto. Un socket
+    rimasto aperto verso una stampante spenta viene chiuso quando un comando
+    inviato resta senza alcun frame di ritorno per stall_timeout secondi: le
+    interrogazioni periodiche del hub fanno da heartbeat, la connessione non
+    ne invia di suoi (con stall_timeout=None il controllo è spento).
+    on_state(connected) viene chiamato all'apertura e alla chiusura.
+
+    I comandi con priority=True (quelli dell'utente) passano davanti alle
+    interrogazioni periodiche; un'interrogazione identica a una ancora in
+    coda non viene accodata di nuovo.
+
+    submit() e request() inviano un comando e ne attendono la risposta:
+    ogni riga ricevuta chiude la richiesta più vecchia, già inviata, che la
+    riconosce, quindi più richieste possono essere in volo insieme e due
+    richieste uguali ricevono due risposte successive. Il frame arriva comunque anche a
+    on_frame. Senza richieste in attesa il costo per frame è un controllo
+    su una lista vuota.
+    """
+
+    def __init__(self, ip_address: str, session: ClientSession, on_frame, on_state=None, stall_timeout=None):
+        self._ip_address = ip_address
+        self._session = session
+        self._url = f"ws://{ip_address}:{WS_PORT}/"
+        self._on_frame = on_frame
+        self._on_state = on_state
+        self._stall_timeout = stall_timeout
+        # Invio del primo comando senza risposta dall'ultimo frame ricevuto
+        self._unanswered_since = None
+        self._priority = deque()
+        self._pending = deque()
+        self._flush_task = None
+        self._ws = None
+        self._task = None
+        self._connected = asyncio.Event()
+        self._requests = []  # _Request in ordine di creazione
+        # Contatori per diagnostica, sempre attivi (costano un incremento)
+        self.connects = 0
+        self.connection_errors = 0
+        self.probe_failures = 0
+        self.stalls = 0
+        self.send_errors = 0
+        self.dropped_commands = 0
+        self.backlog_peak = 0
+        # HubMetrics quando la misura dei tempi è attiva, altrimenti None
+        self.metrics = None
+
+    @property
+    def url(self):
+        return self._url
+
+    @property
+    def connected(self) -> bool:
+        return self._connected.is_set()
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self):
+        """Avvia il loop di connessione se non è già attivo."""
+        if self.running:
+            return
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Chiude il socket e ferma il loop di riconnessione."""
+        for task in (self._flush_task, self._task):
+            if task is None:
+                continue
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        self._flush_task = None
+        self._task = None
+        self._connected.clear()
+        self._fail_requests(ConnectionError("connection stopped"), sent_only=False)
+
+    @property
+    def backlog(self) -> int:
+        """Comandi in attesa di invio."""
+        return len(self._priority) + len(self._pending)
+
+    @property
+    def reconnects(self) -> int:
+        """Connessioni riuscite dopo la prima."""
+        return max(self.connects - 1, 0)
+
+    @property
+    def stats(self):
+        return {
+            "connected": self.connected,
+            "connects": self.connects,
+            "reconnects": self.reconnects,
+            "connection_errors": self.connection_errors,
+            "probe_failures": self.probe_failures,
+            "stalls": self.stalls,
+            "send_errors": self.send_errors,
+            "dropped_commands": self.dropped_commands,
+            "backlog": self.backlog,
+            "backlog_peak": self.backlog_peak,
+            "pending_requests": len(self._requests),
+        }
+
+    def send(self, command: str, priority: bool = False) -> bool:
+        """
+        Accoda un comando; viene inviato appena il socket è disponibile.
+        Ritorna False se la coda è piena e il comando è stato scartato.
+        """
+        queue = self._priority if priority else self._pending
+        if not priority and command in queue:
+            return True
+        if len(queue) >= WRITE_QUEUE_SIZE:
+            _LOGGER.warning("Write queue full for %s, dropping command: %s", self._url, command)
+            self.dropped_commands += 1
+            return False
+        queue.append(command)
+        if self.backlog > self.backlog_peak:
+            self.backlog_peak = self.backlog
+        self._schedule_flush()
+        return True
+
+    def submit(self, command: str, expect=None) -> asyncio.Future:
+        """
+        Accoda un comando davanti alle interrogazioni periodiche e ritorna
+        il future della riga di risposta riconosciuta da expect (vedi
+        reply_matcher), senza timeout.
+
+        Se il future viene cancellato prima dell'invio il comando è tolto
+        dalla coda, quindi chi rinuncia alla risposta non lo fa eseguire più
+        tardi. Solleva ConnectionError se il loop non è avviato o la coda è
+        piena.
+        """
+        if not self.running:
+            raise ConnectionError(f"WebSocket {self._url} is not started")
+        if len(self._priority) >= WRITE_QUEUE_SIZE:
+            self.dropped_commands += 1
+            raise ConnectionError(f"Write queue full for {self._url}")
+        request = _Request(command, reply_matcher(command, expect), asyncio.get_running_loop().create_future())
+        request.future.add_done_callback(lambda future: self._forget(request))
+        self._requests.append(request)
+        # La richiesta stessa va in coda: il flush la riconosce e la segna inviata
+        self._priority.append(request)
+        if self.backlog > self.backlog_peak:
+            self.backlog_peak = self.backlog
+        self._schedule_flush()
+        return request.future
+
+    async def request(self, command: str, expect=None, timeout: float = REQUEST_TIMEOUT) -> str:
+        """
+        Come submit(), ma attende la risposta e la ritorna.
+
+        Solleva asyncio.TimeoutError se la risposta non arriva entro timeout
+        e ConnectionError se il loop non è avviato, la coda è piena o il
+        socket cade dopo l'invio. Per più interrogazioni in parallelo basta
+        lanciare più request() insieme (es. con asyncio.gather).
+        """
+        return await asyncio.wait_for(self.submit(command, expect), timeout)
+
+    def _forget(self, request):
+        if request in self._requests:
+            self._requests.remove(request)
+        if not request.sent:
+            try:
+                self._priority.remove(request)
+            except ValueError:
+                pass
+
+    def _resolve_requests(self, frame):
+        """Chiude le richieste a cui rispondono le righe del frame."""
+        for line in frame.split("\n"):
+            line = line.strip()
+            if not line:
+                continue
+            for request in self._requests:
+                if request.sent and not request.future.done() and request.match(line):
+                    request.future.set_result(line)
+                    self._requests.remove(request)
+                    break
+
+    def _fail_requests(self, error, sent_only=True):
+        """
+        Fa fallire le richieste in attesa: a socket caduto solo quelle già
+        inviate (le altre partono alla riconnessione), allo stop tutte.
+        """
+        for request in list(self._requests):
+            if sent_only and not request.sent:
+                continue
+            self._requests.remove(request)
+            if not request.future.done():
+                request.future.set_exception(error)
+
+    def _schedule_flush(self):
+        if self._ws is None or not self.backlog:
+            return
+        if self._flush_task is not None and not self._flush_task.done():
+            return
+        self._flush_task = asyncio.create_task(self._flush(self._ws))
+
+    async def _flush(self, ws):
+        while self.backlog and ws is self._ws:
+            queue = self._priority if self._priority else self._pending
+            item = queue[0]
+            command = item.command if isinstance(item, _Request) else item
+            try:
+                await ws.send_str(command)
+            except Exception as e:
+                # Il comando resta in coda per la prossima connessione
+                _LOGGER.error("Error sending WebSocket command: %s", e)
+                self.send_errors += 1
+                return
+            # Una richiesta cancellata durante l'invio è già stata tolta dalla coda
+            if queue and queue[0] is item:
+                queue.popleft()
+            if isinstance(item, _Request):
+                item.sent = True
+            if self._unanswered_since is None:
+                self._unanswered_since = time.monotonic()
+            if self.metrics is not None:
+                self.metrics.command_sent(command, time.perf_counter())
+            _LOGGER.debug("Sent WebSocket command: %s", command)
+
+    async def _run(self):
+        """Probe, connect, read frames; reconnect with backoff on failure."""
+        failures = 0
+        while True:
+            answered = False
+            try:
+                if await self._probe():
+                    answered = await self._connect()
+                elif failures == 0:
+                    _LOGGER.warning("Printer at %s is unreachable, retrying", self._url)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # Solo il primo errore di una serie arriva al log a livello alto
+                log = _LOGGER.error if failures == 0 else _LOGGER.debug
+                log("WebSocket error on %s: %s", self._url, e)
+                self.connection_errors += 1
+            failures = 0 if answered else failures + 1
+            await asyncio.sleep(reconnect_delay(failures))
+
+    async def _probe(self):
+        """Connessione TCP di prova alla porta WebSocket: False se non risponde entro PROBE_TIMEOUT."""
+        try:
+            _, writer = await asyncio.wait_for(
+                asyncio.open_connection(self._ip_address, WS_PORT), PROBE_TIMEOUT
+            )
+        except (OSError, asyncio.TimeoutError):
+            self.probe_failures += 1
+            return False
+        writer.close()
+        try:
+            await writer.wait_closed()
+        except OSError:
+            pass
+        return True
+
+    async def _connect(self):
+        """Una sessione WebSocket; ritorna True se la stampante ha inviato almeno un frame."""
+        _LOGGER.info("Connecting to WebSocket at: %s", self._url)
+        ws = await asyncio.wait_for(self._session.ws_connect(self._url), CONNECT_TIMEOUT)
+        self._ws = ws
+        self._unanswered_since = None
+        self.connects += 1
+        self._connected.set()
+        self._notify_state(True)
+        self._schedule_flush()
+        try:
+            answered = await self._reader(ws)
+        finally:
+            self._connected.clear()
+            self._ws = None
+            self._fail_requests(ConnectionError(f"WebSocket {self._url} closed"))
+            self._notify_state(False)
+            if not ws.closed:
+                try:
+                    await asyncio.wait_for(ws.close(), CLOSE_TIMEOUT)
+                except Exception:
+                    pass
+        _LOGGER.warning("WebSocket closed: %s", self._url)
+        return answered
+
+    def _notify_state(self, connected):
+        if self._on_state is None:
+            return
+        try:
+            self._on_state(connected)
+        except Exception as e:
+            _LOGGER.error("Error handling connection state of %s: %s", self._url, e)
+
+    async def _reader(self, ws):
+        """
+        Legge i frame fino alla chiusura del socket. Se un comando inviato
+        resta senza alcun frame di ritorno per stall_timeout secondi chiude
+        il socket. Ritorna True se è arrivato almeno un frame.
+        """
+        answered = False
+        stall_timeout = self._stall_timeout
+        timeout = stall_timeout
+        while True:
+            try:
+                msg = await ws.receive(timeout=timeout)
+            except asyncio.TimeoutError:
+                # Il timeout scade al più tardi stall_timeout dopo il primo comando senza risposta
+                since = self._unanswered_since
+                waited = 0 if since is None else time.monotonic() - since
+                if waited < stall_timeout:
+                    timeout = stall_timeout - waited
+                    continue
+                _LOGGER.warning("No reply from %s for %d s, closing the socket", self._url, waited)
+                self.stalls += 1
+                # La stampante non risponde: non si aspetta la sua conferma di chiusura
+                try:
+                    await asyncio.wait_for(ws.close(), CLOSE_TIMEOUT)
+                except Exception:
+                    pass
+                return answered
+            self._unanswered_since = None
+            timeout = stall_timeout
+            if msg.type == WSMsgType.TEXT:
+                answered = True
+                if self._requests:
+                    self._resolve_requests(msg.data)
+                try:
+                    await self._on_frame(msg.data)
+                except Exception as e:
+                    _LOGGER.error("Error handling frame from %s: %s", self._url, e)
+            elif msg.type in {WSMsgType.CLOSE, WSMsgType.CLOSING, WSMsgType.CLOSED, WSMsgType.ERROR}:
+                return answered
@@ -1,3 +1,35 @@
 DOMAIN = "haghost5"
 CONF_IP_ADDRESS = "ip_address"
 UPLOAD_URL = "/api/haghost5/upload_gcode"
+
+# Pubblicazione degli stati verso Home Assistant
+CONF_MIN_PUBLISH_INTERVAL = "min_publish_interval"
+CONF_TEMPERATURE_DEADBAND = "temperature_deadband"
+DEFAULT_MIN_PUBLISH_INTERVAL = 2.0  # secondi tra due scritture della stessa entità
+DEFAULT_TEMPERATURE_DEADBAND = 0.5  # °C
+
+# Attributi esposti dai sensori: full (tutti), minimal (senza quelli che
+# cambiano ad ogni frame), none (nessuno)
+CONF_ATTRIBUTE_PROFILE = "attribute_profile"
+ATTRIBUTE_PROFILE_FULL = "full"
+ATTRIBUTE_PROFILE_MINIMAL = "minimal"
+ATTRIBUTE_PROFILE_NONE = "none"
+ATTRIBUTE_PROFILES = [ATTRIBUTE_PROFILE_FULL, ATTRIBUTE_PROFILE_MINIMAL, ATTRIBUTE_PROFILE_NONE]
+DEFAULT_ATTRIBUTE_PROFILE = ATTRIBUTE_PROFILE_FULL
+
+# Evento sul bus di HA con l'avanzamento dell'upload verso la stampante
+EVENT_UPLOAD_PROGRESS = "haghost5_upload_progress"
+# Evento sul bus di HA ad ogni cambio di stato di un job della coda di stampa
+EVENT_JOB_UPDATE = "haghost5_job_update"
+# Evento sul bus di HA quando cambia la lista dei file di una stampante
+EVENT_FILE_CATALOG = "haghost5_file_catalog"
+
+# Numero massimo di upload di file GCODE contemporanei
+CONF_MAX_CONCURRENT_UPLOADS = "max_concurrent_uploads"
+DEFAULT_MAX_CONCURRENT_UPLOADS = 2
+
+# Modello cinematico per la stima del tempo di stampa
+CONF_ACCELERATION = "acceleration"
+CONF_JUNCTION_DEVIATION = "junction_deviation"
+DEFAULT_ACCELERATION = 1000.0       # mm/s²
+DEFAULT_JUNCTION_DEVIATION = 0.05   # mm
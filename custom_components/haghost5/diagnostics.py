@@ -0,0 +1,23 @@
+"""Diagnostics download for a HAGhost5 config entry."""
+
+from homeassistant.config_entries import ConfigEntry
+from homeassistant.core import HomeAssistant
+
+from .const import DOMAIN
+
+
+async def async_get_config_entry_diagnostics(hass: HomeAssistant, config_entry: ConfigEntry):
+    """
+    Opzioni e stato interno del hub: contatori della connessione, code,
+    publisher e, se un sensore dei tempi è abilitato, gli istogrammi per
+    stadio accumulati da quando la misura è attiva.
+    """
+    hub = hass.data.get(DOMAIN, {}).get(config_entry.entry_id)
+    return {
+        "entry": {
+            "title": config_entry.title,
+            "data": dict(config_entry.data),
+            "options": dict(config_entry.options),
+        },
+        "hub": hub.diagnostics() if hub is not None else None,
+    }
@@ -0,0 +1,216 @@
+"""Print-time estimate from the G-code kinematics, cached next to the file."""
+
+import json
+import logging
+import os
+from bisect import bisect_right
+
+import numpy as np
+
+from .const import DEFAULT_ACCELERATION, DEFAULT_JUNCTION_DEVIATION
+from .gcode_index import _write_json
+from .toolpath import layer_ids, layer_starts, parse_moves, start_points
+
+_LOGGER = logging.getLogger(__name__)
+
+ESTIMATE_VERSION = 3
+ESTIMATE_SUFFIX = ".estimate.json"
+
+# Velocità massime per asse della Ghost5 (mm/s) e velocità usata finché il
+# file non imposta F
+MAX_SPEED_XY = 200.0
+MAX_SPEED_Z = 10.0
+MAX_SPEED_E = 50.0
+DEFAULT_SPEED = 50.0
+
+# Punti della curva tempo stimato / avanzamento: uno ogni 0,1% dei byte
+PROGRESS_POINTS = 1001
+
+# La correzione col tempo trascorso reale parte dopo un minuto di stampa
+# (contato dal primo avanzamento, senza preriscaldamento e homing) ed è
+# limitata a questo intervallo
+MIN_CORRECTION_ELAPSED = 60
+CORRECTION_MIN = 0.5
+CORRECTION_MAX = 2.0
+
+
+def estimate_path(path):
+    """Percorso del file con la stima dei tempi associato a un G-code."""
+    return path + ESTIMATE_SUFFIX
+
+
+def move_times(moves, acceleration=DEFAULT_ACCELERATION, junction_deviation=DEFAULT_JUNCTION_DEVIATION):
+    """
+    Durata in secondi di ogni movimento, tutta in NumPy.
+
+    Ogni movimento segue un profilo trapezoidale (o triangolare se troppo
+    corto) con accelerazione costante. La velocità di giunzione tra due
+    movimenti è quella della junction deviation di Marlin, limitata dalle
+    velocità dei due movimenti; le passate all'indietro e in avanti del
+    planner (nessuna giunzione più veloce di quanto si possa frenare o
+    accelerare sui movimenti vicini) sono minimi cumulativi sui quadrati
+    delle velocità. Pause (G4) e riscaldamento non sono compresi.
+    """
+    count = len(moves["x"])
+    if count == 0:
+        return np.zeros(0)
+    a = float(acceleration)
+    x0, y0, z0 = start_points(moves)
+    dx = moves["x"].astype(np.float64) - x0
+    dy = moves["y"].astype(np.float64) - y0
+    dz = moves["z"].astype(np.float64) - z0
+    de = moves["de"].astype(np.float64)
+    xyz = np.sqrt(dx * dx + dy * dy + dz * dz)
+    length = np.where(xyz > 0, xyz, np.abs(de))
+
+    # Feedrate del file, ridotto perché nessun asse superi la sua velocità massima
+    speed = moves["f"].astype(np.float64) / 60.0
+    speed[speed <= 0] = DEFAULT_SPEED
+    with np.errstate(divide="ignore", invalid="ignore"):
+        for delta, limit in (
+            (np.abs(dx), MAX_SPEED_XY),
+            (np.abs(dy), MAX_SPEED_XY),
+            (np.abs(dz), MAX_SPEED_Z),
+            (np.abs(de), MAX_SPEED_E),
+        ):
+            speed = np.minimum(speed, np.where(delta > 0, limit * length / delta, np.inf))
+
+        # Giunzione i = inizio del movimento i; la prima e l'ultima sono da fermo
+        ux, uy, uz = (np.where(xyz > 0, d / xyz, 0.0) for d in (dx, dy, dz))
+        cos_theta = -(ux[:-1] * ux[1:] + uy[:-1] * uy[1:] + uz[:-1] * uz[1:])
+        sin_half = np.sqrt(np.clip(0.5 * (1.0 - cos_theta), 0.0, 1.0))
+        v_junction = np.sqrt(a * junction_deviation * sin_half / (1.0 - sin_half))
+    v_junction[np.isnan(v_junction)] = np.inf
+    # Ritrazioni e movimenti fermi in XY: la testa si ferma
+    v_junction[(xyz[:-1] == 0) | (xyz[1:] == 0)] = 0.0
+    v_junction = np.minimum(v_junction, np.minimum(speed[:-1], speed[1:]))
+
+    v2 = np.concatenate(([0.0], v_junction * v_junction, [0.0]))
+    reach = np.concatenate(([0.0], np.cumsum(2.0 * a * length)))
+    # All'indietro: v[i]² <= v[k]² + 2a·(distanza da i a k) per ogni k > i
+    v2 = np.minimum.accumulate((v2 + reach)[::-1])[::-1] - reach
+    # In avanti: v[i]² <= v[k]² + 2a·(distanza da k a i) per ogni k < i
+    v2 = np.minimum.accumulate(v2 - reach) + reach
+    v = np.sqrt(np.maximum(v2, 0.0))
+    entry, exit_ = v[:-1], v[1:]
+
+    accel_dist = (speed * speed - entry * entry) / (2.0 * a)
+    decel_dist = (speed * speed - exit_ * exit_) / (2.0 * a)
+    cruise = length - accel_dist - decel_dist
+    with np.errstate(divide="ignore", invalid="ignore"):
+        trapezoid = (2.0 * speed - entry - exit_) / a + cruise / speed
+    # Troppo corto per arrivare al feedrate: accelera fino a peak e frena
+    peak = np.sqrt(np.maximum((2.0 * a * length + entry * entry + exit_ * exit_) / 2.0, np.maximum(entry, exit_) ** 2))
+    triangle = (2.0 * peak - entry - exit_) / a
+    times = np.where(cruise >= 0, trapezoid, triangle)
+    times[length == 0] = 0.0
+    return times
+
+
+def build_estimate(moves, size, sha256, acceleration=DEFAULT_ACCELERATION, junction_deviation=DEFAULT_JUNCTION_DEVIATION):
+    """
+    Stima completa del file: tempo totale, tempo per layer e curva del tempo
+    stimato trascorso in funzione della frazione di byte letti dalla stampante.
+    """
+    times = move_times(moves, acceleration, junction_deviation)
+    layers, layer_count = layer_ids(moves)
+    layer_times = np.bincount(layers, weights=times, minlength=layer_count)[:layer_count]
+    # Offset in byte del cambio di Z che apre ogni layer, come nell'indice
+    layer_offsets = moves["offset"][layer_starts(moves)]
+
+    elapsed = np.concatenate(([0.0], np.cumsum(times)))
+    marks = np.linspace(0, size, PROGRESS_POINTS)
+    done = np.searchsorted(moves["offset"], marks, "right")
+    return {
+        "version": ESTIMATE_VERSION,
+        "sha256": sha256,
+        "acceleration": float(acceleration),
+        "junction_deviation": float(junction_deviation),
+        "size": size,
+        "moves": len(times),
+        "total": round(float(elapsed[-1]), 1),
+        "layer_count": layer_count,
+        "layer_times": np.round(layer_times, 1).tolist(),
+        "layer_offsets": layer_offsets.tolist(),
+        "progress": np.round(elapsed[done], 1).tolist(),
+    }
+
+
+def load_estimate(path, sha256, acceleration=DEFAULT_ACCELERATION, junction_deviation=DEFAULT_JUNCTION_DEVIATION):
+    """Stima salvata se è per lo stesso contenuto e lo stesso modello, altrimenti None."""
+    try:
+        with open(estimate_path(path)) as f:
+            estimate = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if (
+        estimate.get("version") != ESTIMATE_VERSION
+        or estimate.get("sha256") != sha256
+        or estimate.get("acceleration") != float(acceleration)
+        or estimate.get("junction_deviation") != float(junction_deviation)
+    ):
+        return None
+    return estimate
+
+
+def ensure_estimate(
+    path,
+    sha256,
+    acceleration=DEFAULT_ACCELERATION,
+    junction_deviation=DEFAULT_JUNCTION_DEVIATION,
+    load_moves=parse_moves,
+):
+    """Load the cached estimate or build and persist a new one (blocking)."""
+    estimate = load_estimate(path, sha256, acceleration, junction_deviation)
+    if estimate is None:
+        moves = load_moves(path)
+        estimate = build_estimate(
+            moves, os.path.getsize(path), sha256, acceleration, junction_deviation
+        )
+        _write_json(estimate_path(path), estimate)
+        _LOGGER.info(
+            "Estimated print time for %s: %.0f s over %d moves, %d layers",
+            path, estimate["total"], estimate["moves"], estimate["layer_count"],
+        )
+    return estimate
+
+
+def _model_elapsed(estimate, percent):
+    """Tempo stimato per arrivare a percent, interpolato sulla curva."""
+    curve = estimate["progress"]
+    position = percent / 100 * (len(curve) - 1)
+    low = int(position)
+    high = min(low + 1, len(curve) - 1)
+    return curve[low] + (curve[high] - curve[low]) * (position - low)
+
+
+def remaining_time(estimate, percent, elapsed=None, start=None):
+    """
+    Tempo rimanente in secondi a una percentuale di avanzamento (M27).
+
+    Ritorna (rimanente, layer, correzione). La parte stimata è il totale
+    meno la curva all'avanzamento corrente. start è (percentuale, tempo
+    trascorso M992) alla prima lettura con avanzamento sopra 0: dal tempo
+    reale trascorso da allora (elapsed, M992), confrontato con quello
+    stimato per lo stesso tratto, si ricava la correzione che compensa
+    l'errore sistematico del modello per quella stampante. Il tempo prima
+    di start (preriscaldamento, homing) non entra nel rapporto.
+    """
+    percent = max(0.0, min(100.0, float(percent)))
+    model_elapsed = _model_elapsed(estimate, percent)
+    remaining = max(0.0, estimate["total"] - model_elapsed)
+
+    correction = 1.0
+    if elapsed is not None and start is not None:
+        start_percent, start_elapsed = start
+        real = elapsed - start_elapsed
+        model = model_elapsed - _model_elapsed(estimate, max(0.0, min(100.0, float(start_percent))))
+        if model > 0 and real >= MIN_CORRECTION_ELAPSED:
+            correction = max(CORRECTION_MIN, min(CORRECTION_MAX, real / model))
+
+    # Layer (da 0) in stampa, con la stessa ricerca binaria dell'indice
+    layer = None
+    offsets = estimate["layer_offsets"]
+    if offsets:
+        layer = max(0, bisect_right(offsets, int(estimate["size"] * percent / 100)) - 1)
+    return remaining * correction, layer, correction
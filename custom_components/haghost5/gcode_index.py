@@ -0,0 +1,179 @@
+"""Per-file G-code layer index, built once and cached next to the file."""
+
+import hashlib
+import json
+import logging
+import os
+import tempfile
+from bisect import bisect_right
+
+import numpy as np
+
+from .toolpath import layer_ids, layer_starts, parse_moves, start_points
+
+_LOGGER = logging.getLogger(__name__)
+
+INDEX_VERSION = 3
+INDEX_SUFFIX = ".index.json"
+_HASH_CHUNK = 1024 * 1024
+
+
+def index_path(path):
+    """Percorso del file indice associato a un G-code."""
+    return path + INDEX_SUFFIX
+
+
+def build_index(path, load_moves=parse_moves):
+    """
+    Indice dei layer del file, dalle colonne del parser vettoriale (toolpath.py).
+
+    I layer sono quelli di layer_starts(): l'offset di ogni layer è la riga
+    del cambio di Z che lo apre. Sono memorizzati per colonne: offset in
+    byte, Z di stampa, numero di movimenti ed estrusione totale.
+    load_moves(path) permette di condividere il parsing con toolpath e stima.
+    """
+    sha256, lines = _hash_file(path)
+    moves = load_moves(path)
+    x, y, z = (moves[axis].astype(np.float64) for axis in ("x", "y", "z"))
+    de = moves["de"].astype(np.float64)
+    extruding = de > 0
+    total_moves = len(de)
+
+    bbox = None
+    if extruding.any():
+        x0, y0, z0 = (axis.astype(np.float64) for axis in start_points(moves))
+        ends = [np.concatenate((a[extruding], b[extruding])) for a, b in ((x0, x), (y0, y), (z0, z))]
+        bbox = [float(v.min()) for v in ends] + [float(v.max()) for v in ends]
+
+    starts = layer_starts(moves)
+    layers, layer_count = layer_ids(moves)
+    # Z di stampa: quella della prima estrusione del layer
+    extrusions = np.flatnonzero(extruding)
+    layer_z = z[extrusions[np.searchsorted(extrusions, starts)]]
+    layer_moves = np.diff(np.append(starts, total_moves))
+    layer_extrusion = np.bincount(layers, weights=np.where(extruding, de, 0.0), minlength=layer_count)[:layer_count]
+
+    st = os.stat(path)
+    return {
+        "version": INDEX_VERSION,
+        "sha256": sha256,
+        "size": st.st_size,
+        "mtime_ns": st.st_mtime_ns,
+        "lines": lines,
+        "moves": total_moves,
+        "extrude_moves": int(extruding.sum()),
+        "travel_moves": int(total_moves - extruding.sum()),
+        "extrusion": round(float(de[extruding].sum()), 4),
+        "bbox": [round(v, 4) for v in bbox] if bbox else None,
+        "layer_count": layer_count,
+        "layers": {
+            "offset": moves["offset"][starts].tolist(),
+            "z": np.round(layer_z, 4).tolist(),
+            "moves": layer_moves.tolist(),
+            "extrusion": np.round(layer_extrusion, 4).tolist(),
+        },
+    }
+
+
+def _hash_file(path):
+    """sha256 e numero di righe del file, letto a blocchi."""
+    sha = hashlib.sha256()
+    lines = 0
+    last = b"\n"
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(_HASH_CHUNK), b""):
+            sha.update(chunk)
+            lines += chunk.count(b"\n")
+            last = chunk[-1:]
+    # Ultima riga senza a capo
+    if last != b"\n":
+        lines += 1
+    return sha.hexdigest(), lines
+
+
+def file_sha256(path):
+    return _hash_file(path)[0]
+
+
+def _write_json(path, data):
+    directory, name = os.path.split(path)
+    fd, temp_path = tempfile.mkstemp(prefix=f".{name}.", suffix=".tmp", dir=directory)
+    try:
+        with os.fdopen(fd, "w") as f:
+            json.dump(data, f, separators=(",", ":"))
+        os.replace(temp_path, path)
+    except Exception:
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+        raise
+
+
+def load_index(path):
+    """
+    Ritorna l'indice salvato se è ancora valido per il file, altrimenti None.
+
+    Se dimensione e mtime coincidono l'indice è valido; altrimenti si ricalcola
+    lo sha256 e, se il contenuto è lo stesso, si aggiorna solo il timestamp.
+    """
+    try:
+        with open(index_path(path)) as f:
+            index = json.load(f)
+        st = os.stat(path)
+    except (OSError, ValueError):
+        return None
+    if index.get("version") != INDEX_VERSION or index.get("size") != st.st_size:
+        return None
+    if index.get("mtime_ns") == st.st_mtime_ns:
+        return index
+    if file_sha256(path) != index.get("sha256"):
+        return None
+    index["mtime_ns"] = st.st_mtime_ns
+    _write_json(index_path(path), index)
+    return index
+
+
+def ensure_index(path, load_moves=parse_moves):
+    """Load the cached index or build and persist a new one (blocking)."""
+    index = load_index(path)
+    if index is None:
+        index = build_index(path, load_moves)
+        _write_json(index_path(path), index)
+        _LOGGER.info("Built G-code index for %s: %d layers", path, index["layer_count"])
+    return index
+
+
+def layer_byte_range(index, first, last):
+    """Intervallo di byte [start, end) che copre i layer first..last inclusi."""
+    offsets = index["layers"]["offset"]
+    count = len(offsets)
+    if count == 0:
+        return 0, index["size"]
+    first = max(0, min(first, count - 1))
+    last = max(first, min(last, count - 1))
+    start = offsets[first]
+    end = offsets[last + 1] if last + 1 < count else index["size"]
+    return start, end
+
+
+def read_layers(path, index, first, last):
+    """Legge i byte dei layer first..last inclusi."""
+    start, end = layer_byte_range(index, first, last)
+    with open(path, "rb") as f:
+        f.seek(start)
+        return f.read(end - start)
+
+
+def layer_at_offset(index, byte_offset):
+    """Layer (da 0) che contiene il byte indicato, con ricerca binaria sugli offset."""
+    offsets = index["layers"]["offset"]
+    if not offsets:
+        return None
+    return max(0, bisect_right(offsets, byte_offset) - 1)
+
+
+def layer_at_progress(index, percent):
+    """Layer (da 0) corrispondente a una percentuale di avanzamento sui byte del file."""
+    percent = max(0.0, min(100.0, float(percent)))
+    return layer_at_offset(index, int(index["size"] * percent / 100))
@@ -0,0 +1,386 @@
+"""Per-printer hub: one connection, one router, one publisher."""
+
+import asyncio
+import json
+import logging
+import os
+import tempfile
+import time
+
+from homeassistant.config_entries import ConfigEntry
+from homeassistant.core import HomeAssistant
+from homeassistant.helpers.aiohttp_client import async_get_clientsession
+
+from .catalog import FileCatalog
+from .connection import PrinterConnection, REQUEST_TIMEOUT
+from .const import (
+    DOMAIN,
+    EVENT_FILE_CATALOG,
+    CONF_ATTRIBUTE_PROFILE,
+    DEFAULT_ATTRIBUTE_PROFILE,
+    CONF_MIN_PUBLISH_INTERVAL,
+    CONF_TEMPERATURE_DEADBAND,
+    DEFAULT_MIN_PUBLISH_INTERVAL,
+    DEFAULT_TEMPERATURE_DEADBAND,
+    CONF_ACCELERATION,
+    CONF_JUNCTION_DEVIATION,
+    DEFAULT_ACCELERATION,
+    DEFAULT_JUNCTION_DEVIATION,
+)
+from .metrics import HubMetrics
+from .publisher import StatePublisher
+from .telemetry import TelemetryHistory
+from .router import MessageRouter, FileListRecord, ProgressRecord, StatusRecord, TemperatureRecord, parse_line
+from .scheduler import (
+    PROBE_INTERVAL_MAX,
+    PollScheduler,
+    QueryPlan,
+    STATE_OFFLINE,
+    STATE_IDLE,
+    STATE_HEATING,
+    STATE_PRINTING,
+    STATE_PAUSED,
+)
+
+_LOGGER = logging.getLogger(__name__)
+
+TICK_INTERVAL = 1  # secondi tra due giri del loop di polling
+FILE_LIST_COMMAND = "M20 1:"
+
+# Secondi tra due invii di ogni interrogazione, per stato della stampante.
+# M997 fa anche da heartbeat e resta a 5 s in ogni stato; da ferma la
+# stampante non riceve M27/M992/M994, che non avrebbero nulla da dire.
+QUERY_INTERVALS = {
+    "M997": {STATE_IDLE: 5, STATE_HEATING: 5, STATE_PRINTING: 5, STATE_PAUSED: 5},
+    "M991": {STATE_IDLE: 30, STATE_HEATING: 2, STATE_PRINTING: 5, STATE_PAUSED: 10},
+    "M27": {STATE_PRINTING: 5, STATE_PAUSED: 30},
+    "M992": {STATE_PRINTING: 10, STATE_PAUSED: 30},
+    "M994": {STATE_PRINTING: 60, STATE_PAUSED: 60},
+}
+# Senza frame per tre interrogazioni M997 la stampante è considerata offline
+LIVENESS_TIMEOUT = 3 * max(QUERY_INTERVALS["M997"].values())
+# Un comando senza risposta per questo tempo fa chiudere il socket: prima la
+# stampante passa offline e le sonde arrivano al loro intervallo massimo
+STALL_TIMEOUT = LIVENESS_TIMEOUT + PROBE_INTERVAL_MAX
+# Attesa massima della risposta a un M997 chiesto subito (async_refresh_status)
+STATUS_TIMEOUT = 5
+
+# Chiave in hass.data[DOMAIN] del loop di polling condiviso da tutte le stampanti
+SCHEDULER_KEY = "poll_scheduler"
+
+
+def get_scheduler(hass: HomeAssistant) -> PollScheduler:
+    """Ritorna (creandolo se serve) il loop di polling condiviso."""
+    data = hass.data.setdefault(DOMAIN, {})
+    scheduler = data.get(SCHEDULER_KEY)
+    if scheduler is None:
+        scheduler = PollScheduler(TICK_INTERVAL, hass.async_create_background_task)
+        data[SCHEDULER_KEY] = scheduler
+    return scheduler
+
+
+def get_hub(hass: HomeAssistant, printer_id=None):
+    """
+    Trova il hub di una stampante per entry id o indirizzo IP.
+
+    Senza printer_id ritorna l'unico hub caricato, oppure None se le
+    stampanti configurate sono più di una.
+    """
+    hubs = [value for value in hass.data.get(DOMAIN, {}).values() if isinstance(value, PrinterHub)]
+    if printer_id is None:
+        return hubs[0] if len(hubs) == 1 else None
+    for hub in hubs:
+        if printer_id in (hub.printer_id, hub.ip_address):
+            return hub
+    return None
+
+
+class PrinterHub:
+    """
+    Coordinatore di una stampante Ghost5.
+
+    Usa la sessione aiohttp condivisa di Home Assistant, tiene aperta la
+    connessione WebSocket, interroga periodicamente la stampante e ricava lo
+    stato online/offline dal traffico ricevuto, senza scaricare la pagina web
+    della stampante. Le entità ricevono gli aggiornamenti in push.
+
+    Ogni stampante costa un socket e un task (il loop della connessione):
+    polling e controllo di vivacità passano dal PollScheduler condiviso.
+    L'apertura e la chiusura del socket arrivano invece subito dalla
+    connessione, così il passaggio online/offline non attende il giro
+    successivo né LIVENESS_TIMEOUT.
+    Le interrogazioni seguono QUERY_INTERVALS in base allo stato ricavato
+    dai frame (idle, heating, printing, paused, offline).
+    """
+
+    def __init__(self, hass: HomeAssistant, config_entry: ConfigEntry):
+        self.hass = hass
+        self.config_entry = config_entry
+        self.ip_address = config_entry.data["ip_address"]
+        self.printer_id = config_entry.entry_id
+        options = config_entry.options
+
+        self.session = async_get_clientsession(hass)
+        self.connection = PrinterConnection(
+            self.ip_address, self.session, self._handle_frame, self._handle_connection_state,
+            stall_timeout=STALL_TIMEOUT,
+        )
+        self.router = MessageRouter()
+        self.publisher = StatePublisher(
+            min_interval=options.get(CONF_MIN_PUBLISH_INTERVAL, DEFAULT_MIN_PUBLISH_INTERVAL),
+            temperature_deadband=options.get(CONF_TEMPERATURE_DEADBAND, DEFAULT_TEMPERATURE_DEADBAND),
+            attribute_profile=options.get(CONF_ATTRIBUTE_PROFILE, DEFAULT_ATTRIBUTE_PROFILE),
+        )
+        # Modello cinematico per la stima dei tempi di stampa (estimator.py)
+        self.estimator_params = {
+            "acceleration": options.get(CONF_ACCELERATION, DEFAULT_ACCELERATION),
+            "junction_deviation": options.get(CONF_JUNCTION_DEVIATION, DEFAULT_JUNCTION_DEVIATION),
+        }
+        self.catalog = FileCatalog(self._handle_catalog_change)
+        self.router.subscribe(FileListRecord, self.catalog.process_record)
+        self.router.subscribe(StatusRecord, self._process_status_record)
+        self.router.subscribe(TemperatureRecord, self._process_temperature_record)
+
+        # Storico a memoria fissa per i grafici, senza passare dal recorder
+        self.telemetry = TelemetryHistory()
+        self.router.subscribe(TemperatureRecord, self.telemetry.process_temperature)
+        self.router.subscribe(ProgressRecord, self.telemetry.process_progress)
+
+        self.query_plan = QueryPlan(QUERY_INTERVALS)
+        # GcodeStream in corso (servizio stream_gcode), uno per stampante
+        self.stream = None
+        self.queries_sent = 0
+        self._status = None
+        self._heating = False
+
+        self.online = False
+        self._last_frame_time = None
+        self._online_listeners = []
+
+        # Misura dei tempi per stadio: attiva solo finché qualcuno la usa
+        self.metrics = None
+        self._metrics_users = 0
+        self._metrics_handlers = []
+
+    async def async_start(self):
+        """Open the connection and join the shared polling loop."""
+        self.connection.start()
+        get_scheduler(self.hass).add(self)
+
+    async def async_stop(self):
+        """Leave the polling loop and close the connection."""
+        get_scheduler(self.hass).remove(self)
+        self.publisher.stop()
+        self.catalog.cancel()
+        await self.connection.stop()
+        self._set_online(False)
+
+    def add_online_listener(self, listener):
+        """Register a callback(online: bool); returns a function that removes it."""
+        self._online_listeners.append(listener)
+
+        def remove():
+            if listener in self._online_listeners:
+                self._online_listeners.remove(listener)
+
+        return remove
+
+    def _set_online(self, online: bool):
+        if online == self.online:
+            return
+        self.online = online
+        _LOGGER.info("Printer %s is %s.", self.ip_address, "online" if online else "offline")
+        for listener in list(self._online_listeners):
+            try:
+                listener(online)
+            except Exception as e:
+                _LOGGER.error("Error notifying online state: %s", e)
+
+    def acquire_metrics(self):
+        """
+        Attiva la misura dei tempi (alla prima richiesta) e ritorna l'HubMetrics.
+        Ogni chiamata va bilanciata da release_metrics().
+        """
+        self._metrics_users += 1
+        if self.metrics is None:
+            metrics = HubMetrics()
+            self._metrics_handlers = metrics.reply_handlers()
+            for record_type, handler in self._metrics_handlers:
+                self.router.subscribe(record_type, handler)
+            self.router.parse_histogram = metrics.parse
+            self.publisher.write_histogram = metrics.state_write
+            self.connection.metrics = metrics
+            self.metrics = metrics
+        return self.metrics
+
+    def release_metrics(self):
+        """Disattiva la misura dei tempi quando l'ultimo utilizzatore la rilascia."""
+        self._metrics_users = max(self._metrics_users - 1, 0)
+        if self._metrics_users or self.metrics is None:
+            return
+        for record_type, handler in self._metrics_handlers:
+            self.router.unsubscribe(record_type, handler)
+        self._metrics_handlers = []
+        self.router.parse_histogram = None
+        self.publisher.write_histogram = None
+        self.connection.metrics = None
+        self.metrics = None
+
+    async def _handle_frame(self, frame):
+        """Chiamato dalla connessione per ogni frame: aggiorna la vivacità e lo passa al router."""
+        self._last_frame_time = time.monotonic()
+        if not self.online:
+            self._set_online(True)
+            # Appena la stampante risponde si aggiorna il catalogo dei file
+            self.request_file_list()
+        _LOGGER.debug("WebSocket message received: %s", frame.encode("utf-8"))
+        metrics = self.metrics
+        if metrics is None:
+            await self.router.route(frame)
+            return
+        start = time.perf_counter()
+        metrics.frame_arrived(start)
+        await self.router.route(frame)
+        metrics.dispatch.record(time.perf_counter() - start)
+
+    def _handle_connection_state(self, connected):
+        """Chiamato dalla connessione all'apertura e alla chiusura del socket."""
+        self.query_plan.reset_backoff()
+        if not connected:
+            self._set_online(False)
+            return
+        # La sonda parte subito: la prima risposta porta la stampante online
+        self._send_due_queries(time.monotonic())
+
+    def diagnostics(self):
+        """Stato interno del hub per il download della diagnostica."""
+        return {
+            "online": self.online,
+            "printer_state": self.printer_state,
+            "seconds_since_last_frame": (
+                round(time.monotonic() - self._last_frame_time, 1)
+                if self._last_frame_time is not None else None
+            ),
+            "queries_sent": self.queries_sent,
+            "connection": self.connection.stats,
+            "router": {"frames": self.router.frames, "unmatched": self.router.unmatched},
+            "publisher": self.publisher.stats,
+            "catalog": {"version": self.catalog.version, "files": len(self.catalog.names)},
+            "telemetry_bytes": self.telemetry.nbytes,
+            "metrics": self.metrics.as_dict() if self.metrics is not None else None,
+        }
+
+    def _process_status_record(self, record, message):
+        self._status = record.state
+
+    def _process_temperature_record(self, record, message):
+        # Un target impostato da ferma = preriscaldamento: temperature più fitte
+        self._heating = bool(record.nozzle_target) or bool(record.bed_target)
+
+    @property
+    def printer_state(self):
+        """Stato usato per scegliere la cadenza delle interrogazioni."""
+        if not self.online:
+            return STATE_OFFLINE
+        if self._status == "PRINTING":
+            return STATE_PRINTING
+        if self._status == "PAUSE":
+            return STATE_PAUSED
+        if self._heating:
+            return STATE_HEATING
+        return STATE_IDLE
+
+    async def async_tick(self):
+        """
+        Un giro del loop condiviso: passa offline se il socket è giù o se la
+        stampante non risponde più, poi invia le interrogazioni scadute.
+        """
+        now = time.monotonic()
+        alive = (
+            self.connection.connected
+            and self._last_frame_time is not None
+            and now - self._last_frame_time < LIVENESS_TIMEOUT
+        )
+        self._set_online(alive)
+        if not self.connection.connected:
+            # Alla riconnessione la prima sonda parte subito
+            self.query_plan.reset_backoff()
+            return
+
+        self._send_due_queries(now)
+
+    def _send_due_queries(self, now):
+        self.query_plan.set_state(self.printer_state)
+        due = self.query_plan.due(now)
+        if due:
+            self.connection.send("\n".join(due) + "\n")
+            self.queries_sent += len(due)
+
+    def send_ws_command(self, command: str):
+        """Send a user command over the WebSocket, ahead of the background polls."""
+        if not self.connection.running:
+            _LOGGER.error("Cannot send command; WebSocket is not started.")
+            return
+
+        self.connection.send(command, priority=True)
+        _LOGGER.debug("Queued WebSocket command: %s", command)
+
+    async def async_request(self, command: str, expect=None, timeout: float = REQUEST_TIMEOUT) -> str:
+        """Send a command and wait for the matching reply line (see PrinterConnection.request)."""
+        return await self.connection.request(command, expect, timeout)
+
+    async def async_refresh_status(self, timeout: float = STATUS_TIMEOUT):
+        """
+        Chiede subito M997 invece di attendere il prossimo giro di polling.
+        La risposta passa anche dal router (sensori, coda di stampa); ritorna
+        lo stato (IDLE, PRINTING, PAUSE) o None se la stampante non risponde.
+        """
+        try:
+            line = await self.async_request("M997", timeout=timeout)
+        except (asyncio.TimeoutError, ConnectionError) as e:
+            _LOGGER.debug("No M997 reply from %s: %s", self.ip_address, e)
+            return None
+        record = parse_line(line)
+        return record.state if isinstance(record, StatusRecord) else None
+
+    def request_file_list(self):
+        """
+        Chiede la lista dei file (M20). Non blocca gli altri comandi: le righe
+        della risposta vengono riconosciute dal router e raccolte dal catalogo.
+        """
+        self.send_ws_command(FILE_LIST_COMMAND)
+
+    def _handle_catalog_change(self, catalog, diff):
+        """Notifica le differenze e aggiorna files.json (solo quando la lista cambia)."""
+        self.hass.bus.async_fire(
+            EVENT_FILE_CATALOG,
+            {
+                "printer_id": self.printer_id,
+                "ip_address": self.ip_address,
+                "version": catalog.version,
+                **diff,
+            },
+        )
+        # Un file per stampante: con più stampanti una lista unica verrebbe sovrascritta
+        json_path = self.hass.config.path("www", "community", "haghost5", f"files_{self.printer_id}.json")
+        self.hass.async_add_executor_job(_write_file_list, json_path, catalog.names)
+
+
+def _write_file_list(path, names):
+    """Scrive la lista dei nomi su file temporaneo e la rinomina atomicamente."""
+    directory, name = os.path.split(path)
+    temp_path = None
+    try:
+        os.makedirs(directory, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(prefix=f".{name}.", suffix=".tmp", dir=directory)
+        with os.fdopen(fd, "w") as f:
+            json.dump(names, f, separators=(",", ":"))
+        os.replace(temp_path, path)
+        _LOGGER.debug("File list saved to JSON at: %s", path)
+    except Exception as e:
+        _LOGGER.error("Failed to save file list to JSON: %s", e)
+        if temp_path is not None:
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
@@ -0,0 +1,219 @@
+"""Persistent print job queue dispatched to idle printers."""
+
+import logging
+import os
+import time
+import uuid
+from datetime import datetime
+
+from homeassistant.core import HomeAssistant
+from homeassistant.helpers.storage import Store
+
+from .api import get_upload_slots, upload_file_to_printer
+from .const import DOMAIN, EVENT_JOB_UPDATE
+from .hub import PrinterHub, get_hub
+from .router import StatusRecord
+
+_LOGGER = logging.getLogger(__name__)
+
+STORAGE_KEY = f"{DOMAIN}.job_queue"
+STORAGE_VERSION = 1
+SAVE_DELAY = 1  # secondi: le modifiche ravvicinate finiscono in una sola scrittura
+
+# Se dopo l'upload la stampante resta IDLE per questo tempo la stampa non è partita
+START_TIMEOUT = 120
+# Job conclusi (done/failed/cancelled) tenuti nello storico
+MAX_FINISHED_JOBS = 50
+
+JOB_QUEUED = "queued"
+JOB_UPLOADING = "uploading"
+JOB_PRINTING = "printing"
+JOB_DONE = "done"
+JOB_FAILED = "failed"
+JOB_CANCELLED = "cancelled"
+FINISHED_STATES = (JOB_DONE, JOB_FAILED, JOB_CANCELLED)
+
+PRINTER_IDLE = "IDLE"
+
+
+class JobQueue:
+    """
+    Coda di stampa condivisa da tutte le stampanti.
+
+    Ogni job è un file della cartella gcodes destinato a una stampante
+    precisa o alla prima libera. Il dispatcher ascolta gli M997 di ogni hub:
+    quando una stampante online è IDLE e non ha job in corso le invia il
+    primo job compatibile, col limite di upload contemporanei condiviso con
+    le view (get_upload_slots).
+    Il job resta "printing" finché la stampante non torna IDLE.
+    La coda è salvata con lo Store di Home Assistant e sopravvive ai riavvii.
+    """
+
+    def __init__(self, hass: HomeAssistant):
+        self.hass = hass
+        self._store = Store(hass, STORAGE_VERSION, STORAGE_KEY)
+        self._jobs = []
+        self._hubs = {}         # printer_id -> (hub, handler dello StatusRecord)
+        self._states = {}       # printer_id -> ultimo stato M997
+        self._running = {}      # printer_id -> job in upload o in stampa
+        self._seen_busy = set() # printer_id che hanno lasciato IDLE dopo l'upload
+
+    @property
+    def jobs(self):
+        return [_public(job) for job in self._jobs]
+
+    async def async_load(self):
+        """Carica la coda salvata; gli upload interrotti dal riavvio tornano in coda."""
+        data = await self._store.async_load()
+        self._jobs = (data or {}).get("jobs", [])
+        for job in self._jobs:
+            if job["state"] == JOB_UPLOADING:
+                job["state"] = JOB_QUEUED
+                job["assigned"] = None
+            elif job["state"] == JOB_PRINTING:
+                # La stampa era in corso: si chiude al prossimo IDLE
+                self._running[job["assigned"]] = job
+                self._seen_busy.add(job["assigned"])
+        _LOGGER.info("Loaded print job queue: %d jobs", len(self._jobs))
+
+    def attach_hub(self, hub: PrinterHub):
+        """Start watching a printer's status."""
+
+        def handler(record, message):
+            self._on_status(hub, record.state)
+
+        hub.router.subscribe(StatusRecord, handler)
+        self._hubs[hub.printer_id] = (hub, handler)
+
+    def detach_hub(self, hub: PrinterHub):
+        entry = self._hubs.pop(hub.printer_id, None)
+        if entry is not None:
+            hub.router.unsubscribe(StatusRecord, entry[1])
+        self._states.pop(hub.printer_id, None)
+
+    def add(self, filename, printer=None):
+        """
+        Accoda un file per una stampante (entry id o IP) o per la prima
+        libera (printer None o "any"). Ritorna il job creato.
+        """
+        printer_id = None
+        if printer not in (None, "", "any"):
+            hub = get_hub(self.hass, printer)
+            if hub is None:
+                raise ValueError(f"Unknown printer: {printer}")
+            printer_id = hub.printer_id
+
+        job = {
+            "id": uuid.uuid4().hex,
+            "filename": os.path.basename(filename),
+            "printer": printer_id,
+            "assigned": None,
+            "state": JOB_QUEUED,
+            "created": datetime.now().isoformat(),
+            "started": None,
+            "finished": None,
+            "error": None,
+        }
+        self._jobs.append(job)
+        _LOGGER.info("Queued print job %s: %s -> %s", job["id"], job["filename"], printer_id or "any")
+        self._changed(job)
+        self._dispatch()
+        return job
+
+    def cancel(self, job_id):
+        """Annulla un job ancora in coda; ritorna False se non esiste o è già partito."""
+        for job in self._jobs:
+            if job["id"] == job_id and job["state"] == JOB_QUEUED:
+                self._finish(job, JOB_CANCELLED)
+                return True
+        return False
+
+    def _on_status(self, hub, state):
+        printer_id = hub.printer_id
+        self._states[printer_id] = state
+        job = self._running.get(printer_id)
+        if job is not None and job["state"] == JOB_PRINTING:
+            if state != PRINTER_IDLE:
+                self._seen_busy.add(printer_id)
+            elif printer_id in self._seen_busy:
+                self._finish(job, JOB_DONE)
+            elif time.monotonic() - job.get("_upload_done", 0) > START_TIMEOUT:
+                self._finish(job, JOB_FAILED, "Print did not start after upload")
+        if state == PRINTER_IDLE:
+            self._dispatch()
+
+    def _dispatch(self):
+        for printer_id, (hub, _) in self._hubs.items():
+            if (
+                printer_id in self._running
+                or not hub.online
+                or self._states.get(printer_id) != PRINTER_IDLE
+            ):
+                continue
+            job = next(
+                (
+                    j for j in self._jobs
+                    if j["state"] == JOB_QUEUED and j["printer"] in (None, printer_id)
+                ),
+                None,
+            )
+            if job is None:
+                continue
+            job["state"] = JOB_UPLOADING
+            job["assigned"] = printer_id
+            job["started"] = datetime.now().isoformat()
+            self._running[printer_id] = job
+            self._seen_busy.discard(printer_id)
+            self._changed(job)
+            self.hass.async_create_background_task(
+                self._upload(job, hub), f"haghost5 job {job['id']}"
+            )
+
+    async def _upload(self, job, hub):
+        path = self.hass.config.path("www", "community", "haghost5", "gcodes", job["filename"])
+        async with get_upload_slots(self.hass):
+            if job["state"] != JOB_UPLOADING:
+                return
+            _LOGGER.info("Sending job %s (%s) to %s", job["id"], job["filename"], hub.ip_address)
+            try:
+                error = await upload_file_to_printer(self.hass, hub.ip_address, path)
+            except Exception as e:
+                error = str(e)
+        if error is not None:
+            _LOGGER.error("Print job %s failed: %s", job["id"], error)
+            self._finish(job, JOB_FAILED, error)
+            return
+        job["state"] = JOB_PRINTING
+        job["_upload_done"] = time.monotonic()
+        self._changed(job)
+        # Stato aggiornato subito, senza attendere il prossimo M997 di polling
+        await hub.async_refresh_status()
+
+    def _finish(self, job, state, error=None):
+        job["state"] = state
+        job["finished"] = datetime.now().isoformat()
+        job["error"] = error
+        job.pop("_upload_done", None)
+        if job["assigned"] and self._running.get(job["assigned"]) is job:
+            del self._running[job["assigned"]]
+            self._seen_busy.discard(job["assigned"])
+        self._prune()
+        self._changed(job)
+        self._dispatch()
+
+    def _prune(self):
+        finished = [j for j in self._jobs if j["state"] in FINISHED_STATES]
+        for job in finished[:-MAX_FINISHED_JOBS]:
+            self._jobs.remove(job)
+
+    def _changed(self, job):
+        self.hass.bus.async_fire(EVENT_JOB_UPDATE, _public(job))
+        self._store.async_delay_save(self._data_to_save, SAVE_DELAY)
+
+    def _data_to_save(self):
+        return {"jobs": self.jobs}
+
+
+def _public(job):
+    """Il job senza i campi interni (prefisso _), da salvare o esporre."""
+    return {k: v for k, v in job.items() if not k.startswith("_")}
@@ -0,0 +1,153 @@
+"""Opt-in latency histograms for the receive and write path of a printer."""
+
+import time
+from bisect import bisect_left
+
+from .router import (
+    ElapsedRecord,
+    FileListRecord,
+    FileRecord,
+    ProgressRecord,
+    StatusRecord,
+    FILE_LIST_BEGIN,
+)
+
+# Limiti superiori dei bucket in secondi: 4 per ottava da 10 µs a circa 100 s.
+# Un campione costa una bisect su ~95 float e un incremento.
+BUCKET_BOUNDS = tuple(1e-5 * 2 ** (i / 4) for i in range(94))
+
+# Interrogazioni di cui si misura il tempo di risposta e record che le chiude.
+# M991 manca: le righe temperature arrivano anche senza richiesta.
+REPLY_RECORDS = {
+    "M997": StatusRecord,
+    "M27": ProgressRecord,
+    "M994": FileRecord,
+    "M992": ElapsedRecord,
+    "M20": FileListRecord,
+}
+
+# Un'interrogazione senza risposta entro questo tempo si considera persa
+REPLY_TIMEOUT = 15
+
+# frame_interval: tempo tra due frame; parse: una riga; dispatch: un frame
+# dall'arrivo alla fine di parsing, handler e scritture; state_write: una
+# async_write_ha_state; round_trip: invio di un'interrogazione -> risposta
+STAGES = ("frame_interval", "parse", "dispatch", "state_write", "round_trip")
+
+
+class LatencyHistogram:
+    """Istogramma cumulativo a bucket logaritmici fissi."""
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKET_BOUNDS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, seconds):
+        self.counts[bisect_left(BUCKET_BOUNDS, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def snapshot(self):
+        return list(self.counts)
+
+    @staticmethod
+    def percentile(counts, q):
+        """Limite superiore del bucket che contiene il quantile q (0-100), None se vuoto."""
+        total = sum(counts)
+        if not total:
+            return None
+        rank = total * q / 100
+        seen = 0
+        for i, count in enumerate(counts):
+            seen += count
+            if count and seen >= rank:
+                return BUCKET_BOUNDS[min(i, len(BUCKET_BOUNDS) - 1)]
+        return BUCKET_BOUNDS[-1]
+
+    def as_dict(self):
+        return {
+            "count": self.count,
+            "mean_ms": round(self.total / self.count * 1000, 3) if self.count else None,
+            "p50_ms": _ms(self.percentile(self.counts, 50)),
+            "p90_ms": _ms(self.percentile(self.counts, 90)),
+            "p99_ms": _ms(self.percentile(self.counts, 99)),
+            "max_ms": round(self.max * 1000, 3) if self.count else None,
+        }
+
+
+def _ms(seconds):
+    return None if seconds is None else round(seconds * 1000, 3)
+
+
+class HubMetrics:
+    """
+    Tempi per stadio del percorso frame -> router -> publisher di un hub.
+
+    Esiste solo mentre qualcuno lo usa (PrinterHub.acquire_metrics): da
+    spento connessione, router e publisher controllano solo un attributo
+    None. Le interrogazioni inviate vengono segnate per comando e chiuse dal
+    primo record di risposta dello stesso tipo; quelle senza risposta entro
+    REPLY_TIMEOUT sono contate come perse.
+    """
+
+    def __init__(self):
+        self.histograms = {stage: LatencyHistogram() for stage in STAGES}
+        self.frame_interval = self.histograms["frame_interval"]
+        self.parse = self.histograms["parse"]
+        self.dispatch = self.histograms["dispatch"]
+        self.state_write = self.histograms["state_write"]
+        self.round_trip = self.histograms["round_trip"]
+        self.started = time.time()
+        self.unanswered = 0
+        self._last_arrival = None
+        self._sent = {}  # comando -> istante del primo invio senza risposta
+
+    def frame_arrived(self, now):
+        if self._last_arrival is not None:
+            self.frame_interval.record(now - self._last_arrival)
+        self._last_arrival = now
+
+    def command_sent(self, command, now):
+        """Segna l'invio delle interrogazioni contenute in un comando (anche più righe)."""
+        for line in command.split("\n"):
+            head = line.split(" ", 1)[0]
+            if head not in REPLY_RECORDS:
+                continue
+            sent = self._sent.get(head)
+            if sent is not None and now - sent > REPLY_TIMEOUT:
+                self.unanswered += 1
+                sent = None
+            if sent is None:
+                self._sent[head] = now
+
+    def reply_received(self, command, now):
+        sent = self._sent.pop(command, None)
+        if sent is not None:
+            self.round_trip.record(now - sent)
+
+    def reply_handlers(self):
+        """(tipo di record, handler del router) che chiudono le interrogazioni in attesa."""
+        handlers = []
+        for command, record_type in REPLY_RECORDS.items():
+            def handler(record, message, command=command):
+                if command == "M20" and record.kind != FILE_LIST_BEGIN:
+                    return
+                self.reply_received(command, time.perf_counter())
+            handlers.append((record_type, handler))
+        return handlers
+
+    @property
+    def awaiting_reply(self):
+        return sorted(self._sent)
+
+    def as_dict(self):
+        return {
+            "started": self.started,
+            "awaiting_reply": self.awaiting_reply,
+            "unanswered_queries": self.unanswered,
+            **{stage: histogram.as_dict() for stage, histogram in self.histograms.items()},
+        }
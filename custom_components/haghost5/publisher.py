@@ -0,0 +1,190 @@
+"""Throttled, change-detecting state writes for the HAGhost5 sensors."""
+
+import asyncio
+import logging
+import time
+from collections import deque
+
+from .const import (
+    ATTRIBUTE_PROFILE_MINIMAL,
+    ATTRIBUTE_PROFILE_NONE,
+    DEFAULT_ATTRIBUTE_PROFILE,
+    DEFAULT_MIN_PUBLISH_INTERVAL,
+    DEFAULT_TEMPERATURE_DEADBAND,
+)
+
+_LOGGER = logging.getLogger(__name__)
+
+# Attributi che cambiano ad ogni frame e non devono da soli causare una scrittura
+VOLATILE_ATTRIBUTES = ("last_update", "raw_message")
+
+# Finestra su cui si calcolano le scritture al minuto
+RATE_WINDOW = 60
+
+
+class StatePublisher:
+    """
+    Filtro tra i parser e async_write_ha_state().
+
+    Scrive lo stato di un'entità solo se il valore (o un attributo non
+    volatile) è cambiato, rispettando una deadband per le temperature e un
+    intervallo minimo per entità. Le raffiche dentro l'intervallo vengono
+    fuse in un'unica scrittura a fine intervallo.
+
+    Decide anche quali attributi arrivano a Home Assistant (attribute_profile)
+    e conta le scritture dell'ultimo minuto, cioè le righe per il recorder.
+    """
+
+    def __init__(
+        self,
+        min_interval: float = DEFAULT_MIN_PUBLISH_INTERVAL,
+        temperature_deadband: float = DEFAULT_TEMPERATURE_DEADBAND,
+        attribute_profile: str = DEFAULT_ATTRIBUTE_PROFILE,
+    ):
+        self._min_interval = min_interval
+        self._temperature_deadband = temperature_deadband
+        self.attribute_profile = attribute_profile
+        self._write_times = deque()
+        self._last = {}     # entity -> (value, attributes, monotonic time)
+        self._pending = {}  # entity -> [TimerHandle, value, attributes]
+        self.written = 0
+        self.suppressed = 0
+        self.coalesced = 0
+        # LatencyHistogram di async_write_ha_state, solo con la misura dei tempi attiva
+        self.write_histogram = None
+
+    @property
+    def stats(self):
+        return {
+            "published_writes": self.written,
+            "suppressed_writes": self.suppressed,
+            "coalesced_writes": self.coalesced,
+            "writes_per_minute": self.writes_per_minute,
+            "pending_writes": self.pending,
+        }
+
+    @property
+    def pending(self):
+        """Scritture rinviate in attesa dell'intervallo minimo."""
+        return len(self._pending)
+
+    @property
+    def writes_per_minute(self):
+        """Scritture di stato negli ultimi RATE_WINDOW secondi."""
+        self._prune_write_times(time.monotonic())
+        return len(self._write_times) * 60 / RATE_WINDOW
+
+    def _prune_write_times(self, now):
+        while self._write_times and now - self._write_times[0] > RATE_WINDOW:
+            self._write_times.popleft()
+
+    def filter_attributes(self, entity, attributes):
+        """Attributi da esporre secondo il profilo configurato."""
+        if self.attribute_profile == ATTRIBUTE_PROFILE_NONE:
+            return {}
+        if self.attribute_profile == ATTRIBUTE_PROFILE_MINIMAL:
+            volatile = getattr(entity, "_volatile_attributes", VOLATILE_ATTRIBUTES)
+            return {k: v for k, v in attributes.items() if k not in volatile}
+        return attributes
+
+    def publish(self, entity, value, attributes, force=False):
+        """
+        Write the entity state if it changed, otherwise count it as suppressed.
+
+        Con force=True la scrittura parte subito, senza intervallo minimo:
+        un'eventuale scrittura programmata viene annullata e sostituita.
+        """
+        significant = self._significant(entity, attributes)
+        if force:
+            pending = self._pending.pop(entity, None)
+            if pending is not None:
+                pending[0].cancel()
+                pending = None
+        else:
+            pending = self._pending.get(entity)
+        if pending is not None:
+            # C'è già una scrittura programmata: aggiorniamo solo i valori
+            pending[1] = value
+            pending[2] = significant
+            self.coalesced += 1
+            return
+
+        last = self._last.get(entity)
+        if last is not None and not self._changed(entity, last, value, significant):
+            self.suppressed += 1
+            return
+
+        now = time.monotonic()
+        interval = self._interval(entity)
+        if not force and last is not None and now - last[2] < interval:
+            delay = interval - (now - last[2])
+            handle = asyncio.get_running_loop().call_later(delay, self._flush, entity)
+            self._pending[entity] = [handle, value, significant]
+            return
+
+        self._write(entity, value, significant, now)
+
+    def forget(self, entity):
+        """Drop the history of an entity (e.g. when it's removed)."""
+        pending = self._pending.pop(entity, None)
+        if pending is not None:
+            pending[0].cancel()
+        self._last.pop(entity, None)
+
+    def stop(self):
+        """Cancel every scheduled write."""
+        for pending in self._pending.values():
+            pending[0].cancel()
+        self._pending.clear()
+
+    def _flush(self, entity):
+        pending = self._pending.pop(entity, None)
+        if pending is None:
+            return
+        _, value, significant = pending
+        last = self._last.get(entity)
+        if last is not None and not self._changed(entity, last, value, significant):
+            self.suppressed += 1
+            return
+        self._write(entity, value, significant, time.monotonic())
+
+    def _write(self, entity, value, significant, now):
+        if entity.hass is None:
+            return
+        if self.write_histogram is None:
+            entity.async_write_ha_state()
+        else:
+            start = time.perf_counter()
+            entity.async_write_ha_state()
+            self.write_histogram.record(time.perf_counter() - start)
+        self._last[entity] = (value, significant, now)
+        self.written += 1
+        self._write_times.append(now)
+        self._prune_write_times(now)
+
+    def _interval(self, entity):
+        interval = getattr(entity, "_min_publish_interval", None)
+        return self._min_interval if interval is None else interval
+
+    def _deadband(self, entity):
+        if getattr(entity, "device_class", None) == "temperature":
+            return self._temperature_deadband
+        return 0
+
+    @staticmethod
+    def _significant(entity, attributes):
+        volatile = getattr(entity, "_volatile_attributes", VOLATILE_ATTRIBUTES)
+        return {k: v for k, v in attributes.items() if k not in volatile}
+
+    def _changed(self, entity, last, value, significant):
+        last_value, last_attributes, _ = last
+        if significant != last_attributes:
+            return True
+        deadband = self._deadband(entity)
+        if (
+            deadband
+            and isinstance(value, (int, float))
+            and isinstance(last_value, (int, float))
+        ):
+            return abs(value - last_value) >= deadband
+        return value != last_value
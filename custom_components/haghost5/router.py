@@ -0,0 +1,261 @@
+"""Single-pass parser and dispatcher for the frames sent by the Ghost5 board."""
+
+import asyncio
+import logging
+import re
+import time
+from typing import NamedTuple, Optional
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class StatusRecord(NamedTuple):
+    """M997 IDLE / PRINTING / PAUSE."""
+    state: str
+
+
+class ProgressRecord(NamedTuple):
+    """M27 <percent>."""
+    percent: int
+
+
+class FileRecord(NamedTuple):
+    """M994 1:/<file>.gcode;<size>."""
+    filename: str
+    size: str
+
+
+class ElapsedRecord(NamedTuple):
+    """M992 HH:MM:SS."""
+    seconds: int
+    formatted: str
+
+
+class TemperatureRecord(NamedTuple):
+    """T:199 /200 B:60 /60 T0:199 /200 T1:0 /0 @:0 B@:0
+
+    L'ordine dei campi segue quello della riga del firmware.
+    """
+    nozzle: Optional[float]
+    nozzle_target: Optional[float]
+    bed: Optional[float]
+    bed_target: Optional[float]
+    t0: Optional[float]
+    t0_target: Optional[float]
+    t1: Optional[float]
+    t1_target: Optional[float]
+    nozzle_power: Optional[float]
+    bed_power: Optional[float]
+
+
+class FileListRecord(NamedTuple):
+    """Riga della risposta a M20: begin, entry (nome file ed eventuale dimensione) o end."""
+    kind: str
+    name: Optional[str] = None
+    size: Optional[int] = None
+
+
+FILE_LIST_BEGIN = "begin"
+FILE_LIST_ENTRY = "entry"
+FILE_LIST_END = "end"
+
+# Coppie "chiave:valore [/target]" della riga temperature.
+# B@ va prima di B e T0/T1 prima di T, altrimenti l'alternanza li spezza.
+_TEMP_RE = re.compile(r"(B@|T0|T1|T|B|@):\s*(-?[\d.]+)(?:\s*/\s*(-?[\d.]+))?")
+
+# Percorso veloce per il formato standard del firmware, in un solo match
+_NUM = r"(-?[\d.]+)"
+_TEMP_FAST_RE = re.compile(
+    rf"T:{_NUM}\s*/\s*{_NUM}\s+B:{_NUM}\s*/\s*{_NUM}"
+    rf"(?:\s+T0:{_NUM}\s*/\s*{_NUM})?(?:\s+T1:{_NUM}\s*/\s*{_NUM})?"
+    rf"(?:\s+@:{_NUM})?(?:\s+B@:{_NUM})?"
+)
+
+
+def _to_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _parse_status(rest):
+    state = rest.split(None, 1)[0] if rest else ""
+    return StatusRecord(state) if state else None
+
+
+def _parse_progress(rest):
+    value = rest.strip().rstrip("%")
+    try:
+        return ProgressRecord(int(float(value)))
+    except ValueError:
+        return None
+
+
+def _parse_file(rest):
+    file_part, sep, size_part = rest.partition(";")
+    if not sep:
+        return None
+    file_part = file_part.strip()
+    if file_part.startswith("1:/"):
+        file_part = file_part[3:]
+    return FileRecord(file_part, size_part.strip())
+
+
+def _parse_elapsed(rest):
+    formatted = rest.strip()
+    parts = formatted.split(":")
+    if len(parts) != 3:
+        return None
+    try:
+        hours, minutes, seconds = (int(p) for p in parts)
+    except ValueError:
+        return None
+    return ElapsedRecord(hours * 3600 + minutes * 60 + seconds, formatted)
+
+
+def parse_temperature(line):
+    """Parse a full temperature line into a TemperatureRecord."""
+    match = _TEMP_FAST_RE.match(line)
+    if match is not None:
+        try:
+            return TemperatureRecord._make(
+                [float(v) if v else None for v in match.groups()]
+            )
+        except ValueError:
+            pass
+
+    values = {}
+    for key, actual, target in _TEMP_RE.findall(line):
+        values[key] = (_to_float(actual), _to_float(target) if target else None)
+    if "T" not in values and "T0" not in values and "B" not in values:
+        return None
+    nozzle = values.get("T") or values.get("T0") or (None, None)
+    bed = values.get("B", (None, None))
+    t0 = values.get("T0", (None, None))
+    t1 = values.get("T1", (None, None))
+    return TemperatureRecord(
+        nozzle=nozzle[0],
+        nozzle_target=nozzle[1],
+        bed=bed[0],
+        bed_target=bed[1],
+        t0=t0[0],
+        t0_target=t0[1],
+        t1=t1[0],
+        t1_target=t1[1],
+        nozzle_power=values.get("@", (None, None))[0],
+        bed_power=values.get("B@", (None, None))[0],
+    )
+
+
+# Tabella di dispatch sul primo token della riga
+_PREFIX_TABLE = {
+    "M997": _parse_status,
+    "M27": _parse_progress,
+    "M994": _parse_file,
+    "M992": _parse_elapsed,
+}
+
+# Comandi che possono comparire davanti a un nome .gcode senza essere una voce della lista
+_NOT_FILE_ENTRIES = ("M994", "M23", "M30")
+
+
+def parse_line(line):
+    """Parse one line of a frame into a record, or None if it's not recognised."""
+    line = line.strip()
+    if not line:
+        return None
+    if line.startswith("ok "):
+        line = line[3:]
+
+    head, _, rest = line.partition(" ")
+    parser = _PREFIX_TABLE.get(head)
+    if parser is not None:
+        return parser(rest)
+
+    if head.startswith(("T:", "T0:", "B:")):
+        return parse_temperature(line)
+    if line.startswith("Begin file list"):
+        return FileListRecord(FILE_LIST_BEGIN)
+    if line.startswith("End file list"):
+        return FileListRecord(FILE_LIST_END)
+    if head in _NOT_FILE_ENTRIES:
+        return None
+    if line.endswith(".gcode"):
+        return FileListRecord(FILE_LIST_ENTRY, line)
+    # Alcuni firmware riportano anche la dimensione: "<nome>.gcode <byte>"
+    name, _, size = line.rpartition(" ")
+    if size.isdigit() and name.endswith(".gcode"):
+        return FileListRecord(FILE_LIST_ENTRY, name, int(size))
+    return None
+
+
+def parse_frame(frame):
+    """Parse a whole frame (one or more lines) into a list of records."""
+    if "\n" not in frame:
+        record = parse_line(frame)
+        return [record] if record is not None else []
+    records = []
+    for line in frame.split("\n"):
+        record = parse_line(line)
+        if record is not None:
+            records.append(record)
+    return records
+
+
+class MessageRouter:
+    """
+    Parsa ogni frame una sola volta e lo consegna solo a chi è iscritto
+    al tipo di record corrispondente.
+
+    Il costo per frame non dipende dal numero di sensori collegati.
+    """
+
+    def __init__(self):
+        self._subscribers = {}
+        self.frames = 0
+        self.unmatched = 0
+        # LatencyHistogram del parsing per riga, solo con la misura dei tempi attiva
+        self.parse_histogram = None
+
+    def subscribe(self, record_type, handler):
+        """
+        Register a handler for a record type.
+
+        The handler is called as handler(record, frame) and may be a plain
+        function or a coroutine function.
+        """
+        entry = (handler, asyncio.iscoroutinefunction(handler))
+        self._subscribers.setdefault(record_type, []).append(entry)
+
+    def unsubscribe(self, record_type, handler):
+        handlers = self._subscribers.get(record_type)
+        if handlers:
+            handlers[:] = [entry for entry in handlers if entry[0] != handler]
+
+    async def route(self, frame):
+        """Parse a frame and dispatch its records to the subscribers."""
+        self.frames += 1
+        lines = (frame,) if "\n" not in frame else frame.split("\n")
+        matched = False
+        histogram = self.parse_histogram
+        for line in lines:
+            if histogram is None:
+                record = parse_line(line)
+            else:
+                start = time.perf_counter()
+                record = parse_line(line)
+                histogram.record(time.perf_counter() - start)
+            if record is None:
+                continue
+            matched = True
+            for handler, is_coroutine in self._subscribers.get(type(record), ()):
+                try:
+                    if is_coroutine:
+                        await handler(record, frame)
+                    else:
+                        handler(record, frame)
+                except Exception as e:
+                    _LOGGER.error("Error dispatching %s: %s", type(record).__name__, e)
+        if not matched:
+            self.unmatched += 1
@@ -0,0 +1,117 @@
+"""Shared polling loop for every printer of the integration."""
+
+import asyncio
+import logging
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class PollScheduler:
+    """
+    Un solo task per tutte le stampanti.
+
+    Ad ogni giro chiama async_tick() di ogni hub registrato (controllo di
+    vivacità e comandi di polling), quindi il costo per stampante è una
+    chiamata per giro e non un task dedicato che dorme. Il task parte col
+    primo hub e si ferma quando viene rimosso l'ultimo.
+    """
+
+    def __init__(self, interval, create_task=None):
+        self._interval = interval
+        self._create_task = create_task or (lambda coro, name: asyncio.create_task(coro, name=name))
+        self._hubs = []
+        self._task = None
+
+    @property
+    def hubs(self):
+        return tuple(self._hubs)
+
+    def add(self, hub):
+        """Register a hub; starts the loop if it's the first one."""
+        if hub in self._hubs:
+            return
+        self._hubs.append(hub)
+        if self._task is None or self._task.done():
+            self._task = self._create_task(self._run(), "haghost5 poll scheduler")
+
+    def remove(self, hub):
+        """Unregister a hub; stops the loop when none is left."""
+        if hub in self._hubs:
+            self._hubs.remove(hub)
+        if not self._hubs and self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self._interval)
+            for hub in list(self._hubs):
+                try:
+                    await hub.async_tick()
+                except Exception as e:
+                    _LOGGER.error("Error polling printer %s: %s", getattr(hub, "ip_address", hub), e)
+
+
+STATE_OFFLINE = "offline"
+STATE_IDLE = "idle"
+STATE_HEATING = "heating"
+STATE_PRINTING = "printing"
+STATE_PAUSED = "paused"
+
+# Backoff delle sonde verso una stampante connessa che non risponde
+PROBE_INTERVAL_MIN = 5
+PROBE_INTERVAL_MAX = 60
+PROBE_QUERY = "M997"
+
+
+class QueryPlan:
+    """
+    Cadenza di ogni interrogazione in base allo stato della stampante.
+
+    intervals è {query: {stato: secondi}}: una query senza intervallo per lo
+    stato corrente non viene inviata. Ad ogni cambio di stato tutte le query
+    tornano scadute, così un passaggio a "printing" aggiorna subito file e
+    avanzamento. Offline si manda solo PROBE_QUERY, con un intervallo che
+    raddoppia ad ogni sonda senza risposta fino a PROBE_INTERVAL_MAX.
+    """
+
+    def __init__(self, intervals):
+        self._intervals = intervals
+        self._last_sent = {}
+        self._probe_interval = PROBE_INTERVAL_MIN
+        self._last_probe = None
+        self.state = STATE_OFFLINE
+
+    def set_state(self, state):
+        if state == self.state:
+            return
+        self.state = state
+        self._last_sent.clear()
+        if state != STATE_OFFLINE:
+            self.reset_backoff()
+
+    def reset_backoff(self):
+        """Prossima sonda subito e di nuovo all'intervallo minimo (es. dopo una riconnessione)."""
+        self._probe_interval = PROBE_INTERVAL_MIN
+        self._last_probe = None
+
+    def due(self, now):
+        """Query da inviare adesso (e le segna come inviate)."""
+        if self.state == STATE_OFFLINE:
+            if self._last_probe is not None and now - self._last_probe < self._probe_interval:
+                return []
+            if self._last_probe is not None:
+                self._probe_interval = min(self._probe_interval * 2, PROBE_INTERVAL_MAX)
+            self._last_probe = now
+            return [PROBE_QUERY]
+
+        due = []
+        for query, by_state in self._intervals.items():
+            interval = by_state.get(self.state)
+            if interval is None:
+                continue
+            last = self._last_sent.get(query)
+            if last is None or now - last >= interval:
+                self._last_sent[query] = now
+                due.append(query)
+        return due
@@ -1,15 +1,20 @@
 import logging
-import re
 import os
-import asyncio
-import json
-import aiofiles
-import traceback
 
-from aiohttp import ClientSession, WSMsgType
 from datetime import datetime, timedelta
 from .const import DOMAIN
-from asyncio import Lock
+from .estimator import ensure_estimate, remaining_time
+from .gcode_index import ensure_index, file_sha256, layer_at_progress
+from .hub import PrinterHub
+from .metrics import LatencyHistogram
+from .publisher import StatePublisher, VOLATILE_ATTRIBUTES
+from .router import (
+    StatusRecord,
+    ProgressRecord,
+    FileRecord,
+    ElapsedRecord,
+    TemperatureRecord,
+)
 
 from homeassistant.components.sensor import (
     SensorEntity,
@@ -23,20 +28,62 @@ from homeassistant.const import (
     STATE_ON,
     PERCENTAGE,             # Per indicare il simbolo/label della percentuale
 )
+from homeassistant.core import callback
+from homeassistant.helpers.entity import EntityCategory
+from homeassistant.helpers.event import async_track_time_interval
+from homeassistant.util import dt as dt_util
 
 _LOGGER = logging.getLogger(__name__)
 
-SCAN_INTERVAL = timedelta(seconds=30)
+WRITE_RATE_REFRESH = timedelta(minutes=1)
+# I sensori dei tempi riportano il p99 dei campioni arrivati tra due aggiornamenti
+LATENCY_REFRESH = timedelta(seconds=30)
+
+# Stadio misurato -> nome del sensore
+LATENCY_SENSORS = {
+    "frame_interval": "Frame interval p99",
+    "parse": "Frame parse p99",
+    "dispatch": "Frame processing p99",
+    "state_write": "State write p99",
+    "round_trip": "Command round trip p99",
+}
 
 class HAGhost5BaseSensor(SensorEntity):
     """Base class for HAGhost5 sensors."""
 
+    # Gli aggiornamenti arrivano in push dal PrinterHub
+    _attr_should_poll = False
+    # Attributi ignorati dal publisher nel decidere se lo stato è cambiato
+    _volatile_attributes = VOLATILE_ATTRIBUTES
+    # ... e che il recorder non salva: cambiano ad ogni frame
+    _unrecorded_attributes = frozenset(VOLATILE_ATTRIBUTES)
+    # None = usa l'intervallo minimo del publisher
+    _min_publish_interval = None
+
     def __init__(self, ip_address: str, sensor_name: str):
         """Initialize the sensor."""
         self._ip_address = ip_address
         self._state = None
         self._attributes = {}
         self._sensor_name = sensor_name  # Name identifier for unique_id
+        self._publisher = None
+
+    def set_publisher(self, publisher: StatePublisher):
+        """Route state writes through the shared publisher."""
+        self._publisher = publisher
+
+    def _publish_state(self, force=False):
+        """
+        Write the state to HA, filtered by the publisher when available.
+        force=True (reset) skips the publisher's minimum interval.
+        """
+        if self.hass is None:
+            _LOGGER.debug("%s not yet added to HA. Skipping state update...", self._sensor_name)
+            return
+        if self._publisher is None:
+            self.async_write_ha_state()
+        else:
+            self._publisher.publish(self, self._state, self.extra_state_attributes, force=force)
 
     @property
     def unique_id(self):
@@ -45,8 +92,10 @@ class HAGhost5BaseSensor(SensorEntity):
 
     @property
     def extra_state_attributes(self):
-        """Return the state attributes."""
-        return self._attributes
+        """Return the state attributes, filtered by the configured attribute profile."""
+        if self._publisher is None:
+            return self._attributes
+        return self._publisher.filter_attributes(self, self._attributes)
 
     @property
     def device_info(self):
@@ -58,16 +107,11 @@ class HAGhost5BaseSensor(SensorEntity):
             "model": "3D Printer",
             "sw_version": "1.0",
         }
-        
-    async def async_update(self):
-        """Default update method for HAGhost5 sensors."""
-        _LOGGER.debug("async_update called for %s, no custom implementation.", self._sensor_name)        
 
 async def async_setup_entry(hass, config_entry, async_add_entities):
     """Set up the HAGhost5 sensor platform."""
     ip_address = config_entry.data["ip_address"]
-
-
+    hub = hass.data[DOMAIN][config_entry.entry_id]
 
     # Crea i sensori
     m992_sensor = PrinterM992Sensor(ip_address)
@@ -76,72 +120,115 @@ async def async_setup_entry(hass, config_entry, async_add_entities):
     m994_sensor = PrinterM994Sensor(ip_address)
     tnozzle_sensor = TNozzleSensor(ip_address)
     tbed_sensor = TBedSensor(ip_address)
-
-    online_sensor = PrinterStatusSensor(ip_address, hass)
-    hass.data[DOMAIN]["printer_status_sensor"] = online_sensor
-
-    # Aggiungi i sensori a Home Assistant
-    async_add_entities([online_sensor, m997_sensor, m27_sensor, m994_sensor, m992_sensor, tbed_sensor, tnozzle_sensor])
-
-    # Collega i sensori M997 e M27 al sensore online
+    layer_sensor = PrinterLayerSensor(ip_address)
+    time_remaining_sensor = PrinterTimeRemainingSensor(ip_address, hub.estimator_params)
+    finish_sensor = PrinterEstimatedFinishSensor(ip_address)
+    write_rate_sensor = PrinterWriteRateSensor(hub)
+    # Diagnostica del percorso caldo, disabilitata di default
+    diagnostic_sensors = [PrinterLatencySensor(hub, stage) for stage in LATENCY_SENSORS]
+    diagnostic_sensors += [PrinterReconnectsSensor(hub), PrinterCommandBacklogSensor(hub)]
+
+    online_sensor = PrinterStatusSensor(hub)
+
+    # Collega i sensori al sensore online prima di aggiungerli:
+    # da qui in poi ricevono gli aggiornamenti in push dal hub
     online_sensor.attach_m997_sensor(m997_sensor)
     online_sensor.attach_m27_sensor(m27_sensor)
     online_sensor.attach_m994_sensor(m994_sensor)
     online_sensor.attach_m992_sensor(m992_sensor)
     online_sensor.attach_tbed_sensor(tbed_sensor)
     online_sensor.attach_tnozzle_sensor(tnozzle_sensor)
+    online_sensor.attach_layer_sensor(layer_sensor)
+    online_sensor.attach_time_remaining_sensor(time_remaining_sensor, finish_sensor)
 
-    # Forza un aggiornamento immediato per ciascun sensore
-    await online_sensor.async_update()
-    await m997_sensor.async_update()
-    await m27_sensor.async_update()
-    await m994_sensor.async_update()
-    await m992_sensor.async_update()
-    await tbed_sensor.async_update()
-    await tnozzle_sensor.async_update()
+    # Aggiungi i sensori a Home Assistant
+    async_add_entities([online_sensor, m997_sensor, m27_sensor, m994_sensor, m992_sensor, tbed_sensor, tnozzle_sensor, layer_sensor, time_remaining_sensor, finish_sensor, write_rate_sensor, *diagnostic_sensors])
 
 class PrinterStatusSensor(HAGhost5BaseSensor):
     """Sensor to represent the printer's online/offline status."""
 
-    def __init__(self, ip_address, hass):
-        super().__init__(ip_address, "printer_online_status")  # Passa ip_address e il nome del sensore
-        self._ws_lock = False  # Variabile per bloccare l'invio di WS
-        self._lock = Lock()  # Lock per sincronizzare l'accesso
-        self._state = STATE_OFF
-        self._last_message_time = None
-        self._websocket_started = False
+    # Contatori diagnostici: esclusi dal recorder e dal profilo "minimal"
+    _volatile_attributes = VOLATILE_ATTRIBUTES + (
+        "queries_sent",
+        "published_writes",
+        "suppressed_writes",
+        "coalesced_writes",
+        "writes_per_minute",
+    )
+    _unrecorded_attributes = frozenset(_volatile_attributes)
+
+    def __init__(self, hub: PrinterHub):
+        super().__init__(hub.ip_address, "printer_online_status")  # Passa ip_address e il nome del sensore
+        self._hub = hub
+        self._state = STATE_ON if hub.online else STATE_OFF
         self._m997_sensor = None
         self._m27_sensor = None
         self._m994_sensor = None
         self._m992_sensor = None
         self._tbed_sensor = None
         self._tnozzle_sensor = None
+        self._layer_sensor = None
+        self._time_remaining_sensor = None
         self._idle_state = False  # Indica se la stampante è in stato IDLE
-        self.hass = hass  # Memorizza il contesto 'hass'
+        self._publisher = hub.publisher
+        hub.router.subscribe(StatusRecord, self._process_status_record)
 
     def attach_m997_sensor(self, m997_sensor):
         """Collega il sensore M997 al sensore online."""
         self._m997_sensor = m997_sensor
+        self._hub.router.subscribe(StatusRecord, m997_sensor.process_record)
+        m997_sensor.set_publisher(self._publisher)
         
     def attach_m27_sensor(self, m27_sensor):
         """Collega il sensore M27 al sensore online."""
         self._m27_sensor = m27_sensor
+        self._hub.router.subscribe(ProgressRecord, m27_sensor.process_record)
+        m27_sensor.set_publisher(self._publisher)
 
     def attach_m994_sensor(self, m994_sensor):
         """Collega il sensore M994 al sensore online."""
         self._m994_sensor = m994_sensor
+        self._hub.router.subscribe(FileRecord, m994_sensor.process_record)
+        m994_sensor.set_publisher(self._publisher)
         
     def attach_m992_sensor(self, m992_sensor):
         """Collega il sensore M992 al sensore online."""
         self._m992_sensor = m992_sensor
+        self._hub.router.subscribe(ElapsedRecord, m992_sensor.process_record)
+        m992_sensor.set_publisher(self._publisher)
 
     def attach_tbed_sensor(self, tbed_sensor):
         """Collega il sensore tbed al sensore online."""
         self._tbed_sensor = tbed_sensor
+        self._hub.router.subscribe(TemperatureRecord, tbed_sensor.process_record)
+        tbed_sensor.set_publisher(self._publisher)
 
     def attach_tnozzle_sensor(self, tnozzle_sensor):
         """Collega il sensore tnozzle al sensore online."""
-        self._tnozzle_sensor = tnozzle_sensor    
+        self._tnozzle_sensor = tnozzle_sensor
+        self._hub.router.subscribe(TemperatureRecord, tnozzle_sensor.process_record)
+        tnozzle_sensor.set_publisher(self._publisher)
+
+    def attach_layer_sensor(self, layer_sensor):
+        """Collega il sensore del layer corrente al sensore online."""
+        self._layer_sensor = layer_sensor
+        self._hub.router.subscribe(FileRecord, layer_sensor.process_file_record)
+        self._hub.router.subscribe(ProgressRecord, layer_sensor.process_record)
+        layer_sensor.set_publisher(self._publisher)
+
+    def attach_time_remaining_sensor(self, time_remaining_sensor, finish_sensor):
+        """Collega i sensori del tempo rimanente e dell'ora di fine al sensore online."""
+        self._time_remaining_sensor = time_remaining_sensor
+        self._hub.router.subscribe(FileRecord, time_remaining_sensor.process_file_record)
+        self._hub.router.subscribe(ProgressRecord, time_remaining_sensor.process_record)
+        self._hub.router.subscribe(ElapsedRecord, time_remaining_sensor.process_elapsed_record)
+        time_remaining_sensor.attach_finish_sensor(finish_sensor)
+        time_remaining_sensor.set_publisher(self._publisher)
+        finish_sensor.set_publisher(self._publisher)
+
+    async def async_added_to_hass(self):
+        """Ascolta i cambi online/offline del hub."""
+        self.async_on_remove(self._hub.add_online_listener(self._handle_online_change))
 
     @property
     def name(self):
@@ -167,32 +254,48 @@ class PrinterStatusSensor(HAGhost5BaseSensor):
         """Return a truly unique ID for the sensor."""
         return f"{self._ip_address}_printer_online_status"
 
-    async def async_update(self):
-        """Check if the printer is online and start WebSocket if needed."""
-        _LOGGER.debug("Checking printer status...")
-        _LOGGER.debug("async_update triggered. Called by: %s", traceback.format_stack())
-        try:
-            async with ClientSession() as session:
-                async with session.get(f"http://{self._ip_address}:80", timeout=5) as response:
-                    if response.status == 200:
-                        if self._state != STATE_ON:
-                            _LOGGER.info("Printer is online. Starting WebSocket...")
-                            self._state = STATE_ON
-                            self._idle_state = False
-                            # Controlla se il WebSocket è già avviato
-                            if not self._websocket_started:
-                                asyncio.create_task(self._start_websocket())
-                            else:
-                                _LOGGER.debug("WebSocket already running. Skipping start.")
-                    
-                        return
-        except Exception as e:
-            _LOGGER.debug("Error checking printer status: %s", e)
-    
-        if self._state != STATE_OFF:
-            _LOGGER.info("Printer is offline.")
-            self._state = STATE_OFF
+    @property
+    def extra_state_attributes(self):
+        """
+        Identità della stampante e contatori del publisher (scritture fatte,
+        soppresse e accorpate). printer_id, ip_address ed entities (gli
+        entity id di file, avanzamento e layer di questa stampante) servono
+        alle card e restano anche col profilo "none".
+        """
+        linked = {
+            "file": self._m994_sensor,
+            "progress": self._m27_sensor,
+            "layer": self._layer_sensor,
+        }
+        identity = {
+            "printer_id": self._hub.printer_id,
+            "ip_address": self._hub.ip_address,
+            "entities": {
+                key: sensor.entity_id
+                for key, sensor in linked.items()
+                if sensor is not None and sensor.entity_id is not None
+            },
+        }
+        attributes = {
+            "polling_state": self._hub.printer_state,
+            "queries_sent": self._hub.queries_sent,
+            **self._publisher.stats,
+        }
+        return {**identity, **self._publisher.filter_attributes(self, attributes)}
+
+    def _handle_online_change(self, online: bool):
+        """Aggiorna lo stato quando il hub rileva la stampante online/offline."""
+        self._state = STATE_ON if online else STATE_OFF
+        if not online:
+            self._idle_state = False
             self._reset_all_sensors()
+        self.async_write_ha_state()
+
+    def _process_status_record(self, record, message):
+        """Aggiorna lo stato IDLE a partire dalla risposta M997."""
+        is_idle = record.state == "IDLE"
+        if is_idle != self._idle_state:
+            self.set_idle_state(is_idle)
 
     def set_idle_state(self, is_idle: bool):
         """Set the printer's idle state and update sensors accordingly."""
@@ -217,6 +320,10 @@ class PrinterStatusSensor(HAGhost5BaseSensor):
             self._tbed_sensor.reset()
         if self._tnozzle_sensor:
             self._tnozzle_sensor.reset()
+        if self._layer_sensor:
+            self._layer_sensor.reset()
+        if self._time_remaining_sensor:
+            self._time_remaining_sensor.reset()
         _LOGGER.info("All sensors have been reset to 0 due to printer being offline.")
 
     def _reset_non_temperature_sensors(self):
@@ -229,173 +336,22 @@ class PrinterStatusSensor(HAGhost5BaseSensor):
             self._m994_sensor.reset()
         if self._m992_sensor:
             self._m992_sensor.reset()
+        if self._layer_sensor:
+            self._layer_sensor.reset()
+        if self._time_remaining_sensor:
+            self._time_remaining_sensor.reset()
         _LOGGER.info("Non-temperature sensors have been reset to 0 due to printer being in IDLE state.")
 
     def send_ws_command(self, command: str):
         """Send a command over the WebSocket."""
-        if not self._websocket_started:
-            _LOGGER.error("Cannot send command; WebSocket is not started.")
-            return
-    
-        asyncio.create_task(self._send_command_via_ws(command))
-    
-    async def _send_command_via_ws(self, command: str):
-        """Helper to send a command asynchronously via WebSocket."""
-        async with self._lock:  # Usa il lock per garantire thread safety
-            if self._ws_lock and not command.startswith("M20"):
-                _LOGGER.warning("WebSocket locked. Command '%s' not sent.", command)
-                return
-    
-            if command.startswith("M20"):
-                self._ws_lock = True  # Blocca l'invio di altri comandi
-                _LOGGER.info("WebSocket locked. Waiting for 'End file list' or timeout.")
-    
-            ws_url = f"ws://{self._ip_address}:8081/"
-            try:
-                async with ClientSession() as session:
-                    async with session.ws_connect(ws_url) as ws:
-                        await ws.send_str(command)
-                        _LOGGER.info("Sent WebSocket command: %s", command)
-            except Exception as e:
-                _LOGGER.error("Error sending WebSocket command: %s", e)
-            finally:
-                if command.startswith("M20"):
-                    # Ripristina il lock solo dopo l'elaborazione completa
-                    self._ws_lock = False
-  
-
-    async def _start_websocket(self):
-        """Start the WebSocket connection and process incoming messages."""
-        if self._websocket_started:
-            _LOGGER.warning("WebSocket is already started. Skipping...")
-            return  # Evita di riaprire il WebSocket se è già avviato
-    
-        self._websocket_started = True
-        ws_url = f"ws://{self._ip_address}:8081/"
-        _LOGGER.info("Connecting to WebSocket at: %s", ws_url)
-
-        # Avvia il polling dei comandi in parallelo
-        asyncio.create_task(self._start_polling_commands())
-
-
-    
-        while self._state == STATE_ON:
-            try:
-                async with ClientSession() as session:
-                    async with session.ws_connect(ws_url) as ws:
-                        async for msg in ws:
-                            if msg.type == WSMsgType.TEXT:
-                                # Process WebSocket messages and update state
-                                if "IDLE" in msg.data:
-                                    self.set_idle_state(True)
-                                else:
-                                    self.set_idle_state(False)
-                                    
-                                _LOGGER.debug("WebSocket message received: %s", msg.data.encode("utf-8"))
-
-                                if re.search(r"Begin file list|\.gcode\s*$|End file list", msg.data):
-                                    await self.process_file_list_message(msg.data)
-
-                                if self._m997_sensor:
-                                    await self._m997_sensor.process_message(msg.data)
-                                if self._m27_sensor:
-                                    await self._m27_sensor.process_message(msg.data)
-                                if self._m994_sensor:
-                                    await self._m994_sensor.process_message(msg.data)
-                                if self._m992_sensor:
-                                    await self._m992_sensor.process_message(msg.data)
-                                if self._tbed_sensor:
-                                    await self._tbed_sensor.process_message(msg.data)
-                                if self._tnozzle_sensor:
-                                    await self._tnozzle_sensor.process_message(msg.data)
-                                    
-                            elif msg.type in {WSMsgType.CLOSED, WSMsgType.ERROR}:
-                                _LOGGER.warning("WebSocket closed or error.")
-                                break
-
-            except Exception as e:
-                _LOGGER.error("WebSocket error: %s", e)
-                await asyncio.sleep(5)  # Retry connection
-    
-        self._websocket_started = False  # WebSocket chiuso, pronto per riaprirlo
-
-    async def _start_polling_commands(self):
-        """Start polling commands to the printer every 5 seconds."""
-        _LOGGER.info("Starting polling commands to the printer.")
-        while self._state == STATE_ON:
-            try:
-                if self._websocket_started:                   
-                    await self._send_command_via_ws("M27\nM992\nM994\nM991\nM997\n")
-                await asyncio.sleep(5)  # Aspetta 5 secondi prima di inviare di nuovo i comandi
-            except Exception as e:
-                _LOGGER.error("Error during polling commands: %s", e)
-                break
-        _LOGGER.info("Polling commands stopped because the printer is offline.")
-
-    async def process_file_list_message(self, message):
-        """Elabora i messaggi della lista file e gestisce timeout per completare la lista."""
-        if not hasattr(self, '_file_list'):
-            self._file_list = []
-            self._file_list_timer = None
-
-        if message.startswith("Begin file list"):
-            self._file_list = []  # Inizializza una nuova lista
-            if self._file_list_timer:
-                self._file_list_timer.cancel()
-                self._file_list_timer = None
-            _LOGGER.info("Started processing file list.")
-
-        elif re.match(r"^(?!M(994|23|30)\\s).+\\.gcode\\s*$", message):  # Escludi M994, M23, M30
-            clean_message = message.strip()
-            self._file_list.append(clean_message)
-            _LOGGER.info("Added file to list (via RegEx): %s", clean_message)
-
-        elif message.startswith("End file list"):
-            self._handle_end_file_list()
-
-        else:
-            # In caso di timeout
-            if self._file_list_timer:
-                self._file_list_timer.cancel()
-            self._file_list_timer = asyncio.get_event_loop().call_later(10, self._handle_file_list_timeout)
-
-    async def _handle_end_file_list(self):
-        """Gestisce il completamento della lista file."""
-        if self._file_list_timer:
-            self._file_list_timer.cancel()
-            self._file_list_timer = None
-
-        await self.save_gcode_file_list(self._file_list)  # Chiamata senza passare 'hass'
-        self._file_list = []  # Resetta la lista
-        self._ws_lock = False  # Sblocca l'invio dei comandi
-        _LOGGER.info("Completed processing file list. WebSocket unlocked.")
-    
-    async def _handle_file_list_timeout(self):
-        """Gestisce il timeout per il completamento della lista file."""
-        if self._file_list:
-            await self.save_gcode_file_list(self._file_list)  # Salva i file accumulati finora
-            self._ws_lock = False
-            _LOGGER.warning("File list processing timed out. Saved incomplete list.")
-        self._file_list = []  # Reset della lista
-
-    async def save_gcode_file_list(self, file_list):
-        """Salva la lista dei file in un file JSON."""
-        json_path = self.hass.config.path("www", "community", "haghost5", "files.json")
-        try:
-            async with aiofiles.open(json_path, "w") as json_file:
-                await json_file.write(json.dumps(file_list, indent=4))
-            _LOGGER.info("File list saved to JSON at: %s", json_path)
-            self._ws_lock = False
-        except Exception as e:
-            _LOGGER.error("Failed to save file list to JSON: %s", e)
-            self._ws_lock = False
-
-
-
+        self._hub.send_ws_command(command)
 
 class PrinterM997Sensor(HAGhost5BaseSensor):
     """Sensor to represent the printer's status from M997 messages."""
 
+    # I cambi di stato (IDLE/PRINTING) vanno pubblicati subito
+    _min_publish_interval = 0
+
     def __init__(self, ip_address):
         super().__init__(ip_address, "printer_m997_status")
         self._state = None
@@ -403,7 +359,8 @@ class PrinterM997Sensor(HAGhost5BaseSensor):
     def reset(self):
         """Reimposta il sensore allo stato iniziale."""
         self._state = 0
-        _LOGGER.info("PrinterM997Sensor reset to 0.")
+        _LOGGER.info("%s reset to 0.", type(self).__name__)
+        self._publish_state(force=True)
 
     @property
     def name(self):
@@ -413,11 +370,6 @@ class PrinterM997Sensor(HAGhost5BaseSensor):
     def state(self):
         return self._state
         
-    @property
-    def extra_state_attributes(self):
-        """Eventuali attributi extra da visualizzare in HA."""
-        return self._attributes        
-
     @property
     def device_info(self):
         """Return device information for Home Assistant."""
@@ -434,22 +386,16 @@ class PrinterM997Sensor(HAGhost5BaseSensor):
         """Return a truly unique ID for the sensor."""
         return f"{self._ip_address}_printer_m997_status"
         
-    async def process_message(self, message):
-        """Process a WebSocket message and extract M997 status."""
-        try:
-            # Cerca un messaggio che inizia con "M997"
-            pattern = r"M997\s+([^\s]+)"
-            match = re.search(pattern, message)
-            if match:
-                self._state = match.group(1)  # Lo stato estratto dal messaggio
-                self._attributes = {
-                    "last_update": datetime.now().isoformat(),
-                    "raw_message": message,
-                }
-                _LOGGER.debug("Printer M997 Status updated: %s", self._state)
-                self.async_write_ha_state()
-        except Exception as e:
-            _LOGGER.error("Error processing message: %s", e)
+    def process_record(self, record, message):
+        """Update the state from a parsed M997 record."""
+        self._state = record.state  # Lo stato estratto dal messaggio
+        self._attributes = {
+            "last_update": datetime.now().isoformat(),
+            "raw_message": message,
+        }
+        _LOGGER.debug("Printer M997 Status updated: %s", self._state)
+        self._publish_state()
+
 
 class PrinterM27Sensor(HAGhost5BaseSensor):
     """Sensor to represent the printer's status from M27 messages."""
@@ -461,7 +407,8 @@ class PrinterM27Sensor(HAGhost5BaseSensor):
     def reset(self):
         """Reimposta il sensore allo stato iniziale."""
         self._state = 0
-        _LOGGER.info("PrinterM997Sensor reset to 0.")
+        _LOGGER.info("%s reset to 0.", type(self).__name__)
+        self._publish_state(force=True)
     
     @property
     def name(self):
@@ -517,22 +464,15 @@ class PrinterM27Sensor(HAGhost5BaseSensor):
         """Return a truly unique ID for the sensor."""
         return f"{self._ip_address}_printer_m27_status"
         
-    async def process_message(self, message):
-        """Process a WebSocket message and extract M27 status."""
-        try:
-            # Cerca un messaggio che inizia con "M27"
-            pattern = r"M27\s+([^\s]+)"
-            match = re.search(pattern, message)
-            if match:
-                self._state = match.group(1)  # Lo stato estratto dal messaggio
-                self._attributes = {
-                    "last_update": datetime.now().isoformat(),
-                    "raw_message": message,
-                }
-                _LOGGER.debug("Printer M27 Status updated: %s", self._state)
-                self.async_write_ha_state()  # Assicurati che venga chiamato
-        except Exception as e:
-            _LOGGER.error("Error processing message: %s", e)
+    def process_record(self, record, message):
+        """Update the state from a parsed M27 record."""
+        self._state = record.percent  # Percentuale estratta dal messaggio
+        self._attributes = {
+            "last_update": datetime.now().isoformat(),
+            "raw_message": message,
+        }
+        _LOGGER.debug("Printer M27 Status updated: %s", self._state)
+        self._publish_state()
 
 
 class PrinterM994Sensor(HAGhost5BaseSensor):
@@ -547,7 +487,8 @@ class PrinterM994Sensor(HAGhost5BaseSensor):
     def reset(self):
         """Reimposta il sensore allo stato iniziale."""
         self._state = 0
-        _LOGGER.info("PrinterM997Sensor reset to 0.")    
+        _LOGGER.info("%s reset to 0.", type(self).__name__)
+        self._publish_state(force=True)
     
     @property
     def name(self):
@@ -591,11 +532,6 @@ class PrinterM994Sensor(HAGhost5BaseSensor):
         """
         return None
 
-    @property
-    def extra_state_attributes(self):
-        """Eventuali attributi extra da visualizzare in HA."""
-        return self._attributes
-
     @property
     def device_info(self):
         """Return device information for Home Assistant."""
@@ -612,37 +548,20 @@ class PrinterM994Sensor(HAGhost5BaseSensor):
         """Return a truly unique ID for the sensor."""
         return f"{self._ip_address}_printer_m994_status"
 
-    async def process_message(self, message):
+    def process_record(self, record, message):
         """
-        Elabora un messaggio WebSocket che inizia con M994.
+        Aggiorna lo stato da un record M994.
         Esempio di messaggio: 
            M994 1:/FBG5_stampo2.2.gcode;-788190462
         """
-        try:
-            # Cerchiamo una stringa che inizi con "M994", seguita da uno spazio,
-            # poi un blocco (es. "1:/FBG5_stampo2.2.gcode") e un separatore ";",
-            # infine un valore numerico.
-            pattern = r"M994\s+([^;]+);([^\s]+)"
-            match = re.search(pattern, message)
-            if match:
-                file_part = match.group(1)   # "1:/FBG5_stampo2.2.gcode"
-                size_part = match.group(2)  # "-788190462" (o qualunque numero)
-
-                # Se preferisci "ripulire" l'eventuale prefisso "1:/", puoi farlo qui.
-                # Esempio:
-                if file_part.startswith("1:/"):
-                    file_part = file_part[3:]
-
-                self._state = file_part  # Memorizziamo come stato il nome del file
-                self._attributes = {
-                    "last_update": datetime.now().isoformat(),
-                    "raw_message": message,
-                    "possible_size": size_part,  # Sconosciuto, ma lo salviamo
-                }
-                _LOGGER.debug("Printer M994 filename updated: %s", self._state)
-                self.async_write_ha_state()
-        except Exception as e:
-            _LOGGER.error("Error processing M994 message: %s", e)
+        self._state = record.filename  # Nome del file, già senza prefisso "1:/"
+        self._attributes = {
+            "last_update": datetime.now().isoformat(),
+            "raw_message": message,
+            "possible_size": record.size,  # Sconosciuto, ma lo salviamo
+        }
+        _LOGGER.debug("Printer M994 filename updated: %s", self._state)
+        self._publish_state()
 
 
 class PrinterM992Sensor(HAGhost5BaseSensor):
@@ -661,7 +580,8 @@ class PrinterM992Sensor(HAGhost5BaseSensor):
     def reset(self):
         """Reimposta il sensore allo stato iniziale."""
         self._state = 0
-        _LOGGER.info("PrinterM997Sensor reset to 0.")    
+        _LOGGER.info("%s reset to 0.", type(self).__name__)
+        self._publish_state(force=True)
     
     @property
     def native_value(self):
@@ -690,10 +610,6 @@ class PrinterM992Sensor(HAGhost5BaseSensor):
         """
         return SensorStateClass.MEASUREMENT
 
-    @property
-    def extra_state_attributes(self):
-        return self._attributes
-
     @property
     def device_info(self):
         return {
@@ -708,50 +624,43 @@ class PrinterM992Sensor(HAGhost5BaseSensor):
     def unique_id(self):
         return f"{self._ip_address}_printer_elapsed_time"
 
-    async def process_message(self, message):
+    def process_record(self, record, message):
         """
         Esempio di messaggio: 
            M992 00:46:49
         """
-        try:
-            pattern = r"M992\s+(\d{2}:\d{2}:\d{2})"
-            match = re.search(pattern, message)
-            if match:
-                time_string = match.group(1)  # "00:46:49"
-
-                # Converti la stringa in un oggetto datetime (fittizio) 
-                # e poi calcola i secondi totali
-                t = datetime.strptime(time_string, "%H:%M:%S")
-                # Di default, la data sarà 1900-01-01; 
-                # usiamo total_seconds rispetto a mezzanotte:
-                seconds_elapsed = t.hour * 3600 + t.minute * 60 + t.second
-
-                self._state = seconds_elapsed
-                self._attributes = {
-                    "last_update": datetime.now().isoformat(),
-                    "raw_message": message,
-                    "formatted_time": time_string  # manteniamo l'HH:mm:ss negli attributi
-                }
-                _LOGGER.debug(
-                    "Printer M992 time updated: %s (%s seconds)",
-                    time_string, self._state
-                )
-                if self.hass is not None:
-                    self.async_write_ha_state()
-                else:
-                    _LOGGER.warning("Sensor not yet added to HA. Skipping state update...")
-        except Exception as e:
-            _LOGGER.error("Error processing M992 message: %s", e)
+        self._state = record.seconds
+        self._attributes = {
+            "last_update": datetime.now().isoformat(),
+            "raw_message": message,
+            "formatted_time": record.formatted  # manteniamo l'HH:mm:ss negli attributi
+        }
+        _LOGGER.debug(
+            "Printer M992 time updated: %s (%s seconds)",
+            record.formatted, self._state
+        )
+        self._publish_state()
+
 
 class TBedSensor(HAGhost5BaseSensor):
     """Sensor for the bed temperature (extracts the value after B:)."""
 
+    # La potenza del riscaldatore oscilla ad ogni frame
+    _volatile_attributes = VOLATILE_ATTRIBUTES + ("power", "t0", "t1")
+    _unrecorded_attributes = frozenset(_volatile_attributes)
+
     def __init__(self, ip_address):
         super().__init__(ip_address, "tbed_sensor")
         self._ip_address = ip_address
         self._state = None
         self._attributes = {}
 
+    def reset(self):
+        """Reimposta il sensore allo stato iniziale."""
+        self._state = 0
+        _LOGGER.info("%s reset to 0.", type(self).__name__)
+        self._publish_state(force=True)
+
     @property
     def name(self):
         return "Bed Temperature"
@@ -793,40 +702,44 @@ class TBedSensor(HAGhost5BaseSensor):
         """ID univoco per il sensore bed."""
         return f"{self._ip_address}_bed_temp"
 
-    async def process_message(self, message):
+    def process_record(self, record, message):
         """
-        Cerca la temperatura del bed subito dopo 'B:'.
+        Temperatura del bed dalla riga temperature.
         Esempio di stringa: "T:199 /200 B:60 /60 T0:199 /200 T1:0 /0 @:0 B@:0"
         """
-        try:
-            pattern = r"B:([\d\.]+)"
-            match = re.search(pattern, message)
-            if match:
-                bed_temp = float(match.group(1))
-                self._state = bed_temp
-                self._attributes = {
-                    "last_update": datetime.now().isoformat(),
-                    "raw_message": message,
-                }
-                _LOGGER.debug("Bed temperature updated: %s", bed_temp)
-
-                if self.hass is not None:
-                    self.async_write_ha_state()
-                else:
-                    _LOGGER.warning("Bed sensor not yet in HA. Skipping state update...")
+        if record.bed is None:
+            return
+        self._state = record.bed
+        self._attributes = {
+            "last_update": datetime.now().isoformat(),
+            "raw_message": message,
+            "target": record.bed_target,
+            "power": record.bed_power,
+        }
+        _LOGGER.debug("Bed temperature updated: %s", record.bed)
+
+        self._publish_state()
 
-        except Exception as e:
-            _LOGGER.error("Error processing bed temperature message: %s", e)
 
 class TNozzleSensor(HAGhost5BaseSensor):
     """Sensor for the nozzle temperature (extracts the value after T:)."""
 
+    # La potenza del riscaldatore oscilla ad ogni frame
+    _volatile_attributes = VOLATILE_ATTRIBUTES + ("power", "t0", "t1")
+    _unrecorded_attributes = frozenset(_volatile_attributes)
+
     def __init__(self, ip_address):
         super().__init__(ip_address, "tnozzle_sensor")
         self._ip_address = ip_address
         self._state = None
         self._attributes = {}
 
+    def reset(self):
+        """Reimposta il sensore allo stato iniziale."""
+        self._state = 0
+        _LOGGER.info("%s reset to 0.", type(self).__name__)
+        self._publish_state(force=True)
+
     @property
     def name(self):
         """Nome visualizzato in Home Assistant."""
@@ -873,28 +786,543 @@ class TNozzleSensor(HAGhost5BaseSensor):
         """ID univoco per il sensore nozzle."""
         return f"{self._ip_address}_nozzle_temp"
 
-    async def process_message(self, message):
+    def process_record(self, record, message):
         """
-        Cerca la temperatura nozzle subito dopo 'T:'.
+        Temperatura nozzle dalla riga temperature.
         Esempio di stringa: "T:199 /200 B:60 /60 T0:199 /200 T1:0 /0 @:0 B@:0"
         """
+        if record.nozzle is None:
+            return
+        self._state = record.nozzle
+        self._attributes = {
+            "last_update": datetime.now().isoformat(),
+            "raw_message": message,
+            "target": record.nozzle_target,
+            "power": record.nozzle_power,
+            "t0": record.t0,
+            "t0_target": record.t0_target,
+            "t1": record.t1,
+            "t1_target": record.t1_target,
+        }
+        _LOGGER.debug("Nozzle temperature updated: %s", record.nozzle)
+
+        self._publish_state()
+
+class PrinterLayerSensor(HAGhost5BaseSensor):
+    """
+    Sensor for the layer being printed.
+
+    Combina il nome del file (M994) con l'avanzamento (M27) e l'indice dei
+    layer del file caricato in www/community/haghost5/gcodes: ad ogni
+    aggiornamento di M27 il layer si trova con una ricerca binaria sugli
+    offset in byte, senza rileggere il file.
+    """
+
+    def __init__(self, ip_address):
+        super().__init__(ip_address, "printer_current_layer")
+        self._filename = None
+        self._index = None
+        self._progress = None
+
+    def reset(self):
+        """Reimposta il sensore allo stato iniziale."""
+        self._state = 0
+        self._progress = None
+        self._attributes = {}
+        _LOGGER.info("%s reset to 0.", type(self).__name__)
+        self._publish_state(force=True)
+
+    @property
+    def name(self):
+        return "Current Layer"
+
+    @property
+    def native_value(self):
+        """Numero del layer in stampa (da 1)."""
+        return self._state
+
+    @property
+    def icon(self):
+        return "mdi:layers-triple"
+
+    @property
+    def state_class(self):
+        return SensorStateClass.MEASUREMENT
+
+    @property
+    def unique_id(self):
+        return f"{self._ip_address}_printer_current_layer"
+
+    def process_file_record(self, record, message):
+        """Nuovo file in stampa: carica il suo indice in background."""
+        filename = os.path.basename(record.filename)
+        if filename == self._filename or self.hass is None:
+            return
+        self._filename = filename
+        self._index = None
+        path = self.hass.config.path("www", "community", "haghost5", "gcodes", filename)
+        self.hass.async_create_task(self._load_index(filename, path))
+
+    async def _load_index(self, filename, path):
         try:
-            pattern = r"T:([\d\.]+)"
-            match = re.search(pattern, message)
-            if match:
-                nozzle_temp = float(match.group(1))
-                self._state = nozzle_temp
-                self._attributes = {
-                    "last_update": datetime.now().isoformat(),
-                    "raw_message": message,
-                }
-                _LOGGER.debug("Nozzle temperature updated: %s", nozzle_temp)
-
-                if self.hass is not None:
-                    self.async_write_ha_state()
-                else:
-                    _LOGGER.warning("Nozzle sensor not yet in HA. Skipping state update...")
+            index = await self.hass.async_add_executor_job(_load_local_index, path)
+        except Exception as e:
+            _LOGGER.warning("Unable to load layer index for %s: %s", filename, e)
+            return
+        if filename != self._filename:
+            return  # nel frattempo è cambiato file
+        if index is None:
+            _LOGGER.debug("No local copy of %s, current layer unavailable.", filename)
+            return
+        self._index = index
+        self._update_layer()
+
+    def process_record(self, record, message):
+        """Update the layer from a parsed M27 record."""
+        self._progress = record.percent
+        self._update_layer()
+
+    def _update_layer(self):
+        if self._index is None or self._progress is None:
+            return
+        layer = layer_at_progress(self._index, self._progress)
+        if layer is None:
+            return
+        layer_count = self._index["layer_count"]
+        self._state = layer + 1
+        self._attributes = {
+            "last_update": datetime.now().isoformat(),
+            "filename": self._filename,
+            "z": self._index["layers"]["z"][layer],
+            "layer_count": layer_count,
+            "layers_remaining": layer_count - (layer + 1),
+        }
+        _LOGGER.debug("Current layer updated: %s/%s", self._state, layer_count)
+        self._publish_state()
+
+
+def _load_local_index(path):
+    """Indice del file se ne esiste una copia locale, altrimenti None."""
+    if not os.path.isfile(path):
+        return None
+    return ensure_index(path)
+
+
+class PrinterTimeRemainingSensor(HAGhost5BaseSensor):
+    """
+    Sensor for the estimated time left in the print.
+
+    La stima dei tempi del file (estimator.py, calcolata all'upload e salvata
+    accanto al G-code) dà il tempo rimanente all'avanzamento M27; il tempo
+    trascorso M992 corregge l'errore del modello cinematico per questa
+    stampante. Ad ogni aggiornamento passa l'ora di fine al sensore collegato.
+    """
+
+    def __init__(self, ip_address, estimator_params):
+        super().__init__(ip_address, "printer_time_remaining")
+        self._estimator_params = estimator_params
+        self._filename = None
+        self._estimate = None
+        self._progress = None
+        self._elapsed = None
+        # (avanzamento, tempo trascorso) al primo M27 sopra 0, vedi remaining_time
+        self._start = None
+        self._finish_sensor = None
+
+    def attach_finish_sensor(self, finish_sensor):
+        self._finish_sensor = finish_sensor
+
+    def reset(self):
+        """Reimposta il sensore allo stato iniziale."""
+        self._state = 0
+        self._progress = None
+        self._elapsed = None
+        self._start = None
+        self._attributes = {}
+        _LOGGER.info("%s reset to 0.", type(self).__name__)
+        self._publish_state(force=True)
+        if self._finish_sensor:
+            self._finish_sensor.reset()
+
+    @property
+    def name(self):
+        return "Time Remaining"
+
+    @property
+    def device_class(self):
+        return SensorDeviceClass.DURATION
+
+    @property
+    def native_value(self):
+        return self._state
+
+    @property
+    def native_unit_of_measurement(self):
+        return UnitOfTime.SECONDS
 
+    @property
+    def icon(self):
+        return "mdi:timer-sand"
+
+    @property
+    def state_class(self):
+        return SensorStateClass.MEASUREMENT
+
+    @property
+    def unique_id(self):
+        return f"{self._ip_address}_printer_time_remaining"
+
+    def process_file_record(self, record, message):
+        """Nuovo file in stampa: carica la sua stima in background."""
+        filename = os.path.basename(record.filename)
+        if filename == self._filename or self.hass is None:
+            return
+        self._filename = filename
+        self._estimate = None
+        self._start = None
+        path = self.hass.config.path("www", "community", "haghost5", "gcodes", filename)
+        self.hass.async_create_task(self._load_estimate(filename, path))
+
+    async def _load_estimate(self, filename, path):
+        try:
+            estimate = await self.hass.async_add_executor_job(
+                _load_local_estimate, path, self._estimator_params
+            )
         except Exception as e:
-            _LOGGER.error("Error processing nozzle temperature message: %s", e)
+            _LOGGER.warning("Unable to estimate print time for %s: %s", filename, e)
+            return
+        if filename != self._filename:
+            return  # nel frattempo è cambiato file
+        if estimate is None:
+            _LOGGER.debug("No local copy of %s, time remaining unavailable.", filename)
+            return
+        self._estimate = estimate
+        self._update_remaining()
+
+    def process_record(self, record, message):
+        """Update the estimate from a parsed M27 record."""
+        self._progress = record.percent
+        self._update_remaining()
+
+    def process_elapsed_record(self, record, message):
+        """Update the estimate from a parsed M992 record."""
+        self._elapsed = record.seconds
+        self._update_remaining()
+
+    def _update_remaining(self):
+        if self._start is None and self._progress and self._elapsed is not None:
+            self._start = (self._progress, self._elapsed)
+        if self._estimate is None or self._progress is None:
+            return
+        remaining, layer, correction = remaining_time(
+            self._estimate, self._progress, self._elapsed, self._start
+        )
+        # Al minuto: basta per un'ETA e limita le scritture nel recorder
+        self._state = int(round(remaining / 60)) * 60
+        self._attributes = {
+            "last_update": datetime.now().isoformat(),
+            "filename": self._filename,
+            "estimated_total": self._estimate["total"],
+            "correction": round(correction, 2),
+            "layer_time": self._estimate["layer_times"][layer] if layer is not None else None,
+        }
+        _LOGGER.debug("Time remaining updated: %s s (correction %.2f)", self._state, correction)
+        self._publish_state()
+        if self._finish_sensor:
+            self._finish_sensor.set_finish(dt_util.now() + timedelta(seconds=self._state))
+
+
+def _load_local_estimate(path, estimator_params):
+    """Stima dei tempi del file se ne esiste una copia locale, altrimenti None."""
+    if not os.path.isfile(path):
+        return None
+    return ensure_estimate(path, file_sha256(path), **estimator_params)
+
+
+class PrinterEstimatedFinishSensor(HAGhost5BaseSensor):
+    """Sensor for the estimated end of the print, fed by PrinterTimeRemainingSensor."""
+
+    def __init__(self, ip_address):
+        super().__init__(ip_address, "printer_estimated_finish")
+
+    def reset(self):
+        """Reimposta il sensore allo stato iniziale."""
+        self._state = None
+        _LOGGER.info("%s reset.", type(self).__name__)
+        self._publish_state(force=True)
+
+    def set_finish(self, finish):
+        self._state = finish.replace(second=0, microsecond=0)
+        self._publish_state()
+
+    @property
+    def name(self):
+        return "Estimated Finish"
+
+    @property
+    def device_class(self):
+        return SensorDeviceClass.TIMESTAMP
+
+    @property
+    def native_value(self):
+        return self._state
+
+    @property
+    def icon(self):
+        return "mdi:clock-end"
+
+    @property
+    def unique_id(self):
+        return f"{self._ip_address}_printer_estimated_finish"
+
+
+class PrinterWriteRateSensor(HAGhost5BaseSensor):
+    """
+    Diagnostic sensor: state writes per minute for the printer.
+
+    Conta le scritture fatte dal publisher del hub, cioè le righe che finiscono
+    nel recorder, per verificare l'effetto di profilo attributi, deadband e
+    intervallo minimo. Si aggiorna una volta al minuto.
+    """
+
+    _attr_entity_category = EntityCategory.DIAGNOSTIC
+
+    def __init__(self, hub: PrinterHub):
+        super().__init__(hub.ip_address, "state_writes_per_minute")
+        self._hub = hub
+        self._state = 0
+
+    async def async_added_to_hass(self):
+        self.async_on_remove(
+            async_track_time_interval(self.hass, self._refresh, WRITE_RATE_REFRESH)
+        )
+
+    @callback
+    def _refresh(self, now=None):
+        self._state = self._hub.publisher.writes_per_minute
+        self.async_write_ha_state()
+
+    @property
+    def name(self):
+        return "State writes per minute"
+
+    @property
+    def native_value(self):
+        return self._state
+
+    @property
+    def native_unit_of_measurement(self):
+        return "writes/min"
+
+    @property
+    def icon(self):
+        return "mdi:database-arrow-down"
+
+    @property
+    def state_class(self):
+        return SensorStateClass.MEASUREMENT
+
+    @property
+    def extra_state_attributes(self):
+        return {}
+
+    @property
+    def unique_id(self):
+        return f"{self._ip_address}_state_writes_per_minute"
+
+
+class PrinterLatencySensor(HAGhost5BaseSensor):
+    """
+    Diagnostic sensor: p99 of one stage of the receive path, in milliseconds.
+
+    Disabilitato di default. Finché è abilitato tiene attiva la misura dei
+    tempi del hub (HubMetrics); ogni LATENCY_REFRESH riporta il p99 dei
+    campioni arrivati dall'aggiornamento precedente, con p50, massimo del
+    bucket e numero di campioni negli attributi.
+    """
+
+    _attr_entity_category = EntityCategory.DIAGNOSTIC
+    _attr_entity_registry_enabled_default = False
+
+    def __init__(self, hub: PrinterHub, stage: str):
+        super().__init__(hub.ip_address, f"latency_{stage}")
+        self._hub = hub
+        self._stage = stage
+        self._previous = None
+
+    async def async_added_to_hass(self):
+        metrics = self._hub.acquire_metrics()
+        self._previous = metrics.histograms[self._stage].snapshot()
+        self.async_on_remove(self._hub.release_metrics)
+        self.async_on_remove(
+            async_track_time_interval(self.hass, self._refresh, LATENCY_REFRESH)
+        )
+
+    @callback
+    def _refresh(self, now=None):
+        metrics = self._hub.metrics
+        if metrics is None:
+            return
+        counts = metrics.histograms[self._stage].snapshot()
+        window = [c - p for c, p in zip(counts, self._previous)]
+        self._previous = counts
+        p50, p99, p100 = (_percentile_ms(window, q) for q in (50, 99, 100))
+        self._state = p99
+        self._attributes = {"p50": p50, "max": p100, "samples": sum(window)}
+        self.async_write_ha_state()
+
+    @property
+    def name(self):
+        return LATENCY_SENSORS[self._stage]
+
+    @property
+    def native_value(self):
+        return self._state
+
+    @property
+    def native_unit_of_measurement(self):
+        return UnitOfTime.MILLISECONDS
+
+    @property
+    def device_class(self):
+        return SensorDeviceClass.DURATION
+
+    @property
+    def state_class(self):
+        return SensorStateClass.MEASUREMENT
+
+    @property
+    def icon(self):
+        return "mdi:timer-outline"
+
+    @property
+    def extra_state_attributes(self):
+        return self._attributes
+
+    @property
+    def unique_id(self):
+        return f"{self._ip_address}_latency_{self._stage}"
+
+
+def _percentile_ms(counts, q):
+    seconds = LatencyHistogram.percentile(counts, q)
+    return None if seconds is None else round(seconds * 1000, 2)
+
+
+class PrinterReconnectsSensor(HAGhost5BaseSensor):
+    """
+    Diagnostic sensor: WebSocket reconnections since the integration started.
+
+    Disabilitato di default; errori di connessione e di invio, sonde TCP
+    fallite, socket chiusi per inattività e comandi scartati a coda piena
+    sono negli attributi.
+    """
+
+    _attr_entity_category = EntityCategory.DIAGNOSTIC
+    _attr_entity_registry_enabled_default = False
+
+    def __init__(self, hub: PrinterHub):
+        super().__init__(hub.ip_address, "websocket_reconnects")
+        self._hub = hub
+        self._state = 0
+
+    async def async_added_to_hass(self):
+        self.async_on_remove(
+            async_track_time_interval(self.hass, self._refresh, LATENCY_REFRESH)
+        )
+
+    @callback
+    def _refresh(self, now=None):
+        connection = self._hub.connection
+        self._state = connection.reconnects
+        self._attributes = {
+            "connection_errors": connection.connection_errors,
+            "probe_failures": connection.probe_failures,
+            "stalled_connections": connection.stalls,
+            "send_errors": connection.send_errors,
+            "dropped_commands": connection.dropped_commands,
+        }
+        self.async_write_ha_state()
+
+    @property
+    def name(self):
+        return "WebSocket reconnects"
+
+    @property
+    def native_value(self):
+        return self._state
+
+    @property
+    def state_class(self):
+        return SensorStateClass.TOTAL_INCREASING
+
+    @property
+    def icon(self):
+        return "mdi:lan-disconnect"
+
+    @property
+    def extra_state_attributes(self):
+        return self._attributes
+
+    @property
+    def unique_id(self):
+        return f"{self._ip_address}_websocket_reconnects"
+
+
+class PrinterCommandBacklogSensor(HAGhost5BaseSensor):
+    """
+    Diagnostic sensor: commands waiting to be sent to the printer.
+
+    Disabilitato di default; il picco della coda e le scritture di stato
+    rinviate dal publisher sono negli attributi.
+    """
+
+    _attr_entity_category = EntityCategory.DIAGNOSTIC
+    _attr_entity_registry_enabled_default = False
+
+    def __init__(self, hub: PrinterHub):
+        super().__init__(hub.ip_address, "command_backlog")
+        self._hub = hub
+        self._state = 0
+
+    async def async_added_to_hass(self):
+        self.async_on_remove(
+            async_track_time_interval(self.hass, self._refresh, LATENCY_REFRESH)
+        )
+
+    @callback
+    def _refresh(self, now=None):
+        self._state = self._hub.connection.backlog
+        self._attributes = {
+            "backlog_peak": self._hub.connection.backlog_peak,
+            "pending_state_writes": self._hub.publisher.pending,
+        }
+        self.async_write_ha_state()
+
+    @property
+    def name(self):
+        return "Command backlog"
 
+    @property
+    def native_value(self):
+        return self._state
+
+    @property
+    def native_unit_of_measurement(self):
+        return "commands"
+
+    @property
+    def state_class(self):
+        return SensorStateClass.MEASUREMENT
+
+    @property
+    def icon(self):
+        return "mdi:tray-full"
+
+    @property
+    def extra_state_attributes(self):
+        return self._attributes
+
+    @property
+    def unique_id(self):
+        return f"{self._ip_address}_command_backlog"
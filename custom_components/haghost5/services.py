@@ -0,0 +1,141 @@
+"""Services of the HAGhost5 integration."""
+
+import asyncio
+import logging
+import os
+
+import voluptuous as vol
+
+from homeassistant.core import HomeAssistant, ServiceCall, SupportsResponse
+from homeassistant.exceptions import HomeAssistantError
+
+from .connection import REQUEST_TIMEOUT
+from .const import DOMAIN
+from .hub import get_hub
+from .streaming import (
+    GcodeStream,
+    STREAM_ACK_TIMEOUT,
+    STREAM_MAX_WINDOW,
+    STREAM_WINDOW,
+    file_lines,
+    iterate_lines,
+)
+
+_LOGGER = logging.getLogger(__name__)
+
+SERVICE_SEND_COMMAND = "send_command"
+SERVICE_STREAM_GCODE = "stream_gcode"
+
+SEND_COMMAND_SCHEMA = vol.Schema(
+    {
+        vol.Optional("printer"): str,
+        vol.Required("command"): str,
+        vol.Optional("expect"): str,
+        vol.Optional("timeout", default=REQUEST_TIMEOUT): vol.All(
+            vol.Coerce(float), vol.Range(min=0.1, max=300)
+        ),
+    }
+)
+
+STREAM_GCODE_SCHEMA = vol.Schema(
+    {
+        vol.Optional("printer"): str,
+        vol.Exclusive("lines", "source"): vol.Any(str, [str]),
+        vol.Exclusive("filename", "source"): str,
+        vol.Optional("window", default=STREAM_WINDOW): vol.All(
+            vol.Coerce(int), vol.Range(min=1, max=STREAM_MAX_WINDOW)
+        ),
+        vol.Optional("timeout", default=STREAM_ACK_TIMEOUT): vol.All(
+            vol.Coerce(float), vol.Range(min=1, max=3600)
+        ),
+    }
+)
+
+
+def async_register_services(hass: HomeAssistant):
+    """Registra i servizi (una volta sola, da async_setup)."""
+    if hass.services.has_service(DOMAIN, SERVICE_SEND_COMMAND):
+        return
+
+    async def async_send_command(call: ServiceCall):
+        """
+        Invia un comando alla stampante. Se è richiesta la risposta o è
+        indicato expect, attende la riga di risposta e la ritorna come
+        {"reply": ...}; altrimenti il comando viene solo accodato.
+        """
+        hub = _get_hub(hass, call)
+        command = call.data["command"]
+        if "expect" not in call.data and not call.return_response:
+            hub.send_ws_command(command)
+            return None
+        try:
+            reply = await hub.async_request(command, call.data.get("expect"), call.data["timeout"])
+        except asyncio.TimeoutError as e:
+            raise HomeAssistantError(
+                f"No reply to {command} from {hub.ip_address} within {call.data['timeout']} s"
+            ) from e
+        except ConnectionError as e:
+            raise HomeAssistantError(str(e)) from e
+        return {"reply": reply}
+
+    hass.services.async_register(
+        DOMAIN,
+        SERVICE_SEND_COMMAND,
+        async_send_command,
+        schema=SEND_COMMAND_SCHEMA,
+        supports_response=SupportsResponse.OPTIONAL,
+    )
+
+    async def async_stream_gcode(call: ServiceCall):
+        """
+        Invia un blocco di righe (lines) o un file della cartella gcodes
+        (filename) con al massimo `window` righe senza ok. Termina quando
+        tutte le righe sono confermate; un solo stream per stampante.
+        """
+        hub = _get_hub(hass, call)
+        if hub.stream is not None:
+            raise HomeAssistantError(f"A G-code stream is already running on {hub.ip_address}")
+        # Lo slot si occupa prima del primo await: due chiamate insieme non
+        # possono passare entrambe il controllo qui sopra
+        stream = GcodeStream(hub.connection, call.data["window"], call.data["timeout"])
+        hub.stream = stream
+        try:
+            if "filename" in call.data:
+                filename = os.path.basename(call.data["filename"])
+                path = hass.config.path("www", "community", "haghost5", "gcodes", filename)
+                if not await hass.async_add_executor_job(os.path.isfile, path):
+                    raise HomeAssistantError(f"File not found: {filename}")
+                source = file_lines(hass, path)
+            elif "lines" in call.data:
+                source = iterate_lines(call.data["lines"])
+            else:
+                raise HomeAssistantError("Pass either lines or filename")
+
+            result = await stream.run(source)
+        except (asyncio.TimeoutError, ConnectionError) as e:
+            number, line = stream.failed_at
+            reason = str(e) or f"no ok within {call.data['timeout']} s"
+            raise HomeAssistantError(
+                f"G-code stream to {hub.ip_address} stopped at line {number} ({line}): {reason}"
+            ) from e
+        finally:
+            hub.stream = None
+        _LOGGER.info(
+            "Streamed %d G-code lines to %s in %.1f s", result["lines"], hub.ip_address, result["seconds"]
+        )
+        return result if call.return_response else None
+
+    hass.services.async_register(
+        DOMAIN,
+        SERVICE_STREAM_GCODE,
+        async_stream_gcode,
+        schema=STREAM_GCODE_SCHEMA,
+        supports_response=SupportsResponse.OPTIONAL,
+    )
+
+
+def _get_hub(hass: HomeAssistant, call: ServiceCall):
+    hub = get_hub(hass, call.data.get("printer"))
+    if hub is None:
+        raise HomeAssistantError("Unknown printer, pass printer: <IP address or entry id>")
+    return hub
@@ -0,0 +1,123 @@
+"""Flow-controlled streaming of G-code lines over the printer WebSocket."""
+
+import asyncio
+import logging
+import time
+from collections import deque
+
+_LOGGER = logging.getLogger(__name__)
+
+STREAM_WINDOW = 4          # righe inviate senza ok, di default
+STREAM_MAX_WINDOW = 32     # resta sotto WRITE_QUEUE_SIZE della connessione
+STREAM_ACK_TIMEOUT = 120   # secondi: G28, M109, M190 rispondono a fine esecuzione
+READ_HINT = 64 * 1024      # byte letti per volta dal file
+
+# Interrogazioni a cui la stampante risponde con una riga propria invece di "ok"
+QUERY_COMMANDS = ("M20", "M27", "M991", "M992", "M994", "M997")
+
+
+def clean_line(line):
+    """Riga da inviare senza commento e spazi, stringa vuota se non resta nulla."""
+    return line.split(";", 1)[0].strip()
+
+
+def expected_reply(line):
+    """expect per PrinterConnection.submit: "ok", o None per le interrogazioni."""
+    return None if line.split(None, 1)[0].upper() in QUERY_COMMANDS else "ok"
+
+
+async def iterate_lines(lines):
+    """Righe da una lista o da un testo su più righe."""
+    if isinstance(lines, str):
+        lines = lines.splitlines()
+    for line in lines:
+        yield line
+
+
+async def file_lines(hass, path):
+    """Righe di un file letto a blocchi nell'executor: memoria costante anche per file grandi."""
+    f = await hass.async_add_executor_job(lambda: open(path, encoding="utf-8", errors="replace"))
+    try:
+        while True:
+            batch = await hass.async_add_executor_job(f.readlines, READ_HINT)
+            if not batch:
+                return
+            for line in batch:
+                yield line
+    finally:
+        await hass.async_add_executor_job(f.close)
+
+
+class GcodeStream:
+    """
+    Invio di un blocco di G-code con finestra scorrevole.
+
+    Ogni riga è una richiesta della connessione (submit) che attende il suo
+    "ok": al massimo `window` righe sono in volo, la successiva parte solo
+    quando arriva la conferma della più vecchia, così il buffer del firmware
+    non si riempie e le interrogazioni periodiche passano tra una riga e
+    l'altra. Se una conferma non arriva entro ack_timeout o il socket cade,
+    le righe non ancora inviate vengono tolte dalla coda e run() solleva
+    l'errore; failed_at indica la riga.
+    """
+
+    def __init__(self, connection, window=STREAM_WINDOW, ack_timeout=STREAM_ACK_TIMEOUT):
+        self._connection = connection
+        self._window = max(1, min(int(window), STREAM_MAX_WINDOW))
+        self._ack_timeout = ack_timeout
+        self.sent = 0
+        self.acknowledged = 0
+        self.failed_at = None  # (numero, riga) della riga non confermata
+        self._started = None
+
+    @property
+    def elapsed(self):
+        return time.monotonic() - self._started if self._started is not None else 0.0
+
+    def as_dict(self):
+        elapsed = self.elapsed
+        return {
+            "lines": self.sent,
+            "acknowledged": self.acknowledged,
+            "seconds": round(elapsed, 3),
+            "lines_per_second": round(self.acknowledged / elapsed, 1) if elapsed else None,
+        }
+
+    async def run(self, lines):
+        """Invia le righe (iterabile asincrono) e attende tutte le conferme."""
+        self._started = time.monotonic()
+        outstanding = deque()  # (numero, riga, future) in ordine di invio
+        try:
+            async for raw in lines:
+                line = clean_line(raw)
+                if not line:
+                    continue
+                while len(outstanding) >= self._window:
+                    await self._wait_oldest(outstanding)
+                try:
+                    future = self._connection.submit(line, expected_reply(line))
+                except ConnectionError:
+                    self.failed_at = (self.sent + 1, line)
+                    raise
+                self.sent += 1
+                outstanding.append((self.sent, line, future))
+            while outstanding:
+                await self._wait_oldest(outstanding)
+        finally:
+            for _, _, future in outstanding:
+                if future.done() and not future.cancelled():
+                    future.exception()  # già fallita con le altre: segnata come letta
+                else:
+                    future.cancel()
+        _LOGGER.debug("Streamed %d G-code lines in %.1f s", self.sent, self.elapsed)
+        return self.as_dict()
+
+    async def _wait_oldest(self, outstanding):
+        number, line, future = outstanding[0]
+        try:
+            await asyncio.wait_for(future, self._ack_timeout)
+        except (asyncio.TimeoutError, ConnectionError):
+            self.failed_at = (number, line)
+            raise
+        outstanding.popleft()
+        self.acknowledged += 1
@@ -0,0 +1,154 @@
+"""Fixed-size, multi-resolution telemetry history kept in NumPy ring buffers."""
+
+import time
+
+import numpy as np
+
+# Colonne registrate e modo di aggregazione nel bucket: media o ultimo valore
+CHANNELS = ("nozzle", "nozzle_target", "bed", "bed_target", "progress")
+_MEAN = np.array([True, False, True, False, False])
+
+# Livelli (risoluzione in secondi, numero di campioni): 1 ora a 1 s,
+# 6 ore a 10 s, 24 ore a 1 min. Memoria fissa di circa 200 KB per stampante.
+TIERS = ((1, 3600), (10, 2160), (60, 1440))
+
+
+class _Tier:
+    """Ring buffer di una risoluzione: un campione per bucket di `resolution` secondi."""
+
+    def __init__(self, resolution, capacity):
+        self.resolution = resolution
+        self.capacity = capacity
+        self.times = np.zeros(capacity, dtype=np.float64)
+        self.values = np.full((capacity, len(CHANNELS)), np.nan, dtype=np.float32)
+        self.head = 0
+        self.count = 0
+        # Bucket in corso: somme e conteggi per le medie, ultimo valore per gli altri
+        self._bucket = None
+        self._sum = np.zeros(len(CHANNELS), dtype=np.float64)
+        self._n = np.zeros(len(CHANNELS), dtype=np.int32)
+        self._last = np.full(len(CHANNELS), np.nan, dtype=np.float32)
+
+    @property
+    def span(self):
+        return self.resolution * self.capacity
+
+    def add(self, now, row):
+        bucket = int(now // self.resolution)
+        if bucket != self._bucket:
+            if self._bucket is not None:
+                self._push(self._bucket * self.resolution, self._pending_row())
+            self._bucket = bucket
+            self._sum[:] = 0
+            self._n[:] = 0
+            self._last[:] = np.nan
+        known = ~np.isnan(row)
+        self._sum[known] += row[known]
+        self._n[known] += 1
+        self._last[known] = row[known]
+
+    def _pending_row(self):
+        row = self._last.copy()
+        mean = _MEAN & (self._n > 0)
+        row[mean] = self._sum[mean] / self._n[mean]
+        return row
+
+    def _push(self, t, row):
+        self.times[self.head] = t
+        self.values[self.head] = row
+        self.head = (self.head + 1) % self.capacity
+        self.count = min(self.count + 1, self.capacity)
+
+    def since(self, start):
+        """Campioni con tempo >= start in ordine cronologico, bucket in corso compreso."""
+        if self.count < self.capacity:
+            times = self.times[: self.count]
+            values = self.values[: self.count]
+        else:
+            # Il più vecchio è in head: riordina in un'unica copia
+            order = np.r_[self.head : self.capacity, 0 : self.head]
+            times = self.times[order]
+            values = self.values[order]
+        if self._bucket is not None:
+            times = np.append(times, self._bucket * self.resolution)
+            values = np.vstack((values, self._pending_row()))
+        keep = times >= start
+        return times[keep], values[keep]
+
+
+class TelemetryHistory:
+    """
+    Storico delle temperature e dell'avanzamento di una stampante.
+
+    Ogni record aggiorna il vettore dei valori correnti, che viene aggiunto
+    a tutti i livelli; ogni livello tiene un campione per bucket. La query
+    usa il livello più fine che copre la finestra richiesta.
+    """
+
+    def __init__(self, tiers=TIERS):
+        self._tiers = [_Tier(resolution, capacity) for resolution, capacity in tiers]
+        self._current = np.full(len(CHANNELS), np.nan, dtype=np.float32)
+
+    @property
+    def nbytes(self):
+        return sum(t.times.nbytes + t.values.nbytes for t in self._tiers)
+
+    def process_temperature(self, record, message):
+        """Handler del router per TemperatureRecord."""
+        self._update(
+            nozzle=record.nozzle,
+            nozzle_target=record.nozzle_target,
+            bed=record.bed,
+            bed_target=record.bed_target,
+        )
+
+    def process_progress(self, record, message):
+        """Handler del router per ProgressRecord."""
+        self._update(progress=record.percent)
+
+    def _update(self, now=None, **values):
+        for name, value in values.items():
+            if value is not None:
+                self._current[CHANNELS.index(name)] = value
+        now = time.time() if now is None else now
+        for tier in self._tiers:
+            tier.add(now, self._current)
+
+    def tier_for(self, seconds):
+        """Livello più fine che copre la finestra (altrimenti il più lungo)."""
+        for tier in self._tiers:
+            if tier.span >= seconds:
+                return tier
+        return self._tiers[-1]
+
+    def query(self, seconds, now=None):
+        """Ultimi `seconds` secondi: (risoluzione, tempi float64, valori float32 [n, canali])."""
+        now = time.time() if now is None else now
+        tier = self.tier_for(seconds)
+        times, values = tier.since(now - seconds)
+        return tier.resolution, times, values
+
+    def as_columns(self, seconds, now=None):
+        """Risposta JSON colonnare: tempi relativi a start, valori arrotondati, null se assenti."""
+        resolution, times, values = self.query(seconds, now)
+        start = float(times[0]) if len(times) else None
+        columns = {
+            "resolution": resolution,
+            "start": start,
+            "t": (times - start).astype(np.int64).tolist() if len(times) else [],
+        }
+        rounded = np.round(values.astype(np.float64), 1)
+        for i, name in enumerate(CHANNELS):
+            column = rounded[:, i]
+            columns[name] = [None if np.isnan(v) else v for v in column.tolist()]
+        return columns
+
+    def as_binary(self, seconds, now=None):
+        """
+        Stessi dati in binario little-endian: tempi (float32, secondi da start)
+        seguiti dalle colonne float32 in ordine CHANNELS, NaN se assenti.
+        """
+        resolution, times, values = self.query(seconds, now)
+        start = float(times[0]) if len(times) else 0.0
+        body = (times - start).astype("<f4").tobytes() + values.T.astype("<f4").tobytes()
+        return resolution, start, len(times), body
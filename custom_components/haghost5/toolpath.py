@@ -0,0 +1,456 @@
+"""Compact binary toolpath (NumPy array-of-struct) built from a G-code file."""
+
+import logging
+import os
+import struct
+import tempfile
+from array import array
+
+import numpy as np
+
+_LOGGER = logging.getLogger(__name__)
+
+TOOLPATH_SUFFIX = ".toolpath"
+TOOLPATH_MAGIC = b"HAG5TP\x00\x00"
+TOOLPATH_VERSION = 3
+
+# Header: magic, versione, byte per record, numero record, numero layer, riservato, sha256
+_HEADER = struct.Struct("<8sIIQII32s")
+HEADER_SIZE = _HEADER.size  # 64
+
+FLAG_EXTRUDE = 1
+FLAG_TRAVEL = 2
+FLAG_BITS = 2
+
+# Un record = un vertice da 16 byte: [x, y, z, meta] con meta = layer << 2 | flag.
+# Il record 0 è il punto di partenza, il record i (i >= 1) è la fine del
+# movimento i-1, che parte dal record i-1: i segmenti non duplicano i vertici.
+# Il client può usare il buffer come InterleavedBuffer con stride 4 float
+# (posizione) e una vista Uint32 per i metadati.
+TOOLPATH_DTYPE = np.dtype([("x", "<f4"), ("y", "<f4"), ("z", "<f4"), ("meta", "<u4")])
+
+
+def toolpath_path(path):
+    return path + TOOLPATH_SUFFIX
+
+
+def _parse_args(tokens):
+    args = {}
+    for token in tokens:
+        if len(token) > 1:
+            try:
+                args[token[0:1].upper()] = float(token[1:])
+            except ValueError:
+                pass
+    return args
+
+
+def parse_moves(path):
+    """
+    Legge tutti i G0/G1 del file in colonne NumPy.
+
+    Ritorna un dict con le posizioni assolute di fine movimento (x, y, z),
+    l'estrusione del movimento (de), il feedrate attivo in mm/min (f), l'offset
+    in byte della riga (offset) e la posizione di partenza del primo
+    movimento (origin). Il resto del calcolo
+    (punti di partenza, layer, tempi) è vettoriale su queste colonne.
+
+    Il parsing è vettoriale sui byte del file (pochi secondi per 2M righe); i
+    file che il percorso veloce non gestisce (comandi minuscoli o indentati,
+    numeri troppo lunghi o con esponente, parametri che non sono un numero
+    semplice) passano dal parser riga per riga, con lo stesso risultato.
+    """
+    with open(path, "rb") as src:
+        data = src.read()
+    moves = _parse_moves_fast(data)
+    if moves is None:
+        moves = _parse_moves_lines(data.splitlines(keepends=True))
+    return moves
+
+
+def _parse_moves_lines(lines):
+    """Parser riga per riga, di riferimento per _parse_moves_fast."""
+    xs, ys, zs, des, fs = (array("f") for _ in range(5))
+    offsets = array("q")
+    position = 0
+    x = y = z = e = 0.0
+    f = 0.0
+    absolute = True
+    absolute_e = True
+
+    for raw in lines:
+        line_offset = position
+        position += len(raw)
+        line = raw.split(b";", 1)[0].strip()
+        if not line or line[0] not in b"GgMm":
+            continue
+        tokens = line.split()
+        cmd = tokens[0].upper()
+
+        if cmd in (b"G0", b"G1"):
+            args = _parse_args(tokens[1:])
+            if b"X" in args:
+                x = args[b"X"] if absolute else x + args[b"X"]
+            if b"Y" in args:
+                y = args[b"Y"] if absolute else y + args[b"Y"]
+            if b"Z" in args:
+                z = args[b"Z"] if absolute else z + args[b"Z"]
+            de = 0.0
+            if b"E" in args:
+                ne = args[b"E"] if absolute_e else e + args[b"E"]
+                de = ne - e
+                e = ne
+            if b"F" in args:
+                f = args[b"F"]
+            xs.append(x)
+            ys.append(y)
+            zs.append(z)
+            des.append(de)
+            fs.append(f)
+            offsets.append(line_offset)
+
+        elif cmd == b"G90":
+            absolute = True
+            absolute_e = True
+        elif cmd == b"G91":
+            absolute = False
+            absolute_e = False
+        elif cmd == b"M82":
+            absolute_e = True
+        elif cmd == b"M83":
+            absolute_e = False
+        elif cmd == b"G92":
+            args = _parse_args(tokens[1:])
+            # Solo E: un reset di X/Y/Z sposterebbe il sistema di riferimento
+            e = args.get(b"E", e)
+
+    return {
+        "x": np.frombuffer(xs, dtype=np.float32),
+        "y": np.frombuffer(ys, dtype=np.float32),
+        "z": np.frombuffer(zs, dtype=np.float32),
+        "de": np.frombuffer(des, dtype=np.float32),
+        "f": np.frombuffer(fs, dtype=np.float32),
+        "offset": np.frombuffer(offsets, dtype=np.int64),
+        "origin": (0.0, 0.0, 0.0),
+    }
+
+
+# --- Parser vettoriale ---
+
+_CMD_MOVE, _CMD_G90, _CMD_G91, _CMD_G92, _CMD_M82, _CMD_M83 = range(1, 7)
+_NUMBER_WIDTH = 16   # cifre massime di un numero (la mantissa sta in un int64)
+# Byte che chiudono un comando o un numero: fine buffer, spazio, tab, CR, LF, ';'
+_TERMINATORS = np.array([0, 9, 10, 13, 32, 59], dtype=np.uint8)
+
+
+def _ffill(values, initial):
+    """Propaga in avanti l'ultimo valore non NaN (initial prima del primo)."""
+    valid = ~np.isnan(values)
+    idx = np.where(valid, np.arange(len(values)), -1)
+    np.maximum.accumulate(idx, out=idx)
+    out = np.where(idx >= 0, values[np.maximum(idx, 0)], initial)
+    return out
+
+
+def _parse_numbers(buf, positions):
+    """
+    Numeri decimali che iniziano a positions, tutti insieme.
+
+    Le cifre si accumulano colonna per colonna in una mantissa intera, poi
+    si divide per la potenza di 10 dei decimali: il risultato è lo stesso di
+    float(). Ritorna (valori, ok): NaN dove float() fallirebbe nel parser
+    riga per riga (nessuna cifra, due punti decimali); ok è False se qualche
+    numero supera _NUMBER_WIDTH cifre o è seguito da altro che non sia un
+    separatore (esponente, "nan", "1_000"...) e va riletto col parser lento.
+    """
+    count = len(positions)
+    sign = buf[positions]
+    neg = sign == 45                                # '-'
+    pos = positions + (neg | (sign == 43))          # '-' o '+'
+    mantissa = np.zeros(count, dtype=np.int64)
+    decimals = np.zeros(count, dtype=np.int64)
+    digits = np.zeros(count, dtype=np.int64)
+    seen_dot = np.zeros(count, dtype=bool)
+    bad = np.zeros(count, dtype=bool)
+    active = np.ones(count, dtype=bool)
+    end_byte = np.zeros(count, dtype=np.uint8)
+
+    for column in range(_NUMBER_WIDTH):
+        byte = buf[pos + column]
+        digit = byte - 48
+        is_digit = digit <= 9                       # uint8: i byte < '0' vanno oltre 9
+        is_digit &= active
+        is_dot = byte == 46                         # '.'
+        is_dot &= active
+        bad |= is_dot & seen_dot
+        seen_dot |= is_dot
+        ended = active & ~(is_digit | is_dot)
+        end_byte[ended] = byte[ended]
+        active ^= ended
+        np.multiply(mantissa, 10, out=mantissa, where=is_digit)
+        np.add(mantissa, digit, out=mantissa, where=is_digit)
+        decimals += is_digit & seen_dot
+        digits += is_digit
+        if not active.any():
+            break
+    else:
+        return None, False
+    if not np.isin(end_byte, _TERMINATORS).all():
+        return None, False
+
+    values = mantissa / np.power(10.0, decimals)
+    values[neg] *= -1
+    values[bad | (digits == 0)] = np.nan
+    return values, True
+
+
+def _parse_moves_fast(data):
+    """Parser vettoriale; None se il file richiede il parser riga per riga."""
+    size = len(data)
+    buf = np.frombuffer(data + b"\0" * (_NUMBER_WIDTH + 4), dtype=np.uint8)
+    content = buf[:size]
+
+    newlines = np.flatnonzero(content == 10)
+    starts = np.concatenate(([0], newlines + 1))
+    starts = starts[starts < size]
+    first = buf[starts]
+    # Righe indentate o minuscole: le gestisce il parser riga per riga
+    if np.isin(first, np.frombuffer(b" \tgm", dtype=np.uint8)).any():
+        return None
+
+    # Codice del comando di ogni riga
+    b1, b2, b3 = buf[starts + 1], buf[starts + 2], buf[starts + 3]
+    codes = np.zeros(len(starts), dtype=np.int8)
+    is_g, is_m = first == 71, first == 77
+    codes[is_g & ((b1 == 48) | (b1 == 49)) & np.isin(b2, _TERMINATORS)] = _CMD_MOVE
+    three = np.isin(b3, _TERMINATORS)
+    g9 = is_g & (b1 == 57) & three
+    codes[g9 & (b2 == 48)] = _CMD_G90
+    codes[g9 & (b2 == 49)] = _CMD_G91
+    codes[g9 & (b2 == 50)] = _CMD_G92
+    m8 = is_m & (b1 == 56) & three
+    codes[m8 & (b2 == 50)] = _CMD_M82
+    codes[m8 & (b2 == 51)] = _CMD_M83
+
+    rows = np.flatnonzero(codes)
+    codes = codes[rows]
+    row_of_line = np.full(len(starts), -1, dtype=np.int64)
+    row_of_line[rows] = np.arange(len(rows))
+
+    # Inizio del commento di ogni riga (size se non c'è)
+    comment = np.full(len(starts), size, dtype=np.int64)
+    semicolons = np.flatnonzero(content == 59)
+    if len(semicolons):
+        lines, first_idx = np.unique(np.searchsorted(starts, semicolons, "right") - 1, return_index=True)
+        comment[lines] = semicolons[first_idx]
+
+    # Parametri X/Y/Z/E/F (anche minuscoli, come nel parser riga per riga):
+    # lettera a inizio token, fuori dai commenti, su una riga G0/G1/G92
+    columns = {}
+    folded = content | 32   # solo 'X' e 'x' diventano 'x', ecc.
+    for letter in b"XYZEF":
+        pos = np.flatnonzero(folded == letter | 32)
+        pos = pos[pos > 0]
+        pos = pos[(buf[pos - 1] == 32) | (buf[pos - 1] == 9)]
+        line = np.searchsorted(starts, pos, "right") - 1
+        row = row_of_line[line]
+        keep = (pos < comment[line]) & (row >= 0)
+        pos, row = pos[keep], row[keep]
+        keep = (codes[row] == _CMD_MOVE) | ((codes[row] == _CMD_G92) & (letter == ord("E")))
+        pos, row = pos[keep], row[keep]
+        values, ok = _parse_numbers(buf, pos + 1)
+        if not ok:
+            return None
+        column = np.full(len(rows), np.nan)
+        column[row] = values
+        columns[letter] = column
+
+    move = codes == _CMD_MOVE
+    # Modalità assoluta/relativa in vigore su ogni riga
+    mode_xyz = np.full(len(rows), np.nan)
+    mode_xyz[codes == _CMD_G90] = 1
+    mode_xyz[codes == _CMD_G91] = 0
+    mode_e = mode_xyz.copy()
+    mode_e[codes == _CMD_M82] = 1
+    mode_e[codes == _CMD_M83] = 0
+    absolute = _ffill(mode_xyz, 1) == 1
+    absolute_e = _ffill(mode_e, 1) == 1
+
+    def positions(values, resets, deltas):
+        # posizione = ultimo valore assoluto + somma dei relativi successivi
+        cum = np.cumsum(np.where(deltas, values, 0.0))
+        offset = np.full(len(values), np.nan)
+        offset[resets] = values[resets] - cum[resets]
+        return _ffill(offset, 0.0) + cum
+
+    axes = []
+    for letter in b"XYZ":
+        values = columns[letter]
+        present = move & ~np.isnan(values)
+        axes.append(positions(values, present & absolute, present & ~absolute))
+
+    e_values = columns[ord("E")]
+    e_present = ~np.isnan(e_values)
+    e_resets = (codes == _CMD_G92) & e_present | move & e_present & absolute_e
+    e = positions(e_values, e_resets, move & e_present & ~absolute_e)
+    de = np.diff(e, prepend=0.0)
+
+    f_values = np.where(move, columns[ord("F")], np.nan)
+    f = _ffill(f_values, 0.0)
+
+    return {
+        "x": axes[0][move].astype(np.float32),
+        "y": axes[1][move].astype(np.float32),
+        "z": axes[2][move].astype(np.float32),
+        "de": de[move].astype(np.float32),
+        "f": f[move].astype(np.float32),
+        "offset": starts[rows[move]].astype(np.int64),
+        "origin": (0.0, 0.0, 0.0),
+    }
+
+
+def start_points(moves):
+    """Punti di partenza di ogni movimento (la fine del precedente)."""
+    x0 = np.empty_like(moves["x"])
+    y0 = np.empty_like(moves["y"])
+    z0 = np.empty_like(moves["z"])
+    if len(x0):
+        x0[0], y0[0], z0[0] = moves["origin"]
+        x0[1:] = moves["x"][:-1]
+        y0[1:] = moves["y"][:-1]
+        z0[1:] = moves["z"][:-1]
+    return x0, y0, z0
+
+
+def layer_starts(moves):
+    """
+    Indici dei movimenti che aprono ogni layer.
+
+    Un layer nuovo esiste quando un movimento in estrusione avviene a una Z
+    diversa dal layer corrente (stessa regola di gcode_loader.js), ma inizia
+    dal cambio di Z che lo porta lì: il primo movimento dopo l'ultima
+    estrusione del layer precedente che cambia Z, così z-hop e travel di
+    apertura appartengono al layer nuovo. Il primo layer inizia dall'ultimo
+    cambio di Z prima della prima estrusione.
+    """
+    z = moves["z"]
+    idx = np.flatnonzero(moves["de"] > 0)
+    if len(idx) == 0:
+        return np.zeros(0, dtype=np.int64)
+    z_ext = z[idx]
+    new_layer = np.empty(len(idx), dtype=bool)
+    new_layer[0] = True
+    new_layer[1:] = z_ext[1:] != z_ext[:-1]
+    first = np.flatnonzero(new_layer)
+
+    changes = np.flatnonzero(np.diff(z, prepend=np.float32(moves["origin"][2])) != 0)
+    starts = np.empty(len(first), dtype=np.int64)
+    before = np.searchsorted(changes, idx[0], "right") - 1
+    starts[0] = changes[before] if before >= 0 else 0
+    # Tra l'ultima estrusione del layer precedente e la prima del nuovo la Z
+    # cambia per forza: il primo cambio esiste ed è <= della prima estrusione
+    previous = idx[first[1:] - 1]
+    starts[1:] = changes[np.searchsorted(changes, previous, "right")]
+    return starts
+
+
+def layer_ids(moves):
+    """
+    Layer di ogni movimento, a partire dagli inizi di layer_starts().
+    I movimenti prima del primo layer stanno nel layer 0.
+    """
+    count = len(moves["z"])
+    starts = layer_starts(moves)
+    if len(starts) == 0:
+        return np.zeros(count, dtype=np.uint32), 0
+    marks = np.zeros(count, dtype=np.int64)
+    marks[starts] = 1
+    ids = np.maximum(np.cumsum(marks) - 1, 0).astype(np.uint32)
+    return ids, len(starts)
+
+
+def build_toolpath(moves):
+    """Converte le colonne dei movimenti nell'array di record TOOLPATH_DTYPE."""
+    layers, layer_count = layer_ids(moves)
+    flags = np.where(moves["de"] > 0, FLAG_EXTRUDE, FLAG_TRAVEL).astype(np.uint32)
+    records = np.empty(len(moves["x"]) + 1, dtype=TOOLPATH_DTYPE)
+    records[0] = (*moves["origin"], 0)
+    records["x"][1:] = moves["x"]
+    records["y"][1:] = moves["y"]
+    records["z"][1:] = moves["z"]
+    records["meta"][1:] = (layers << FLAG_BITS) | flags
+    return records, layer_count
+
+
+def _read_header(path):
+    with open(path, "rb") as f:
+        data = f.read(HEADER_SIZE)
+    if len(data) != HEADER_SIZE:
+        return None
+    magic, version, record_size, count, layer_count, _, sha = _HEADER.unpack(data)
+    if magic != TOOLPATH_MAGIC or version != TOOLPATH_VERSION or record_size != TOOLPATH_DTYPE.itemsize:
+        return None
+    return {"count": count, "layer_count": layer_count, "sha256": sha.hex()}
+
+
+def write_toolpath(path, records, layer_count, sha256):
+    """Scrive header + record su file temporaneo e lo rinomina atomicamente."""
+    directory, name = os.path.split(path)
+    fd, temp_path = tempfile.mkstemp(prefix=f".{name}.", suffix=".tmp", dir=directory)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(
+                _HEADER.pack(
+                    TOOLPATH_MAGIC,
+                    TOOLPATH_VERSION,
+                    TOOLPATH_DTYPE.itemsize,
+                    len(records),
+                    layer_count,
+                    0,
+                    bytes.fromhex(sha256),
+                )
+            )
+            records.tofile(f)
+        os.replace(temp_path, path)
+    except Exception:
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+        raise
+
+
+def ensure_toolpath(path, sha256, load_moves=parse_moves):
+    """
+    Ritorna il percorso del toolpath binario per il G-code, generandolo se
+    manca o se è stato costruito da un contenuto diverso (sha256).
+    load_moves(path) permette di condividere il parsing con la stima dei tempi.
+    """
+    target = toolpath_path(path)
+    try:
+        header = _read_header(target)
+    except OSError:
+        header = None
+    if header is not None and header["sha256"] == sha256:
+        return target
+
+    moves = load_moves(path)
+    records, layer_count = build_toolpath(moves)
+    write_toolpath(target, records, layer_count, sha256)
+    _LOGGER.info(
+        "Built toolpath for %s: %d moves, %d layers (%d bytes)",
+        path, len(records) - 1, layer_count, HEADER_SIZE + records.nbytes,
+    )
+    return target
+
+
+def load_toolpath(path):
+    """Memory-map del toolpath: nessuna copia in RAM dei record."""
+    header = _read_header(path)
+    if header is None:
+        raise ValueError(f"Invalid toolpath file: {path}")
+    if header["count"] == 0:
+        return np.empty(0, dtype=TOOLPATH_DTYPE)
+    return np.memmap(
+        path, dtype=TOOLPATH_DTYPE, mode="r", offset=HEADER_SIZE, shape=(header["count"],)
+    )
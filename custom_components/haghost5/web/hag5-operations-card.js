@@ -9,11 +9,18 @@ class Hag5OperationsCard extends HTMLElement {
 
     set hass(hass) {
         
-        // Recupera l'IP della stampante dall'entità dedicata
-        const entity = hass.states['sensor.haghost5_printer_ip'];
-        const ipAddress = entity?.state || 'unknown';
+        // Trova la stampante della card: il sensore di stato online espone
+        // printer_id e ip_address. Con più stampanti si sceglie con "printer:"
+        // (entry id o IP), altrimenti si usa la prima trovata.
+        const printer = this.config.printer;
+        const entity = Object.values(hass.states).find((state) =>
+            state.attributes?.printer_id !== undefined &&
+            (!printer || state.attributes.printer_id === printer || state.attributes.ip_address === printer)
+        );
+        const ipAddress = entity?.attributes.ip_address || 'unknown';
+        this.printerId = entity?.attributes.printer_id;
     
-        console.log("IP Address from sensor:", ipAddress);
+        console.log("Printer IP address:", ipAddress);
 
 
 
@@ -30,7 +37,8 @@ class Hag5OperationsCard extends HTMLElement {
                 filelist: filelist,
                 debug: debug,
                 command: command,
-                ip: ipAddress // Aggiunge l'IP come parametro
+                ip: ipAddress, // Aggiunge l'IP come parametro
+                printer: this.printerId || ''
             }).toString();
 
             this.innerHTML = `
@@ -42,6 +50,26 @@ class Hag5OperationsCard extends HTMLElement {
             `;
             this.iframe = this.querySelector('#operations-iframe');
         }
+
+        // Inoltra all'iframe l'avanzamento degli upload verso la stampante
+        if (!this.progressUnsub && hass.connection) {
+            this.progressUnsub = hass.connection.subscribeEvents((event) => {
+                // Solo gli upload verso la stampante di questa card
+                if (event.data.ip_address && event.data.ip_address !== ipAddress) {
+                    return;
+                }
+                if (this.iframe && this.iframe.contentWindow) {
+                    this.iframe.contentWindow.postMessage({ type: 'upload_progress', ...event.data }, '*');
+                }
+            }, 'haghost5_upload_progress');
+        }
+    }
+
+    disconnectedCallback() {
+        if (this.progressUnsub) {
+            this.progressUnsub.then((unsub) => unsub());
+            this.progressUnsub = undefined;
+        }
     }
 }
 
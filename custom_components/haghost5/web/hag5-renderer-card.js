@@ -3,6 +3,7 @@ class Hag5RendererCard extends HTMLElement {
     iframe;
     currentFileName;
     currentProgress;
+    currentLayer;
 
     // required
     setConfig(config) {
@@ -10,19 +11,34 @@ class Hag5RendererCard extends HTMLElement {
     }
 
     set hass(hass) {
-        const printingFileNameEntity = 'sensor.printing_file_name';
-        const printProgressEntity = 'sensor.print_progress';
+        // Sensori della stampante della card: il sensore di stato online
+        // espone printer_id, ip_address e gli entity id collegati. Con più
+        // stampanti si sceglie con "printer:" (entry id o IP); file_entity,
+        // progress_entity e layer_entity forzano un'entità specifica.
+        const printer = this.config.printer;
+        const status = Object.values(hass.states).find((state) =>
+            state.attributes?.printer_id !== undefined &&
+            (!printer || state.attributes.printer_id === printer || state.attributes.ip_address === printer)
+        );
+        const linked = status?.attributes?.entities || {};
+        const printingFileNameEntity = this.config.file_entity || linked.file || 'sensor.printing_file_name';
+        const printProgressEntity = this.config.progress_entity || linked.progress || 'sensor.print_progress';
+        const currentLayerEntity = this.config.layer_entity || linked.layer || 'sensor.current_layer';
 
         const printingFileNameState = hass.states[printingFileNameEntity]?.state || 'unavailable';
         const printProgressState = hass.states[printProgressEntity]?.state || '0';
+        const currentLayer = hass.states[currentLayerEntity];
+        const layerState = currentLayer && currentLayer.state !== '0' ? currentLayer.state : null;
+        const layerCount = currentLayer?.attributes?.layer_count ?? null;
 
         // Aggiorna il file e la percentuale insieme ogni volta che cambia la percentuale
-        if (this.currentProgress !== printProgressState) {
+        if (this.currentProgress !== printProgressState || this.currentLayer !== layerState) {
             this.currentFileName = printingFileNameState;
             this.currentProgress = printProgressState;
+            this.currentLayer = layerState;
     
-            // Invia il nome del file e la percentuale insieme
-            this.updateIframe({ fileName: this.currentFileName, progress: this.currentProgress });
+            // Invia il nome del file, la percentuale e il layer corrente insieme
+            this.updateIframe({ fileName: this.currentFileName, progress: this.currentProgress, layer: layerState, layerCount: layerCount });
         }
         
 
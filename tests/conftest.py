@@ -0,0 +1,37 @@
+"""
+Rende importabile custom_components.haghost5 lanciando pytest dalla radice del repo.
+
+Il pacchetto viene registrato senza eseguire __init__, che richiede Home
+Assistant: i moduli che non lo importano (indice, toolpath, stima,
+catalogo) si testano anche senza. I test che usano Home Assistant lo
+dichiarano con pytest.importorskip("homeassistant") o con la fixture
+integration; le dipendenze complete sono in requirements_test.txt.
+"""
+
+import importlib.util
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PACKAGE = os.path.join(ROOT, "custom_components", "haghost5")
+PACKAGE_NAME = "custom_components.haghost5"
+
+sys.path.insert(0, ROOT)
+
+if PACKAGE_NAME not in sys.modules:
+    _spec = importlib.util.spec_from_file_location(
+        PACKAGE_NAME, os.path.join(PACKAGE, "__init__.py"), submodule_search_locations=[PACKAGE]
+    )
+    sys.modules[PACKAGE_NAME] = importlib.util.module_from_spec(_spec)
+
+
+@pytest.fixture
+def integration():
+    """Il pacchetto con __init__ eseguito (setup delle entry, servizi): richiede Home Assistant."""
+    pytest.importorskip("homeassistant")
+    module = sys.modules[PACKAGE_NAME]
+    if not hasattr(module, "async_setup_entry"):
+        module.__spec__.loader.exec_module(module)
+    return module
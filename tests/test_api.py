@@ -0,0 +1,41 @@
+"""Endpoint HTTP: cache dell'indice dei layer."""
+
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("homeassistant")
+
+from aiohttp import web
+from aiohttp.test_utils import make_mocked_request
+
+from custom_components.haghost5.api import HAG5GcodeIndexView
+
+
+async def _executor(func, *args):
+    return func(*args)
+
+
+def _get(tmp_path, headers=None):
+    gcodes = tmp_path / "www" / "community" / "haghost5" / "gcodes"
+    gcodes.mkdir(parents=True, exist_ok=True)
+    (gcodes / "part.gcode").write_bytes(b"G1 Z0.2\nG1 X10 Y10 E1\nG1 Z0.4\nG1 X20 Y10 E2\n")
+    hass = SimpleNamespace(
+        config=SimpleNamespace(path=lambda *parts: str(tmp_path.joinpath(*parts))),
+        async_add_executor_job=_executor,
+    )
+    app = web.Application()
+    app["hass"] = hass
+    request = make_mocked_request("GET", "/api/haghost5/gcode_index?filename=part.gcode", headers=headers, app=app)
+    return asyncio.run(HAG5GcodeIndexView().get(request))
+
+
+def test_index_is_not_resent_when_the_etag_matches(tmp_path):
+    first = _get(tmp_path)
+    assert first.status == 200
+    etag = first.headers["ETag"]
+    second = _get(tmp_path, {"If-None-Match": etag})
+    assert second.status == 304
+    assert second.headers["ETag"] == etag
+    assert _get(tmp_path, {"If-None-Match": '"other"'}).status == 200
@@ -0,0 +1,54 @@
+"""Profili degli attributi: full, minimal e none su ogni sensore dei record."""
+
+import pytest
+
+pytest.importorskip("homeassistant")
+
+from custom_components.haghost5.const import (
+    ATTRIBUTE_PROFILE_FULL,
+    ATTRIBUTE_PROFILE_MINIMAL,
+    ATTRIBUTE_PROFILE_NONE,
+)
+from custom_components.haghost5.publisher import StatePublisher
+from custom_components.haghost5.router import parse_line
+from custom_components.haghost5.sensor import (
+    PrinterM27Sensor,
+    PrinterM992Sensor,
+    PrinterM994Sensor,
+    PrinterM997Sensor,
+    TBedSensor,
+)
+
+# Sensore, riga del firmware, attributi non volatili attesi col profilo minimal
+CASES = [
+    (PrinterM997Sensor, "M997 PRINTING", {}),
+    (PrinterM27Sensor, "M27 42", {}),
+    (PrinterM994Sensor, "M994 1:/part.gcode;1234", {"possible_size": "1234"}),
+    (PrinterM992Sensor, "M992 01:02:03", {"formatted_time": "01:02:03"}),
+    (TBedSensor, "T:200 /200 B:60 /60 @:0 B@:0", {"target": 60.0}),
+]
+
+
+def _attributes(sensor_class, line, profile):
+    sensor = sensor_class("192.0.2.1")
+    sensor.set_publisher(StatePublisher(attribute_profile=profile))
+    sensor.process_record(parse_line(line), line)
+    return sensor.extra_state_attributes
+
+
+@pytest.mark.parametrize("sensor_class, line, minimal", CASES)
+def test_full_profile_keeps_everything(sensor_class, line, minimal):
+    attributes = _attributes(sensor_class, line, ATTRIBUTE_PROFILE_FULL)
+    assert attributes["raw_message"] == line
+    assert "last_update" in attributes
+    assert minimal.items() <= attributes.items()
+
+
+@pytest.mark.parametrize("sensor_class, line, minimal", CASES)
+def test_minimal_profile_drops_volatile_attributes(sensor_class, line, minimal):
+    assert _attributes(sensor_class, line, ATTRIBUTE_PROFILE_MINIMAL) == minimal
+
+
+@pytest.mark.parametrize("sensor_class, line, minimal", CASES)
+def test_none_profile_drops_all_attributes(sensor_class, line, minimal):
+    assert _attributes(sensor_class, line, ATTRIBUTE_PROFILE_NONE) == {}
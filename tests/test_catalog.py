@@ -0,0 +1,53 @@
+"""FileCatalog: liste M20 assemblate dai record del router."""
+
+import asyncio
+
+import pytest
+
+from custom_components.haghost5.catalog import FileCatalog
+from custom_components.haghost5.router import parse_line
+
+
+def _feed(catalog, *lines):
+    for line in lines:
+        catalog.process_record(parse_line(line), line)
+
+
+def test_listing_replaces_catalog():
+    async def run():
+        changes = []
+        catalog = FileCatalog(lambda catalog, diff: changes.append(diff))
+        _feed(catalog, "Begin file list", "a.gcode", "b.gcode 1200", "End file list")
+        _feed(catalog, "Begin file list", "b.gcode 1200", "End file list")
+        assert catalog.names == ["b.gcode"]
+        assert changes == [
+            {"added": ["a.gcode", "b.gcode"], "removed": []},
+            {"added": [], "removed": ["a.gcode"]},
+        ]
+
+    asyncio.run(run())
+
+
+def test_filenames_outside_a_listing_are_ignored():
+    async def run():
+        catalog = FileCatalog()
+        _feed(catalog, "Begin file list", "a.gcode", "End file list")
+        # Nome ripetuto fuori dalla lista (es. eco di un job)
+        _feed(catalog, "phantom.gcode")
+        assert catalog.names == ["a.gcode"]
+        assert catalog.version == 1
+        catalog.cancel()
+
+    asyncio.run(run())
+
+
+def test_failed_file_list_write_leaves_no_temp_file(tmp_path, monkeypatch):
+    pytest.importorskip("homeassistant")
+    from custom_components.haghost5 import hub
+
+    def fail(*args, **kwargs):
+        raise ValueError("not serializable")
+
+    monkeypatch.setattr(hub.json, "dump", fail)
+    hub._write_file_list(str(tmp_path / "files_entry.json"), ["a.gcode"])
+    assert list(tmp_path.iterdir()) == []
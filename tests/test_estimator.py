@@ -0,0 +1,34 @@
+"""Correzione del tempo rimanente col tempo trascorso reale (M992)."""
+
+import pytest
+
+from custom_components.haghost5.estimator import remaining_time
+
+# Lavoro di un'ora, lineare sull'avanzamento
+ESTIMATE = {
+    "total": 3600.0,
+    "progress": [3600.0 * i / 100 for i in range(101)],
+    "layer_offsets": [],
+    "size": 1000,
+}
+
+
+def test_preheat_does_not_bias_the_correction():
+    # 5 minuti di riscaldamento, poi la stampa procede come stimato
+    preheat = 300
+    start = (1, preheat + 36)
+    remaining, _, correction = remaining_time(ESTIMATE, 10, preheat + 360, start)
+    assert correction == pytest.approx(1.0)
+    assert remaining == pytest.approx(3240)
+
+
+def test_slow_printer_is_corrected():
+    start = (1, 300 + 36)
+    # Stampante più lenta del 20% dal primo avanzamento in poi
+    _, _, correction = remaining_time(ESTIMATE, 11, 300 + 36 + 360 * 1.2, start)
+    assert correction == pytest.approx(1.2)
+
+
+def test_no_correction_without_start():
+    _, _, correction = remaining_time(ESTIMATE, 10, 660)
+    assert correction == 1.0
@@ -0,0 +1,42 @@
+"""Indice dei layer: offset al cambio di Z, totali dal parser vettoriale."""
+
+import pytest
+
+from custom_components.haghost5.gcode_index import build_index, layer_at_offset
+
+GCODE = b"""G28
+G1 Z0.2 F3000
+G1 X10 Y10
+G1 X20 Y10 E1
+G1 E0.2 ; retract
+G1 Z0.6 ; z-hop
+G1 X30 Y30
+G1 Z0.4
+G1 E1
+G1 X40 Y30 E2
+"""
+
+
+def test_layer_starts_at_z_change(tmp_path):
+    path = tmp_path / "part.gcode"
+    path.write_bytes(GCODE)
+    index = build_index(str(path))
+    offsets = index["layers"]["offset"]
+    assert index["layer_count"] == 2
+    assert index["layers"]["z"] == [0.2, 0.4]
+    assert GCODE[offsets[0]:].startswith(b"G1 Z0.2")
+    # Lo z-hop e il travel che aprono il layer 2 ne fanno parte
+    assert GCODE[offsets[1]:].startswith(b"G1 Z0.6")
+    assert layer_at_offset(index, GCODE.index(b"G1 X30 Y30")) == 1
+
+
+def test_totals(tmp_path):
+    path = tmp_path / "part.gcode"
+    path.write_bytes(GCODE)
+    index = build_index(str(path))
+    assert index["lines"] == 10
+    assert index["moves"] == 9
+    assert index["extrude_moves"] == 3
+    assert index["extrusion"] == pytest.approx(2.8)
+    assert index["bbox"] == [10.0, 10.0, 0.2, 40.0, 30.0, 0.4]
+    assert index["layers"]["moves"] == [4, 5]
@@ -0,0 +1,63 @@
+"""StatePublisher: intervallo minimo, reset forzati dei sensori."""
+
+import asyncio
+
+import pytest
+
+pytest.importorskip("homeassistant")
+
+from custom_components.haghost5.publisher import StatePublisher
+from custom_components.haghost5.router import parse_line
+from custom_components.haghost5.sensor import TBedSensor
+
+
+def _sensor(publisher):
+    sensor = TBedSensor("192.0.2.1")
+    sensor.set_publisher(publisher)
+    sensor.hass = object()
+    writes = []
+    sensor.async_write_ha_state = lambda: writes.append(sensor.native_value)
+    return sensor, writes
+
+
+def _feed(sensor, line):
+    sensor.process_record(parse_line(line), line)
+
+
+def test_update_within_min_interval_is_delayed():
+    async def run():
+        publisher = StatePublisher(min_interval=10)
+        sensor, writes = _sensor(publisher)
+        _feed(sensor, "T:20 /0 B:20 /0 @:0 B@:0")
+        _feed(sensor, "T:20 /0 B:60 /60 @:0 B@:0")
+        assert writes == [20.0]
+        assert publisher.pending == 1
+        publisher.stop()
+
+    asyncio.run(run())
+
+
+def test_reset_is_written_immediately():
+    async def run():
+        publisher = StatePublisher(min_interval=10)
+        sensor, writes = _sensor(publisher)
+        _feed(sensor, "T:20 /0 B:60 /60 @:0 B@:0")
+        sensor.reset()
+        assert writes == [60.0, 0]
+        assert publisher.pending == 0
+
+    asyncio.run(run())
+
+
+def test_reset_replaces_a_pending_write():
+    async def run():
+        publisher = StatePublisher(min_interval=10)
+        sensor, writes = _sensor(publisher)
+        _feed(sensor, "T:20 /0 B:20 /0 @:0 B@:0")
+        _feed(sensor, "T:20 /0 B:60 /60 @:0 B@:0")
+        sensor.reset()
+        assert writes == [20.0, 0]
+        assert publisher.pending == 0
+        assert publisher.coalesced == 0
+
+    asyncio.run(run())
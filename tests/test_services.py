@@ -0,0 +1,51 @@
+"""Servizio stream_gcode: un solo stream per stampante."""
+
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("homeassistant")
+
+from homeassistant.exceptions import HomeAssistantError
+
+from custom_components.haghost5 import services
+
+
+class _Services:
+    def __init__(self):
+        self.handlers = {}
+
+    def has_service(self, domain, service):
+        return service in self.handlers
+
+    def async_register(self, domain, service, handler, schema=None, supports_response=None):
+        self.handlers[service] = (handler, schema)
+
+
+async def _slow_missing_file(func, *args):
+    await asyncio.sleep(0.01)
+    return False
+
+
+def test_concurrent_streams_are_refused(monkeypatch):
+    async def run():
+        hub = SimpleNamespace(stream=None, connection=None, ip_address="192.0.2.1")
+        monkeypatch.setattr(services, "get_hub", lambda hass, printer: hub)
+        hass = SimpleNamespace(
+            services=_Services(),
+            config=SimpleNamespace(path=lambda *parts: "/".join(parts)),
+            async_add_executor_job=_slow_missing_file,
+        )
+        services.async_register_services(hass)
+        handler, schema = hass.services.handlers[services.SERVICE_STREAM_GCODE]
+        call = SimpleNamespace(data=schema({"filename": "part.gcode"}), return_response=False)
+
+        first, second = await asyncio.gather(handler(call), handler(call), return_exceptions=True)
+        assert "File not found" in str(first)
+        assert isinstance(second, HomeAssistantError)
+        assert "already running" in str(second)
+        # Lo slot si libera anche sul percorso di errore
+        assert hub.stream is None
+
+    asyncio.run(run())
@@ -0,0 +1,41 @@
+"""Parser vettoriale: stesso risultato del parser riga per riga."""
+
+import numpy as np
+import pytest
+
+from custom_components.haghost5.toolpath import _parse_moves_fast, _parse_moves_lines, parse_moves
+
+COLUMNS = ("x", "y", "z", "de", "f", "offset")
+
+CASES = {
+    "lowercase parameters": b"G1 x10 y20 z0.2 f3000\nG1 X11 y21 e1.5\n",
+    "explicit plus sign": b"G1 X+10 Y+2.5 Z+0.2\nG91\nG1 X+1 E+0.4\n",
+    "relative and resets": b"M83\nG1 X1 E0.5\nG92 E0\nM82\nG1 X2 E1 ; comment x9\nG90\nG0 X-3.25 F9000\n",
+    "odd tokens": b"G1 X1e1 Y2\nG1 Xnan Y3\nG1 X1_0 Y4\nG1 X- Y1.2.3 Z5\nG1 X7.Y8\nG1 X-+1 Y+-1\n",
+    "tabs and blank lines": b"G1\tX1\tY2\n\n;only comment\nG0 X3 ; x4\n",
+}
+
+
+def _assert_same(data):
+    lines = _parse_moves_lines(data.splitlines(keepends=True))
+    fast = _parse_moves_fast(data)
+    if fast is not None:
+        for column in COLUMNS:
+            np.testing.assert_array_equal(fast[column], lines[column], err_msg=column)
+    return fast, lines
+
+
+@pytest.mark.parametrize("name", sorted(CASES))
+def test_fast_parser_matches_line_parser(name, tmp_path):
+    _, lines = _assert_same(CASES[name])
+    path = tmp_path / "part.gcode"
+    path.write_bytes(CASES[name])
+    moves = parse_moves(str(path))
+    for column in COLUMNS:
+        np.testing.assert_array_equal(moves[column], lines[column], err_msg=column)
+
+
+@pytest.mark.parametrize("name", ["lowercase parameters", "explicit plus sign"])
+def test_common_variants_stay_on_the_fast_path(name):
+    fast, _ = _assert_same(CASES[name])
+    assert fast is not None
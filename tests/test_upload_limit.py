@@ -0,0 +1,34 @@
+"""max_concurrent_uploads: un solo limite per tutte le stampanti."""
+
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("homeassistant")
+
+from custom_components.haghost5.api import UPLOAD_LIMIT_KEY
+from custom_components.haghost5.const import DOMAIN
+
+
+def _hass(*limits):
+    entries = [
+        SimpleNamespace(entry_id=f"entry{i}", options={"max_concurrent_uploads": limit})
+        for i, limit in enumerate(limits)
+    ]
+    return SimpleNamespace(
+        data={},
+        config_entries=SimpleNamespace(async_entries=lambda domain: list(entries)),
+    )
+
+
+@pytest.mark.parametrize("limits", [(4, 1, 3), (3, 4, 1), (1, 3, 4)])
+def test_lowest_limit_applies_whatever_the_order(integration, limits):
+    hass = _hass(*limits)
+    integration._apply_upload_limit(hass)
+    assert hass.data[DOMAIN][UPLOAD_LIMIT_KEY] == 1
+
+
+def test_unloaded_entry_no_longer_counts(integration):
+    hass = _hass(4, 1)
+    integration._apply_upload_limit(hass, exclude="entry1")
+    assert hass.data[DOMAIN][UPLOAD_LIMIT_KEY] == 4
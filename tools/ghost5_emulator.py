@@ -0,0 +1,393 @@
+"""
+Emulatore del firmware della Flying Bear Ghost5 per test senza stampante.
+
+Ogni istanza espone, come la scheda originale:
+  - HTTP (porta 80): POST /upload?X-Filename=<nome> riceve il file, risponde
+    {"err":0}, lo aggiunge alla lista e avvia la stampa;
+  - WebSocket (porta 8081): risponde a M20, M27, M992, M994, M997, M991
+    (più M24/M25/M26 per riprendere, mettere in pausa e fermare la stampa,
+    e "ok" a ogni altro comando) e invia una riga temperature ogni
+    --temp-interval secondi.
+
+La stampa è simulata: riscaldamento verso 200/60 °C, avanzamento lineare in
+--print-seconds, poi di nuovo IDLE. --speed accelera il tempo simulato.
+
+Fault injection, per risposta o per connessione:
+  --drop-rate      probabilità di non rispondere a un comando
+  --slow-rate      probabilità di rispondere dopo --slow-delay secondi
+  --partial-rate   probabilità di spezzare la risposta in due frame
+                   (guasto atteso: l'integrazione tratta ogni frame come una
+                   riga completa e non li ricompone; i pezzi finiscono tra gli
+                   "unmatched" della diagnostica o, se sembrano una risposta,
+                   ad es. "M27 5" da "M27 50", danno un valore errato fino
+                   all'interrogazione successiva)
+  --disconnect-every  chiude il WebSocket ogni N secondi
+  --upload-error-rate probabilità che /upload risponda {"err":1}
+
+Più istanze nello stesso processo, tutte sulle stesse porte di indirizzi
+consecutivi: 127.0.0.1, 127.0.0.2, ... (gli IP da configurare in Home
+Assistant; su Linux tutto 127/8 è loopback). L'integrazione usa sempre le
+porte 80 e 8081, che richiedono root; --http-port e --ws-port servono solo
+ai benchmark che parlano direttamente con l'emulatore.
+
+Richiede solo aiohttp.
+
+Uso:
+    python tools/ghost5_emulator.py [--count 1] [--host 127.0.0.1]
+        [--http-port 80] [--ws-port 8081] [--print-seconds 600] [--speed 1]
+        [--files 20] [--drop-rate 0] [--slow-rate 0] [--partial-rate 0] ...
+"""
+
+import argparse
+import asyncio
+import ipaddress
+import json
+import logging
+import os
+import random
+import time
+
+from aiohttp import WSMsgType, web
+
+_LOGGER = logging.getLogger("ghost5_emulator")
+
+STATE_IDLE = "IDLE"
+STATE_PRINTING = "PRINTING"
+STATE_PAUSE = "PAUSE"
+
+NOZZLE_TARGET = 200.0
+BED_TARGET = 60.0
+AMBIENT = 22.0
+# Costanti di tempo (s) del riscaldamento, modello del primo ordine
+NOZZLE_TAU = 20.0
+BED_TAU = 60.0
+HEATED_MARGIN = 2.0  # °C dal target per considerare finito il riscaldamento
+
+UPLOAD_CHUNK_SIZE = 64 * 1024
+
+
+class Faults:
+    """Probabilità e ritardi dei guasti simulati."""
+
+    def __init__(self, args, seed):
+        self.drop_rate = args.drop_rate
+        self.slow_rate = args.slow_rate
+        self.slow_delay = args.slow_delay
+        self.partial_rate = args.partial_rate
+        self.disconnect_every = args.disconnect_every
+        self.upload_error_rate = args.upload_error_rate
+        self.random = random.Random(seed)
+
+    def chance(self, rate):
+        return rate > 0 and self.random.random() < rate
+
+
+class FakeGhost5:
+    """
+    Una stampante finta: stato di stampa, temperature, lista file e i due
+    server (HTTP e WebSocket) con i guasti configurati.
+    """
+
+    def __init__(self, name, host, http_port, ws_port, args, seed):
+        self.name = name
+        self.host = host
+        self.http_port = http_port
+        self.ws_port = ws_port
+        self._print_seconds = args.print_seconds
+        self._speed = args.speed
+        self._temp_interval = args.temp_interval
+        self._store_dir = os.path.join(args.store, name) if args.store else None
+        self.faults = Faults(args, seed)
+
+        self.files = {f"part_{i:03d}.gcode": 100_000 + 7919 * i for i in range(args.files)}
+        self.state = STATE_IDLE
+        self.current_file = None
+        self.progress = 0.0         # 0-100
+        self.elapsed = 0.0          # secondi simulati di stampa
+        self.nozzle = self.bed = AMBIENT
+        self.nozzle_target = self.bed_target = 0.0
+        self._last_step = time.monotonic()
+
+        # Contatori per il report finale
+        self.commands = 0
+        self.replies = 0
+        self.dropped = 0
+        self.uploads = 0
+        self.upload_bytes = 0
+        self.connections = 0
+
+        self._runners = []
+        self._sockets = set()
+
+    # --- simulazione ---
+
+    def step(self):
+        """Avanza la simulazione fino ad adesso."""
+        now = time.monotonic()
+        dt = (now - self._last_step) * self._speed
+        self._last_step = now
+        if dt <= 0:
+            return
+        # Senza target le resistenze sono spente e si raffredda verso l'ambiente
+        self.nozzle += ((self.nozzle_target or AMBIENT) - self.nozzle) * min(1.0, dt / NOZZLE_TAU)
+        self.bed += ((self.bed_target or AMBIENT) - self.bed) * min(1.0, dt / BED_TAU)
+        if self.state != STATE_PRINTING:
+            return
+        self.elapsed += dt
+        heated = (
+            self.nozzle >= self.nozzle_target - HEATED_MARGIN
+            and self.bed >= self.bed_target - HEATED_MARGIN
+        )
+        if heated:
+            self.progress = min(100.0, self.progress + 100.0 * dt / self._print_seconds)
+        if self.progress >= 100.0:
+            _LOGGER.info("%s: finished %s", self.name, self.current_file)
+            self._stop()
+
+    def start_print(self, filename):
+        self.current_file = filename
+        self.state = STATE_PRINTING
+        self.progress = 0.0
+        self.elapsed = 0.0
+        self.nozzle_target = NOZZLE_TARGET
+        self.bed_target = BED_TARGET
+        _LOGGER.info("%s: printing %s", self.name, filename)
+
+    def _stop(self):
+        self.state = STATE_IDLE
+        self.nozzle_target = self.bed_target = 0.0
+
+    def temperature_line(self):
+        power = 100 if self.nozzle < self.nozzle_target - HEATED_MARGIN else 30 if self.nozzle_target else 0
+        bed_power = 100 if self.bed < self.bed_target - HEATED_MARGIN else 20 if self.bed_target else 0
+        return (
+            f"T:{self.nozzle:.1f} /{self.nozzle_target:.0f} B:{self.bed:.1f} /{self.bed_target:.0f} "
+            f"T0:{self.nozzle:.1f} /{self.nozzle_target:.0f} T1:{AMBIENT:.1f} /0 "
+            f"@:{power} B@:{bed_power}"
+        )
+
+    def reply(self, command):
+        """Righe di risposta a un comando (una per frame)."""
+        self.step()
+        head = command.split(None, 1)[0].upper() if command else ""
+        if head == "M20":
+            return (
+                ["Begin file list"]
+                + [f"{name} {size}" for name, size in sorted(self.files.items())]
+                + ["End file list"]
+            )
+        if head == "M27":
+            return [f"M27 {int(self.progress)}"]
+        if head == "M992":
+            seconds = int(self.elapsed)
+            return [f"M992 {seconds // 3600:02d}:{seconds % 3600 // 60:02d}:{seconds % 60:02d}"]
+        if head == "M994":
+            name = self.current_file or ""
+            return [f"M994 1:/{name};{self.files.get(name, 0)}"]
+        if head == "M997":
+            return [f"M997 {self.state}"]
+        if head == "M991":
+            return [self.temperature_line()]
+        if head == "M25" and self.state == STATE_PRINTING:
+            self.state = STATE_PAUSE
+        elif head == "M24" and self.state == STATE_PAUSE:
+            self.state = STATE_PRINTING
+        elif head == "M26" and self.state != STATE_IDLE:
+            self._stop()
+        return ["ok"]
+
+    # --- WebSocket ---
+
+    async def _send(self, ws, line):
+        faults = self.faults
+        if faults.chance(faults.drop_rate):
+            self.dropped += 1
+            return
+        if faults.chance(faults.slow_rate):
+            await asyncio.sleep(faults.slow_delay)
+        if len(line) > 1 and faults.chance(faults.partial_rate):
+            cut = faults.random.randrange(1, len(line))
+            await ws.send_str(line[:cut])
+            await ws.send_str(line[cut:])
+        else:
+            await ws.send_str(line)
+        self.replies += 1
+
+    async def _handle_ws(self, request):
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        self.connections += 1
+        self._sockets.add(ws)
+        tasks = [asyncio.create_task(self._stream_temperatures(ws))]
+        if self.faults.disconnect_every:
+            tasks.append(asyncio.create_task(self._disconnect_later(ws)))
+        try:
+            async for msg in ws:
+                if msg.type != WSMsgType.TEXT:
+                    break
+                for command in msg.data.split("\n"):
+                    command = command.strip()
+                    if not command:
+                        continue
+                    self.commands += 1
+                    for line in self.reply(command):
+                        await self._send(ws, line)
+        except (ConnectionResetError, asyncio.CancelledError):
+            pass
+        finally:
+            for task in tasks:
+                task.cancel()
+            self._sockets.discard(ws)
+        return ws
+
+    async def _stream_temperatures(self, ws):
+        while not ws.closed:
+            await asyncio.sleep(self._temp_interval)
+            self.step()
+            try:
+                await ws.send_str(self.temperature_line())
+            except ConnectionResetError:
+                return
+
+    async def _disconnect_later(self, ws):
+        await asyncio.sleep(self.faults.disconnect_every)
+        _LOGGER.info("%s: dropping WebSocket connection", self.name)
+        await ws.close()
+
+    # --- HTTP ---
+
+    async def _handle_upload(self, request):
+        filename = os.path.basename(request.query.get("X-Filename", ""))
+        if not filename:
+            return web.json_response({"err": 1, "msg": "missing X-Filename"})
+        size = 0
+        out = None
+        # Le scritture su disco vanno nell'executor per non fermare le altre stampanti
+        loop = asyncio.get_running_loop()
+        if self._store_dir:
+            out = await loop.run_in_executor(None, self._open_store_file, filename)
+        try:
+            async for chunk in request.content.iter_chunked(UPLOAD_CHUNK_SIZE):
+                size += len(chunk)
+                if out is not None:
+                    await loop.run_in_executor(None, out.write, chunk)
+        finally:
+            if out is not None:
+                await loop.run_in_executor(None, out.close)
+        self.uploads += 1
+        self.upload_bytes += size
+        if self.faults.chance(self.faults.upload_error_rate):
+            _LOGGER.info("%s: failing upload of %s", self.name, filename)
+            return web.json_response({"err": 1})
+        self.files[filename] = size
+        self.start_print(filename)
+        return web.json_response({"err": 0})
+
+    def _open_store_file(self, filename):
+        os.makedirs(self._store_dir, exist_ok=True)
+        return open(os.path.join(self._store_dir, filename), "wb")
+
+    async def _handle_index(self, request):
+        return web.Response(text=f"<html><body>Ghost5 emulator {self.name}: {self.state}</body></html>",
+                            content_type="text/html")
+
+    # --- avvio e arresto ---
+
+    async def start(self):
+        http = web.Application(client_max_size=0)
+        http.router.add_post("/upload", self._handle_upload)
+        http.router.add_get("/", self._handle_index)
+        ws = web.Application()
+        ws.router.add_get("/", self._handle_ws)
+        for app, port in ((http, self.http_port), (ws, self.ws_port)):
+            runner = web.AppRunner(app, handle_signals=False)
+            await runner.setup()
+            await web.TCPSite(runner, self.host, port).start()
+            self._runners.append(runner)
+
+    async def stop(self):
+        for ws in list(self._sockets):
+            await ws.close()
+        for runner in self._runners:
+            await runner.cleanup()
+
+    def stats(self):
+        return {
+            "name": self.name,
+            "host": self.host,
+            "http_port": self.http_port,
+            "ws_port": self.ws_port,
+            "state": self.state,
+            "connections": self.connections,
+            "commands": self.commands,
+            "replies": self.replies,
+            "dropped": self.dropped,
+            "uploads": self.uploads,
+            "upload_bytes": self.upload_bytes,
+        }
+
+
+def instance_addresses(args):
+    """(host, porta HTTP, porta WebSocket) di ogni istanza."""
+    base = ipaddress.ip_address(args.host)
+    return [(str(base + i), args.http_port, args.ws_port) for i in range(args.count)]
+
+
+async def run(args):
+    printers = [
+        FakeGhost5(f"ghost5-{i + 1}", host, http_port, ws_port, args, seed=args.seed + i)
+        for i, (host, http_port, ws_port) in enumerate(instance_addresses(args))
+    ]
+    for printer in printers:
+        await printer.start()
+        print(f"{printer.name}: http://{printer.host}:{printer.http_port}/  ws://{printer.host}:{printer.ws_port}/")
+    print(f"{len(printers)} emulated printers running, Ctrl+C to stop.")
+
+    # Avvio automatico delle stampe, per avere traffico senza upload
+    if args.autostart:
+        for printer in printers:
+            printer.start_print(next(iter(printer.files), "demo.gcode"))
+
+    try:
+        await asyncio.Event().wait()
+    finally:
+        for printer in printers:
+            await printer.stop()
+        if args.report:
+            with open(args.report, "w") as f:
+                json.dump([p.stats() for p in printers], f, indent=2)
+            print(f"Report written to {args.report}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--count", type=int, default=1, help="number of emulated printers")
+    parser.add_argument("--host", default="127.0.0.1", help="address of the first printer")
+    parser.add_argument("--http-port", type=int, default=80)
+    parser.add_argument("--ws-port", type=int, default=8081)
+    parser.add_argument("--files", type=int, default=20, help="files already on the printer")
+    parser.add_argument("--print-seconds", type=float, default=600.0, help="duration of a print once heated")
+    parser.add_argument("--speed", type=float, default=1.0, help="simulated seconds per real second")
+    parser.add_argument("--temp-interval", type=float, default=1.0, help="seconds between temperature lines")
+    parser.add_argument("--autostart", action="store_true", help="start printing immediately")
+    parser.add_argument("--store", help="save uploaded files under this directory")
+    parser.add_argument("--drop-rate", type=float, default=0.0)
+    parser.add_argument("--slow-rate", type=float, default=0.0)
+    parser.add_argument("--slow-delay", type=float, default=3.0)
+    parser.add_argument("--partial-rate", type=float, default=0.0)
+    parser.add_argument("--disconnect-every", type=float, default=0.0)
+    parser.add_argument("--upload-error-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=0, help="seed for the fault injection")
+    parser.add_argument("--report", help="write per-printer counters as JSON on exit")
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING, format="%(asctime)s %(message)s")
+    try:
+        asyncio.run(run(args))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()